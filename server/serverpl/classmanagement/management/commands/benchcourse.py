@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  benchcourse.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import time, json
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import RequestFactory
+
+from loader.models import PL, PLTP, Blob, BLOB_CACHE
+from loader.utils import QueryCounter, blob_references
+from playexo.models import Activity
+from classmanagement.models import Course
+from classmanagement.views import course_view
+
+
+
+def size(value):
+    return len(value if isinstance(value, str) else json.dumps(value))
+
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the listing of the PL of a course (reading the whole PL or only the summary "
+            + "columns) and the course page. Data are created in a transaction which is rolled back.")
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--activities', type=int, default=30, help="Number of activities of the course")
+        parser.add_argument('--pl', type=int, default=10, help="Number of PL per activity")
+        parser.add_argument('--repeat', type=int, default=5, help="Number of time each measure is done")
+    
+    
+    def populate(self, activities, pl_per_activity):
+        teacher = User.objects.create_user(username='__benchcourse__', password='__benchcourse__')
+        course = Course.objects.create(id='__benchcourse__', name='Benchmark', label='bench')
+        course.teacher.add(teacher)
+        next_id = (Activity.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        for i in range(activities):
+            pltp = PLTP.objects.create(sha1='__benchcourse__' + str(i), name='tp' + str(i), rel_path='tp.pltp',
+                                       json={'title': 'Activity ' + str(i), '__pl': [], 'introduction': ''})
+            for j in range(pl_per_activity):
+                pl = PL(name='pl' + str(j), rel_path='pl' + str(j) + '.pl', json={
+                    'title': 'Exercise ' + str(i) + '.' + str(j),
+                    'text': 'Statement of the exercise ' + str(i) + '.' + str(j) + '\n' * 500,
+                    'form': '<textarea name="answer"></textarea>' * 20,
+                    'grader': "# grader of exercise " + str(j) + "\n" + "print('ok')\n" * 300,
+                    '__file': {'utils.py': "def f():\n    pass\n" * 200},
+                })
+                pl.save()
+                pltp.pl.add(pl)
+            activity = Activity.objects.create(id=next_id + i, name='__benchcourse__' + str(i), pltp=pltp)
+            course.activity.add(activity)
+        return course, teacher
+    
+    
+    def measure(self, function, repeat):
+        """ Return (seconds, queries, bytes) of the fastest of repeat calls to function, which
+            returns the number of bytes it fetched."""
+        
+        best = None
+        for i in range(repeat):
+            BLOB_CACHE.clear()
+            with QueryCounter() as queries:
+                start = time.perf_counter()
+                fetched = function()
+                elapsed = time.perf_counter() - start
+            if best is None or elapsed < best[0]:
+                best = (elapsed, queries.count, fetched)
+        return best
+    
+    
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            course, teacher = self.populate(options['activities'], options['pl'])
+            activities = list(course.activity.all().select_related('pltp').order_by('id'))
+            
+            def full():
+                fetched = 0
+                for activity in activities:
+                    for pl in activity.pltp.pl.all():
+                        pl.json['title']
+                        # Every column of the row, and the blobs read from the database by pl.json
+                        fetched += size(pl.skeleton) + size(pl.name) + size(pl.rel_path) + size(pl.author)
+                        fetched += size(pl.title) + size(pl.type)
+                        fetched += sum(size(blob) for blob in Blob.fetch(blob_references(pl.skeleton)).values())
+                return fetched
+            
+            def summary():
+                fetched = 0
+                for activity in activities:
+                    for pl in activity.pltp.pl.only('id', 'title'):
+                        fetched += size(str(pl.id)) + size(pl.title)
+                return fetched
+            
+            def page():
+                request = RequestFactory().get('/courses/course/' + course.id + '/')
+                request.user = teacher
+                return len(course_view(request, course.id).content)
+            
+            results = [
+                ("pl.all() + pl.json['title']", self.measure(full, options['repeat'])),
+                ("pl.only('id', 'title')", self.measure(summary, options['repeat'])),
+                ("course page", self.measure(page, options['repeat'])),
+            ]
+            
+            self.stdout.write(str(options['activities']) + " activities of " + str(options['pl']) + " PL")
+            for name, (elapsed, queries, fetched) in results:
+                self.stdout.write("%-30s %8.2f ms %6d queries %12d bytes" % (name, elapsed * 1000, queries, fetched))
+            self.stdout.write("(bytes of the course page are the size of the rendered HTML)")
+            
+            transaction.set_rollback(True)
@@ -20,9 +20,10 @@ from django.urls import reverse
 from classmanagement.models import Course
 from user_profile.models import Profile
 
-from playexo.models import Answer, Activity
+from playexo.models import Activity
 from playexo.views import activity_receiver
 from playexo.enums import State
+from playexo.progress import CourseProgress
 
 
 logger = logging.getLogger(__name__)
@@ -33,7 +34,7 @@ logger = logging.getLogger(__name__)
 def index(request):
     course = list()
     for item in request.user.course_set.all():
-        summary = Answer.user_course_summary(item, request.user)
+        summary = CourseProgress(item, users=[request.user]).course_summary(request.user)
         completion = [{'name': "", 'count': summary[key][1], 'class': key.template} for key in summary]
         
         course.append({
@@ -71,14 +72,15 @@ def course_view(request, id):
             except:
                 raise Http404("L'activité d'ID '"+str(request.GET.get("id", None))+"' introuvable.")
     
+    progress = CourseProgress(course, users=[request.user])
     activity = list()
-    for item in course.activity.all().order_by("id"):
+    for item in progress.activities:
         pl = [
             {
-                'name': elem.json['title'],
-                'state': Answer.pl_state(elem, request.user)
+                'name': title,
+                'state': state
             }
-            for elem in item.pltp.pl.all()
+            for _, title, state in progress.activity_states(request.user, item)
         ]
         
         
@@ -114,12 +116,12 @@ def course_summary(request, id):
         logger.warning("User '"+request.user.username+"' denied to access summary of course'"+course.name+"'.")
         raise PermissionDenied("Vous n'êtes pas professeur de cette classe.")
     
-    activities = course.activity.all().order_by("id")
+    progress = CourseProgress(course)
+    activities = progress.activities
     student = list()
-    for user in course.student.all():
+    for user, summaries in progress.matrix():
         tp = list()
-        for activity in activities:
-            summary = Answer.pltp_summary(activity.pltp, user)
+        for activity, summary in zip(activities, summaries):
             tp.append({
                 'state': [{
                         'percent':summary[i][0],
@@ -162,14 +164,16 @@ def activity_summary(request, id, name):
         logger.warning("User '"+request.user.username+"' denied to access summary of course'"+course.name+"'.")
         raise PermissionDenied("Vous n'êtes pas professeur de cette classe.")
     
-    activity = Activity.objects.get(name=name)
+    activity = Activity.objects.select_related('pltp').get(name=name)
+    progress = CourseProgress(course, activities=[activity])
+    pl_list = progress.pl[activity.pltp_id]
     student = list()
-    for user in course.student.all():
+    for user in progress.users:
         tp = list()
-        for pl in activity.pltp.pl.all():
+        for _, title, state in progress.activity_states(user, activity):
             tp.append({
-                'name': pl.json['title'],
-                'state': Answer.pl_state(pl, user)
+                'name': title,
+                'state': state
             })
         student.append({
             'lastname': user.last_name,
@@ -186,7 +190,7 @@ def activity_summary(request, id, name):
         'course_name': course.name,
         'activity_name': activity.name,
         'student': student,
-        'range_tp': range(len(activity.pltp.pl.all())),
+        'range_tp': range(len(pl_list)),
         'course_id': id,
     })
 
@@ -202,18 +206,17 @@ def student_summary(request, course_id, student_id):
     if request.user not in course.teacher.all():
         logger.warning("User '"+request.user.username+"' denied to access summary of course'"+course.name+"'.")
         raise PermissionDenied("Vous n'êtes pas professeur de cette classe.")
-        
+    
     student = User.objects.get(id=student_id)
-    activities = course.activity.all().order_by("id")
+    progress = CourseProgress(course, users=[student])
     
     tp = list()
-    for activity in activities:
+    for activity in progress.activities:
         question = list()
-        for pl in activity.pltp.pl.all():
-            state = Answer.pl_state(pl, student)
+        for _, title, state in progress.activity_states(student, activity):
             question.append({
                 'state': state,
-                'name':  pl.json['title'],
+                'name':  title,
             })
         len_tp = len(question) if len(question) else 1
         tp.append({
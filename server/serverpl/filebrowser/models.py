@@ -211,6 +211,31 @@ class Directory(models.Model):
         return True, out
     
     
+    def head(self):
+        """Return the sha1 of the commit pointed by HEAD, None if it couldn't be retrieved."""
+        if not self.is_repository():
+            return None
+        
+        p = subprocess.Popen('git rev-parse HEAD', stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True,
+                             cwd=self.root)
+        out, err = p.communicate()
+        return out.decode("utf-8").strip() if not p.returncode else None
+    
+    
+    def changed_files(self, old, new):
+        """Return the list of the paths (relative to self.root) of the files added, modified or
+        deleted between the commits old and new, None if the diff couldn't be computed."""
+        if not self.is_repository():
+            return None
+        
+        p = subprocess.Popen('git diff --name-only --no-renames --relative '+old+' '+new, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, shell=True, cwd=self.root)
+        out, err = p.communicate()
+        if p.returncode:
+            return None
+        return [line for line in out.decode("utf-8").split('\n') if line]
+    
+    
     def push(self, username=None, password=None):
         """Perform a git push over the directory using username and password if given.
         
@@ -49,7 +49,7 @@ from filebrowser.form import RightForm
 from filebrowser.utils import redirect_fb
 from filebrowser.filter import is_pl
 
-from loader.loader import load_file
+from loader.loader import load_file, reload_changed
 
 from playexo.exercise import PLInstance
 
@@ -240,14 +240,22 @@ def pull_option(request, filebrowser, target):
     
     username = request.POST.get('username', None)
     password = request.POST.get('password', None)
-    if not filebrowser.directory:
-        d = Directory.objects.get(name=target)
-        done, msg = d.pull(username=username, password=password)
-    else:
-        done, msg = filebrowser.directory.pull(username=username, password=password)
+    d = filebrowser.directory if filebrowser.directory else Directory.objects.get(name=target)
+    old = d.head()
+    done, msg = d.pull(username=username, password=password)
     
     if done:
         messages.success(request, "Pull done.<br>" + htmlprint.code(msg))
+        new = d.head()
+        changed = d.changed_files(old, new) if old and new and old != new else None
+        if changed:
+            pl_list, pltp_list, errors = reload_changed(d, changed)
+            if pl_list or pltp_list:
+                messages.info(request, "Reloaded " + str(len(pltp_list)) + " PLTP and " + str(len(pl_list))
+                                       + " PL modified by the pull.")
+            for row, error in errors:
+                error = error.replace(settings.FILEBROWSER_ROOT+"/", "")
+                messages.error(request, "Couldn't reload '" + row.name + "':<br>" + htmlprint.code(error))
     else:
         messages.error(request, "Couldn't pull:<br>" + htmlprint.code(msg))
     return redirect_fb(request.POST.get('relative_h', '.'))
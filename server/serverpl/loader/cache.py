@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  cache.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import os, json, hashlib, logging
+
+from os.path import join, isfile
+
+from django.conf import settings
+
+from loader.utils import file_sha1
+
+from filebrowser.models import Directory
+
+
+logger = logging.getLogger(__name__)
+
+
+
+class ParseCache:
+    """ Persistent cache of the result of loader.parser.parse_file().
+        
+        The cache is stored on disk in settings.PARSE_CACHE_ROOT (disabled if it is None):
+            - manifests/<key>.json, where <key> is the sha1 of 'directory:path', contains the
+              files the parsed file was built from (the file itself, its 'extends'/'template',
+              its '=@' and '@' files, recursively) with their sha1, size and modification time.
+            - entries/<closure>.json contains the (dic, warnings) tuple, <closure> being the sha1
+              of <key> and of the sha1 of every file of the manifest.
+        
+        Looking a file up thus only costs a stat() per dependency, and an hash of the dependencies
+        which were modified since the entry was written. 'hits' and 'misses' are counted
+        for the whole process."""
+    
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+    
+    
+    @property
+    def root(self):
+        return getattr(settings, 'PARSE_CACHE_ROOT', None)
+    
+    
+    def enabled(self):
+        return bool(self.root)
+    
+    
+    def _key(self, directory, path):
+        return hashlib.sha1((directory.name + ':' + path).encode('utf-8')).hexdigest()
+    
+    
+    def _closure(self, key, dependencies):
+        sha1 = hashlib.sha1(key.encode('utf-8'))
+        for dep in dependencies:
+            sha1.update((dep['file'] + ':' + dep['sha1']).encode('utf-8'))
+        return sha1.hexdigest()
+    
+    
+    def _read(self, path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    
+    def _write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(content, f)
+        os.replace(tmp, path)
+    
+    
+    def _current_sha1(self, dep):
+        """ Return the sha1 of the dependency dep, only hashing the file if its size or
+            modification time changed. Return None if the file does not exist anymore."""
+        
+        try:
+            stat = os.stat(dep['file'])
+        except OSError:
+            return None
+        if stat.st_mtime == dep['mtime'] and stat.st_size == dep['size']:
+            return dep['sha1']
+        return file_sha1(dep['file'])
+    
+    
+    def get(self, directory, path):
+        """ Return the tuple (dic, warnings) cached for path of directory if none of the files
+            it was built from changed, None otherwise."""
+        
+        if not self.enabled():
+            return None
+        
+        key = self._key(directory, path)
+        manifest = self._read(join(self.root, 'manifests', key + '.json'))
+        entry = None
+        if manifest:
+            dependencies = list()
+            for dep in manifest['dependencies']:
+                sha1 = self._current_sha1(dep)
+                if sha1 is None:
+                    break
+                dependencies.append({'file': dep['file'], 'sha1': sha1})
+            else:
+                entry = self._read(join(self.root, 'entries', self._closure(key, dependencies) + '.json'))
+        
+        if entry is None:
+            self.misses += 1
+            logger.info("Parse cache miss for '" + directory.name + ":" + path + "' ("
+                        + str(self.hits) + " hits / " + str(self.misses) + " misses)")
+            return None
+        
+        self.hits += 1
+        logger.info("Parse cache hit for '" + directory.name + ":" + path + "' ("
+                    + str(self.hits) + " hits / " + str(self.misses) + " misses)")
+        return entry['dic'], entry['warnings']
+    
+    
+    def set(self, directory, path, dic, warnings):
+        """ Cache the tuple (dic, warnings) resulting of the parsing of path of directory.
+            
+            The files it was built from are read from dic['__dependencies']."""
+        
+        if not self.enabled() or '__dependencies' not in dic:
+            return
+        
+        roots = {directory.name: directory.root}
+        names = {dep['directory_name'] for dep in dic['__dependencies']} - set(roots)
+        if names:
+            roots.update(Directory.objects.filter(name__in=names).values_list('name', 'root'))
+        
+        dependencies = list()
+        seen = set()
+        for dep in dic['__dependencies']:
+            if dep['directory_name'] not in roots:
+                return
+            filename = os.path.abspath(join(roots[dep['directory_name']], dep['path']))
+            if filename in seen:
+                continue
+            seen.add(filename)
+            try:
+                stat = os.stat(filename)
+                if file_sha1(filename) != dep['sha1']: # Modified while being parsed
+                    return
+            except OSError:
+                return
+            dependencies.append({
+                'file': filename,
+                'sha1': dep['sha1'],
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+            })
+        
+        key = self._key(directory, path)
+        manifest_path = join(self.root, 'manifests', key + '.json')
+        closure = self._closure(key, dependencies)
+        
+        try:
+            old = self._read(manifest_path)
+            self._write(join(self.root, 'entries', closure + '.json'), {'dic': dic, 'warnings': warnings})
+            self._write(manifest_path, {'entry': closure, 'dependencies': dependencies})
+            if old and old.get('entry') not in (None, closure):
+                old_entry = join(self.root, 'entries', old['entry'] + '.json')
+                if isfile(old_entry):
+                    os.remove(old_entry)
+        except OSError:
+            logger.warning("Could not write '" + directory.name + ":" + path + "' in the parse cache ("
+                           + self.root + ")")
+    
+    
+    def clear(self):
+        """ Remove every entry of the cache."""
+        
+        if not self.enabled():
+            return
+        for sub in ['manifests', 'entries']:
+            folder = join(self.root, sub)
+            if os.path.isdir(folder):
+                for f in os.listdir(folder):
+                    os.remove(join(folder, f))
+
+
+
+PARSE_CACHE = ParseCache()
@@ -11,10 +11,12 @@ import logging, hashlib, traceback, htmlprint
 from os.path import splitext, basename
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction, connection
 
-from loader.utils import get_location
+from loader.utils import get_location, QueryCounter
 from loader.parser import parse_file, get_type
-from loader.models import PL, PLTP
+from loader.models import PL, PLTP, Dependency
+from loader.exceptions import DirectoryNotFound
 
 from filebrowser.models import Directory
 
@@ -51,9 +53,21 @@ def load_file(directory, rel_path, force=False):
 
 
 
+def pltp_sha1(directory, rel_path):
+    """ Return the sha1 identifying the PLTP rel_path of directory in the database."""
+    
+    sha1 = hashlib.sha1()
+    sha1.update((directory.name+':'+rel_path).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+
 def load_PLTP(directory, rel_path, force=False):
     """ Load the given file as a PLTP. Save it and its PL in the database.
         
+        The whole PLTP is saved in a single transaction, its PL and their relation with the
+        PLTP being inserted with bulk_create(). The number of queries used is logged.
+        
         Return:
             - (PLTP, []) if the PLTP was loaded successfully
             - (PLTP, warning_list) if the PLTP was loaded with warnings
@@ -61,50 +75,71 @@ def load_PLTP(directory, rel_path, force=False):
     """
     
     name = splitext(basename(rel_path))[0]
+    sha1 = pltp_sha1(directory, rel_path)
     
-    sha1 = hashlib.sha1()
-    sha1.update((directory.name+':'+rel_path).encode('utf-8'))
-    sha1 = sha1.hexdigest()
-    
-    try:
-        existing = PLTP.objects.get(sha1=sha1)
-        if not force:
-            return None, None
-        existing.delete() # Delete the current PLTP entry if force is False
-    except: # If the PLTP does not exist, keep going
-        pass
-    
-    dic, warnings = parse_file(directory, rel_path)
-    
-    pl_list = list()
-    for item in dic['__pl']:
+    with QueryCounter() as queries, transaction.atomic():
         try:
-            pl_directory = Directory.objects.get(name=item['directory_name'])
-        except ObjectDoesNotExist:
-            raise DirectoryNotFound(dic['__rel_path'], item['line'], item['path'], item['lineno'])
-        pl_directory, pl_path = get_location(directory, item['path'])
-        pl, pl_warnings = load_PL(pl_directory, pl_path)
-        warnings += pl_warnings
-        pl_list.append(pl)
+            existing = PLTP.objects.get(sha1=sha1)
+            if not force:
+                return None, None
+            existing.delete() # Delete the current PLTP entry if force is True
+        except ObjectDoesNotExist: # If the PLTP does not exist, keep going
+            pass
+        
+        dic, warnings = parse_file(directory, rel_path)
+        
+        directories = {
+            d.name: d for d in Directory.objects.filter(name__in={item['directory_name'] for item in dic['__pl']})
+        }
+        pl_list = list()
+        for item in dic['__pl']:
+            if item['directory_name'] not in directories:
+                raise DirectoryNotFound(dic['__rel_path'], item['line'], item['directory_name'], item['lineno'])
+            pl, pl_warnings = load_PL(directories[item['directory_name']], item['path'])
+            warnings += pl_warnings
+            pl_list.append(pl)
+        
+        pltp = save_PLTP(PLTP(name=name, sha1=sha1, json=dic, directory=directory, rel_path=rel_path), pl_list)
     
+    logger.info("PLTP '"+sha1+" ("+name+")' has been loaded with "+str(len(pl_list))+" PL in "+str(queries.count)+" queries")
+    return pltp, [htmlprint.code(warning) for warning in warnings]
+
+
+
+def save_PLTP(pltp, pl_list):
+    """ Save pltp and every PL of pl_list in the database, adding the PL to pltp.
+        
+        PL are inserted with a single bulk_create() if the database backend can return
+        the ids of the inserted rows (PostgreSQL), one by one otherwise. The relation
+        between the PLTP and its PL, and their loader.models.Dependency, are inserted with
+        a single bulk_create() each.
+        
+        Should be called inside a transaction. Return pltp."""
+    
+    if connection.features.can_return_ids_from_bulk_insert:
+        PL.prepare(pl_list)
+        PL.objects.bulk_create(pl_list)
+    else:
+        for pl in pl_list:
+            pl.save()
     for pl in pl_list:
-        pl.save()
         logger.info("PL '"+str(pl.id)+" ("+pl.name+")' has been added to the database")
     
-    pltp = PLTP(name=name, sha1=sha1, json=dic, directory=directory, rel_path=rel_path)
     pltp.save()
-    logger.info("PLTP '"+sha1+" ("+name+")' has been added to the database")
+    logger.info("PLTP '"+pltp.sha1+" ("+pltp.name+")' has been added to the database")
     
-    for pl in pl_list:
-        pltp.pl.add(pl)
+    through = PLTP.pl.through
+    through.objects.bulk_create([through(pltp_id=pltp.sha1, pl_id=pl.id) for pl in pl_list])
     
-    return pltp, [htmlprint.code(warning) for warning in warnings]
+    Dependency.index(pl_list, [pltp])
+    
+    return pltp
 
 
 
 def load_PL(directory, rel_path):
     """ Load the given path as a PL.
-    
+        
         Return:
             - (PL, []) if the PL was loaded successfully
             - (PL, warning_list) if the PL was loaded with warnings
@@ -118,3 +153,97 @@ def load_PL(directory, rel_path):
     name = splitext(basename(rel_path))[0]
     pl = PL(name=name, json=dic, directory=directory, rel_path=rel_path)
     return pl, [htmlprint.code(warning) for warning in warnings]
+
+
+
+def update_PLTP(pltp):
+    """ Parse again the file of pltp and update it and its PL in place, so that their primary
+        keys, and therefore the Activity and Answer referencing them, are kept.
+        
+        PL still referenced by the PLTP are updated, new ones are created and those which
+        are not referenced anymore (and not used by any other PLTP) are deleted.
+        
+        Return the list of the warnings. Propagate any exception raised by the parser."""
+    
+    dic, warnings = parse_file(pltp.directory, pltp.rel_path)
+    
+    with transaction.atomic():
+        directories = {
+            d.name: d for d in Directory.objects.filter(name__in={item['directory_name'] for item in dic['__pl']})
+        }
+        existing = dict()
+        for pl in pltp.pl.all().select_related('directory'):
+            existing.setdefault((pl.directory.name, pl.rel_path), list()).append(pl)
+        
+        pl_list = list()
+        for item in dic['__pl']:
+            if item['directory_name'] not in directories:
+                raise DirectoryNotFound(dic['__rel_path'], item['line'], item['directory_name'], item['lineno'])
+            pl_dic, pl_warnings = parse_file(directories[item['directory_name']], item['path'])
+            warnings += pl_warnings
+            reused = existing.get((item['directory_name'], item['path']))
+            if reused:
+                pl = reused.pop(0)
+                pl.json = pl_dic
+                pl.save()
+            else:
+                pl = PL(name=splitext(basename(item['path']))[0], json=pl_dic,
+                        directory=directories[item['directory_name']], rel_path=item['path'])
+                pl.save()
+                logger.info("PL '"+str(pl.id)+" ("+pl.name+")' has been added to the database")
+            pl_list.append(pl)
+        
+        orphans = [pl.id for pls in existing.values() for pl in pls]
+        
+        pltp.json = dic
+        pltp.save()
+        through = PLTP.pl.through
+        through.objects.filter(pltp_id=pltp.sha1).delete()
+        through.objects.bulk_create([through(pltp_id=pltp.sha1, pl_id=pl.id) for pl in pl_list])
+        
+        Dependency.index(pl_list, [pltp])
+        
+        if orphans:
+            PL.objects.filter(id__in=orphans, pltp=None).delete()
+            logger.info("PL "+str(orphans)+" are no longer used by PLTP '"+pltp.sha1+" ("+pltp.name+")'")
+    
+    logger.info("PLTP '"+pltp.sha1+" ("+pltp.name+")' has been updated with "+str(len(pl_list))+" PL")
+    return warnings
+
+
+
+def reload_changed(directory, changed):
+    """ Update in place every PL and PLTP built from one of the files of changed, a list of paths
+        relative to the root of directory (e.g. the files modified by a git pull).
+        
+        Rows are found through loader.models.Dependency: a PL / PLTP is affected if its own file,
+        one of the files it extends or one of its '@' / '=@' files changed. Any change to a PLTP may
+        add or remove PL, it is thus fully updated with update_PLTP().
+        
+        Return a tuple (pl_list, pltp_list, errors), errors being a list of (row, message) for
+        every PL / PLTP which could not be parsed again and was left untouched."""
+    
+    changed = [path.lstrip('/') for path in changed]
+    
+    pltp_list = list(Dependency.pltp_using(directory, changed).select_related('directory'))
+    pl_list = list(
+        Dependency.pl_using(directory, changed).exclude(pltp__in=pltp_list).select_related('directory')
+    )
+    
+    errors = list()
+    for pltp in pltp_list:
+        try:
+            update_PLTP(pltp)
+        except Exception as e:
+            errors.append((pltp, str(e)))
+    for pl in pl_list:
+        try:
+            pl.json, warnings = parse_file(pl.directory, pl.rel_path)
+            pl.save()
+        except Exception as e:
+            errors.append((pl, str(e)))
+    Dependency.index([pl for pl in pl_list if all(pl is not row for row, error in errors)])
+    
+    logger.info("Reloaded "+str(len(pltp_list))+" PLTP and "+str(len(pl_list))+" PL after changes to "
+                +str(len(changed))+" file(s) of '"+directory.name+"'")
+    return pl_list, pltp_list, errors
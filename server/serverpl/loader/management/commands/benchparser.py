@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  benchparser.py
+#  
+#  Copyright 2018 Coumes Quentin
+
+
+import os, time
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from loader.parsers import pl, pltp
+
+
+
+def cascade(parser, line):
+    """ Classify line the way parsers did before using LineLexer: trying every regex one
+        after the other, matching twice the one which succeed."""
+    
+    file_line = parser.SANDBOX_FILE_LINE if hasattr(parser, 'SANDBOX_FILE_LINE') else parser.PL_FILE_LINE
+    for regex in [parser.EXTENDS_LINE, parser.FROM_FILE_LINE, parser.ONE_LINE, file_line,
+                  parser.MULTI_LINE, parser.COMMENT_LINE, parser.EMPTY_LINE]:
+        if regex.match(line):
+            return regex.match(line)
+    return None
+
+
+
+def lexer(parser, line):
+    """ Classify line with the single-pass LineLexer of the parser."""
+    
+    return parser.LEXER.lex(line)
+
+
+
+class Command(BaseCommand):
+    help = "Benchmark the classification of the lines of every PL / PLTP of a directory (lines/second)."
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=os.path.join(settings.FILEBROWSER_ROOT, 'plbank'),
+                            help="Directory containing the PL / PLTP (default: FILEBROWSER_ROOT/plbank)")
+        parser.add_argument('--repeat', type=int, default=10, help="Number of passes over the corpus")
+    
+    
+    def corpus(self, path):
+        """ Return a list of (parser, line) for every line of every PL / PLTP of path
+            which is not inside a multiline value."""
+        
+        lines = list()
+        for root, dirs, files in os.walk(path):
+            for f in files:
+                parser = pl.Parser if f.endswith('.pl') else pltp.Parser if f.endswith('.pltp') else None
+                if not parser:
+                    continue
+                with open(os.path.join(root, f), 'r', errors='replace') as fd:
+                    in_multiline = False
+                    for line in fd:
+                        if in_multiline:
+                            in_multiline = not parser.END_MULTI_LINE.match(line)
+                            continue
+                        lines.append((parser, line))
+                        in_multiline = parser.LEXER.lex(line)[0] == 'multi_line'
+        return lines
+    
+    
+    def time(self, function, lines, repeat):
+        start = time.perf_counter()
+        for i in range(repeat):
+            for parser, line in lines:
+                function(parser, line)
+        return time.perf_counter() - start
+    
+    
+    def handle(self, *args, **options):
+        lines = self.corpus(options['path'])
+        if not lines:
+            self.stderr.write("No PL / PLTP found in '" + options['path'] + "'.")
+            return
+        
+        total = len(lines) * options['repeat']
+        before = self.time(cascade, lines, options['repeat'])
+        after = self.time(lexer, lines, options['repeat'])
+        
+        self.stdout.write(str(len(lines)) + " lines, " + str(options['repeat']) + " passes")
+        self.stdout.write("Regex cascade: %10.0f lines/s" % (total / before))
+        self.stdout.write("LineLexer:     %10.0f lines/s" % (total / after))
+        self.stdout.write("Speedup:       %10.2fx" % (before / after))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  blobreport.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import Length
+from django.db.models import Sum
+from django.db import transaction, connection
+
+from loader.models import PL, Blob
+from loader.utils import blob_references, join_blobs
+
+
+
+def size(obj):
+    return len(json.dumps(obj))
+
+
+
+class Command(BaseCommand):
+    help = ("Report the size of the PL stored as skeleton + blobs compared to the size they would "
+            + "take with every string inlined.")
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true', help="Delete the blobs not used by any PL")
+    
+    
+    def lock(self):
+        """ Lock the Blob table until the end of the transaction, so that no PL can start using a
+            blob between the scan of the PL and the deletion of the unused blobs.
+            
+            Blobs are stored or reused in the same transaction as the PL using them: locking
+            waits for the transactions which read the table to commit their PL, and blocks the new
+            ones until the blobs are deleted. SQLite does not need it, as it fails a transaction
+            writing the database after another one committed since it started reading it."""
+        
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("LOCK TABLE " + Blob._meta.db_table + " IN ACCESS EXCLUSIVE MODE")
+        elif connection.vendor != 'sqlite':
+            raise CommandError("--prune is only supported with PostgreSQL and SQLite")
+    
+    
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['prune']:
+                self.lock()
+            self.report(options['prune'])
+    
+    
+    def report(self, prune):
+        blobs = dict(Blob.objects.annotate(length=Length('content')).values_list('sha1', 'length'))
+        
+        inlined = 0
+        skeletons = 0
+        used = set()
+        count = 0
+        for skeleton in PL.objects.values_list('skeleton', flat=True).iterator():
+            references = blob_references(skeleton)
+            used |= references
+            skeletons += size(skeleton)
+            inlined += size(join_blobs(skeleton, Blob.fetch(references)))
+            count += 1
+        
+        stored = skeletons + sum(blobs[sha1] for sha1 in used if sha1 in blobs)
+        unused = set(blobs) - used
+        
+        self.stdout.write(str(count) + " PL, " + str(len(used)) + " blobs used, " + str(len(unused)) + " unused")
+        self.stdout.write("Inlined:           %12d characters" % inlined)
+        self.stdout.write("Skeletons + blobs: %12d characters (%d + %d)" % (stored, skeletons, stored - skeletons))
+        if inlined:
+            self.stdout.write("Saved:             %12.1f%%" % (100 * (1 - stored / inlined)))
+        
+        if unused:
+            unused_size = Blob.objects.filter(sha1__in=unused).aggregate(s=Sum(Length('content')))['s']
+            if prune:
+                Blob.objects.filter(sha1__in=unused).delete()
+                self.stdout.write("Deleted " + str(len(unused)) + " unused blobs (" + str(unused_size) + " characters)")
+            else:
+                self.stdout.write(str(unused_size) + " characters in unused blobs, use --prune to delete them")
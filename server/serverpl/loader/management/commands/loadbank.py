@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  loadbank.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import os, time, multiprocessing
+
+from os.path import splitext, basename
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from loader.parser import parse_file
+from loader.models import PL, PLTP
+from loader.loader import pltp_sha1, save_PLTP
+
+from filebrowser.models import Directory
+
+
+_directories = dict()
+
+
+
+def parse(task):
+    """ Parse the file (directory_name, rel_path) of task, meant to be run by a worker of the pool.
+        
+        Return a tuple (task, dic, warnings, error), error being None if the file was
+        parsed successfully, and dic and warnings being None if not."""
+    
+    directory_name, rel_path = task
+    try:
+        if directory_name not in _directories:
+            _directories[directory_name] = Directory.objects.get(name=directory_name)
+        dic, warnings = parse_file(_directories[directory_name], rel_path)
+        return task, dic, warnings, None
+    except Exception as e:
+        return task, None, None, str(type(e).__name__) + ' - ' + str(e)
+
+
+
+class Command(BaseCommand):
+    help = ("Load every PLTP of a Directory in the database. Files are parsed in a pool of "
+            + "processes, each PL being parsed once even if used by several PLTP.")
+    
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="Name of the Directory containing the PLTP")
+        parser.add_argument('--force', action='store_true',
+                            help="Reload the PLTP which are already in the database")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help="Number of processes used to parse the files (default: number of CPU)")
+    
+    
+    def discover(self, directory):
+        """ Return the sorted list of the path of every PLTP of directory, relative to its root
+            and starting with a '/' as the ones given by the filebrowser."""
+        
+        paths = list()
+        for root, dirs, files in os.walk(directory.root):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for f in files:
+                if f.endswith('.pltp'):
+                    paths.append('/' + os.path.relpath(os.path.join(root, f), directory.root))
+        return sorted(paths)
+    
+    
+    def parse_all(self, tasks, workers):
+        """ Parse every (directory_name, rel_path) of tasks, return a dict mapping each task
+            to the tuple returned by parse()."""
+        
+        if workers <= 1 or len(tasks) <= 1:
+            return {result[0]: result for result in map(parse, tasks)}
+        
+        # Forked processes must not share the connection of the parent
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            chunksize = max(1, len(tasks) // (workers * 4))
+            return {result[0]: result for result in pool.imap_unordered(parse, tasks, chunksize)}
+    
+    
+    def handle(self, *args, **options):
+        try:
+            directory = Directory.objects.get(name=options['directory'])
+        except Directory.DoesNotExist:
+            raise CommandError("Directory '" + options['directory'] + "' does not exist")
+        
+        start = time.perf_counter()
+        
+        paths = self.discover(directory)
+        existing = set(PLTP.objects.filter(
+            sha1__in=[pltp_sha1(directory, path) for path in paths]
+        ).values_list('sha1', flat=True))
+        if not options['force']:
+            paths = [path for path in paths if pltp_sha1(directory, path) not in existing]
+        
+        errors = list()
+        
+        # Parse every PLTP, then every distinct PL they reference
+        pltps = self.parse_all([(directory.name, path) for path in paths], options['workers'])
+        for task, dic, warnings, error in pltps.values():
+            if error:
+                errors.append((task, error))
+        pl_tasks = sorted({
+            (item['directory_name'], item['path'])
+            for task, dic, warnings, error in pltps.values() if dic
+            for item in dic['__pl']
+        })
+        pls = self.parse_all(pl_tasks, options['workers'])
+        for task, dic, warnings, error in pls.values():
+            if error:
+                errors.append((task, error))
+        
+        parsed = time.perf_counter()
+        
+        # Write every PLTP whose PL were all parsed successfully in a single transaction
+        directories = {d.name: d for d in Directory.objects.filter(name__in={t[0] for t in pl_tasks})}
+        loaded = 0
+        pl_count = 0
+        with transaction.atomic():
+            for path in paths:
+                task, dic, warnings, error = pltps[(directory.name, path)]
+                if error:
+                    continue
+                failed = [item for item in dic['__pl'] if pls[(item['directory_name'], item['path'])][3]]
+                if failed:
+                    errors.append((task, "Not loaded, " + str(len(failed)) + " PL could not be parsed"))
+                    continue
+                
+                sha1 = pltp_sha1(directory, path)
+                if sha1 in existing:
+                    # PLTP.delete() also deletes the PL no other PLTP uses, a queryset delete does not
+                    for old in PLTP.objects.filter(sha1=sha1):
+                        old.delete()
+                pl_list = [
+                    PL(name=splitext(basename(item['path']))[0], json=pls[(item['directory_name'], item['path'])][1],
+                       directory=directories[item['directory_name']], rel_path=item['path'])
+                    for item in dic['__pl']
+                ]
+                pltp = PLTP(name=splitext(basename(path))[0], sha1=sha1, json=dic, directory=directory, rel_path=path)
+                save_PLTP(pltp, pl_list)
+                loaded += 1
+                pl_count += len(pl_list)
+        
+        end = time.perf_counter()
+        
+        for (directory_name, rel_path), error in sorted(errors):
+            self.stderr.write(directory_name + ":" + rel_path + " -- " + error)
+        
+        parse_time = parsed - start
+        self.stdout.write(
+            str(len(paths)) + " PLTP and " + str(len(pl_tasks)) + " distinct PL parsed in %.2fs (%.1f files/s, "
+            % (parse_time, (len(paths) + len(pl_tasks)) / parse_time if parse_time else 0)
+            + str(options['workers']) + " workers)"
+        )
+        self.stdout.write(
+            str(loaded) + " PLTP (" + str(pl_count) + " PL) written in %.2fs, " % (end - parsed)
+            + str(len(errors)) + " error(s), total %.2fs" % (end - start)
+        )
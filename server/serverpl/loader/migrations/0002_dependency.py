@@ -0,0 +1,53 @@
+# Generated by Django 2.0.4 on 2018-06-12 10:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_dependencies(apps, schema_editor):
+    """ Fill the Dependency table from the '__dependencies' key of existing PL / PLTP."""
+    Directory = apps.get_model('filebrowser', 'Directory')
+    Dependency = apps.get_model('loader', 'Dependency')
+    PL = apps.get_model('loader', 'PL')
+    PLTP = apps.get_model('loader', 'PLTP')
+    
+    directories = dict(Directory.objects.values_list('name', 'id'))
+    dependencies = list()
+    for kind, model in [('pl', PL), ('pltp', PLTP)]:
+        for row in model.objects.all():
+            seen = set()
+            for dep in row.json.get('__dependencies', []):
+                key = (dep['directory_name'], dep['path'])
+                if key in seen or dep['directory_name'] not in directories:
+                    continue
+                seen.add(key)
+                dependencies.append(Dependency(directory_id=directories[dep['directory_name']],
+                                               rel_path=dep['path'], sha1=dep['sha1'], **{kind: row}))
+    Dependency.objects.bulk_create(dependencies, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filebrowser', '0001_initial'),
+        ('loader', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Dependency',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rel_path', models.CharField(max_length=360)),
+                ('sha1', models.CharField(max_length=40)),
+                ('directory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='filebrowser.Directory')),
+                ('pl', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dependencies', to='loader.PL')),
+                ('pltp', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dependencies', to='loader.PLTP')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dependency',
+            index=models.Index(fields=['directory', 'rel_path'], name='loader_depe_directo_69becd_idx'),
+        ),
+        migrations.RunPython(index_dependencies, migrations.RunPython.noop),
+    ]
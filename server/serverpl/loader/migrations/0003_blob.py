@@ -0,0 +1,55 @@
+# Generated by Django 2.0.4 on 2018-06-14 15:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+from loader.utils import split_blobs, join_blobs, blob_references
+
+
+def split_pl(apps, schema_editor):
+    """ Move the strings of at least PL_BLOB_MIN_SIZE characters of every PL to the Blob table."""
+    Blob = apps.get_model('loader', 'Blob')
+    PL = apps.get_model('loader', 'PL')
+    
+    min_size = getattr(settings, 'PL_BLOB_MIN_SIZE', 512)
+    for pl in PL.objects.all():
+        pl.skeleton, blobs = split_blobs(pl.skeleton, min_size)
+        existing = set(Blob.objects.filter(sha1__in=list(blobs)).values_list('sha1', flat=True))
+        Blob.objects.bulk_create([Blob(sha1=sha1, content=content) for sha1, content in blobs.items()
+                                  if sha1 not in existing])
+        pl.save()
+
+
+def join_pl(apps, schema_editor):
+    """ Put the blobs back into the json of every PL."""
+    Blob = apps.get_model('loader', 'Blob')
+    PL = apps.get_model('loader', 'PL')
+    
+    for pl in PL.objects.all():
+        sha1s = blob_references(pl.skeleton)
+        blobs = dict(Blob.objects.filter(sha1__in=sha1s).values_list('sha1', 'content'))
+        pl.skeleton = join_blobs(pl.skeleton, blobs)
+        pl.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loader', '0002_dependency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha1', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+            ],
+        ),
+        migrations.RenameField(
+            model_name='pl',
+            old_name='json',
+            new_name='skeleton',
+        ),
+        migrations.RunPython(split_pl, join_pl),
+    ]
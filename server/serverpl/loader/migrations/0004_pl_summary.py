@@ -0,0 +1,51 @@
+# Generated by Django 2.0.4 on 2018-06-18 09:37
+
+from django.db import migrations, models
+
+from loader.utils import join_blobs, blob_references
+
+
+def fill_summary(apps, schema_editor):
+    """ Fill title, author, type and has_grader of every PL from its dictionnary."""
+    Blob = apps.get_model('loader', 'Blob')
+    PL = apps.get_model('loader', 'PL')
+    
+    for pl in PL.objects.all():
+        blobs = dict(Blob.objects.filter(sha1__in=blob_references(pl.skeleton)).values_list('sha1', 'content'))
+        dic = join_blobs(pl.skeleton, blobs)
+        pl.title = str(dic.get('title', ''))[:200]
+        pl.author = str(dic.get('author', ''))[:200]
+        pl.type = str(dic.get('type', ''))[:50]
+        pl.has_grader = 'grader' in dic or 'evaluator' in dic
+        pl.save(update_fields=['title', 'author', 'type', 'has_grader'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loader', '0003_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pl',
+            name='author',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='pl',
+            name='has_grader',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='pl',
+            name='title',
+            field=models.CharField(db_index=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='pl',
+            name='type',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=50),
+        ),
+        migrations.RunPython(fill_summary, migrations.RunPython.noop),
+    ]
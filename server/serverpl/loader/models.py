@@ -6,21 +6,144 @@ import logging
 
 from jsonfield import JSONField
 
-from django.db import models
+from django.db import models, transaction
+from django.db.utils import IntegrityError
+from django.conf import settings
 
 from filebrowser.models import Directory
 
+from loader.utils import LRUCache, split_blobs, join_blobs, blob_references
+
 logger = logging.getLogger(__name__)
 
+BLOB_CACHE = LRUCache(getattr(settings, 'BLOB_CACHE_SIZE', 32 * 1024 * 1024), size=len)
+
+
+
+class Blob(models.Model):
+    """ A string shared by the PL (content of a '@' file, of an extended template...), identified
+        by its sha1. Blobs read from the database are kept in BLOB_CACHE."""
+    
+    sha1 = models.CharField(primary_key=True, max_length=40)
+    content = models.TextField()
+    
+    def __str__(self):
+        return self.sha1
+    
+    
+    @classmethod
+    def store(cls, blobs):
+        """ Save every blob of blobs, a dictionnary mapping sha1 to content, which is not already
+            in the database.
+            
+            If another transaction inserts one of the blobs meanwhile, the bulk insert is rolled
+            back to a savepoint and the missing blobs are inserted one by one, ignoring those
+            which now exist."""
+        
+        if not blobs:
+            return
+        existing = set(cls.objects.filter(sha1__in=list(blobs)).values_list('sha1', flat=True))
+        missing = [cls(sha1=sha1, content=content) for sha1, content in blobs.items() if sha1 not in existing]
+        if missing:
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create(missing)
+            except IntegrityError:
+                for blob in missing:
+                    cls.objects.get_or_create(sha1=blob.sha1, defaults={'content': blob.content})
+        for sha1, content in blobs.items():
+            BLOB_CACHE.set(sha1, content)
+    
+    
+    @classmethod
+    def fetch(cls, sha1s):
+        """ Return a dictionnary mapping every sha1 of sha1s to the content of its blob, reading
+            those which are not in BLOB_CACHE with a single query."""
+        
+        blobs = dict()
+        missing = list()
+        for sha1 in sha1s:
+            content = BLOB_CACHE.get(sha1)
+            if content is None:
+                missing.append(sha1)
+            else:
+                blobs[sha1] = content
+        if missing:
+            for sha1, content in cls.objects.filter(sha1__in=missing).values_list('sha1', 'content'):
+                BLOB_CACHE.set(sha1, content)
+                blobs[sha1] = content
+        return blobs
+
+
 
 class PL(models.Model):
-    json = JSONField()
+    """ The dictionnary of the PL is accessed through the 'json' property. It is stored as a
+        skeleton where every string of at least settings.PL_BLOB_MIN_SIZE characters is replaced
+        by a reference to a Blob, so that files shared by several PL are only stored once.
+        
+        title, author, type and has_grader are copied from the dictionnary when the PL is saved,
+        so that lists of PL can be displayed without reading the skeleton, e.g. with
+        pltp.pl.only('id', 'title')."""
+    
+    skeleton = JSONField()
     name = models.CharField(max_length=100, null=False)
     directory = models.ForeignKey(Directory, on_delete=models.SET_NULL, null=True)
     rel_path = models.CharField(max_length=360, null=False)
+    title = models.CharField(max_length=200, null=False, default='', db_index=True)
+    author = models.CharField(max_length=200, null=False, default='', blank=True)
+    type = models.CharField(max_length=50, null=False, default='', blank=True, db_index=True)
+    has_grader = models.BooleanField(null=False, default=False)
     
     def __str__(self):
         return str(self.id) + " - " +self.name
+    
+    
+    @property
+    def json(self):
+        if getattr(self, '_json', None) is None:
+            self._json = join_blobs(self.skeleton, Blob.fetch(blob_references(self.skeleton)))
+        return self._json
+    
+    
+    @json.setter
+    def json(self, dic):
+        self._json = dic
+    
+    
+    @staticmethod
+    def summary(dic):
+        """ Return the values of the summary columns (title, author, type, has_grader) of
+            the PL dictionnary dic."""
+        
+        return {
+            'title': str(dic.get('title', ''))[:200],
+            'author': str(dic.get('author', ''))[:200],
+            'type': str(dic.get('type', ''))[:50],
+            'has_grader': 'grader' in dic or 'evaluator' in dic,
+        }
+    
+    
+    @staticmethod
+    def prepare(pl_list):
+        """ Compute the skeleton and the summary columns of every PL of pl_list and save their
+            blobs, must be called before saving PL with bulk_create()."""
+        
+        blobs = dict()
+        min_size = getattr(settings, 'PL_BLOB_MIN_SIZE', 512)
+        for pl in pl_list:
+            if getattr(pl, '_json', None) is not None:
+                pl.skeleton, pl_blobs = split_blobs(pl._json, min_size)
+                blobs.update(pl_blobs)
+                for key, value in PL.summary(pl._json).items():
+                    setattr(pl, key, value)
+        Blob.store(blobs)
+    
+    
+    def save(self, *args, **kwargs):
+        # The blobs are stored in the same transaction as the PL, see the command blobreport
+        with transaction.atomic(savepoint=False):
+            PL.prepare([self])
+            super(PL, self).save(*args, **kwargs)
 
 
 class PLTP(models.Model):
@@ -43,3 +166,70 @@ class PLTP(models.Model):
                 logger.info("PL '"+str(pl.id)+" ("+pl.name+")' has been deleted since it wasn't link to any PLTPs")
                 pl.delete()
         super(PLTP, self).delete(*args, **kwargs)
+
+
+
+class Dependency(models.Model):
+    """ A file (directory, rel_path) which was used to build a PL or a PLTP: its own file, the files
+        it extends and its '@' / '=@' files. sha1 is the hash of the content of the file when it was
+        parsed.
+        
+        Filled from the '__dependencies' key of the parsed dictionnaries by Dependency.index()."""
+    
+    directory = models.ForeignKey(Directory, on_delete=models.CASCADE, null=False)
+    rel_path = models.CharField(max_length=360, null=False)
+    sha1 = models.CharField(max_length=40, null=False)
+    pl = models.ForeignKey(PL, on_delete=models.CASCADE, null=True, related_name="dependencies")
+    pltp = models.ForeignKey(PLTP, on_delete=models.CASCADE, null=True, related_name="dependencies")
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['directory', 'rel_path']),
+        ]
+    
+    
+    def __str__(self):
+        return self.directory.name + ":" + self.rel_path + " -> " + str(self.pl or self.pltp)
+    
+    
+    @classmethod
+    def index(cls, pl_list=(), pltp_list=()):
+        """ Replace the dependencies of every PL of pl_list and PLTP of pltp_list by the
+            ones of their '__dependencies' key. Rows must already be saved."""
+        
+        rows = [('pl', pl) for pl in pl_list] + [('pltp', pltp) for pltp in pltp_list]
+        names = {dep['directory_name'] for kind, row in rows for dep in row.json.get('__dependencies', [])}
+        directories = dict(Directory.objects.filter(name__in=names).values_list('name', 'id'))
+        
+        cls.objects.filter(pl__in=[pl.id for pl in pl_list]).delete()
+        cls.objects.filter(pltp__in=[pltp.sha1 for pltp in pltp_list]).delete()
+        
+        dependencies = list()
+        for kind, row in rows:
+            seen = set()
+            for dep in row.json.get('__dependencies', []):
+                key = (dep['directory_name'], dep['path'])
+                if key in seen or dep['directory_name'] not in directories:
+                    continue
+                seen.add(key)
+                dependencies.append(cls(directory_id=directories[dep['directory_name']], rel_path=dep['path'],
+                                        sha1=dep['sha1'], **{kind: row}))
+        cls.objects.bulk_create(dependencies)
+    
+    
+    @staticmethod
+    def pl_using(directory, rel_paths):
+        """ Return a QuerySet of every PL built from one of the files rel_paths of directory."""
+        
+        return PL.objects.filter(
+            dependencies__directory=directory, dependencies__rel_path__in=rel_paths
+        ).distinct()
+    
+    
+    @staticmethod
+    def pltp_using(directory, rel_paths):
+        """ Return a QuerySet of every PLTP built from one of the files rel_paths of directory."""
+        
+        return PLTP.objects.filter(
+            dependencies__directory=directory, dependencies__rel_path__in=rel_paths
+        ).distinct()
@@ -7,7 +7,7 @@
 
 
 
-import os, importlib, traceback, logging
+import os, importlib, traceback, logging, threading
 
 from os.path import basename, splitext, join
 
@@ -15,6 +15,7 @@ from django.core.exceptions import ObjectDoesNotExist
 
 from serverpl.settings import PARSERS_ROOT, PARSERS_MODULE
 from loader.utils import get_location, extends_dict
+from loader.cache import PARSE_CACHE
 from loader.exceptions import UnknownExtension, UnknownType, DirectoryNotFound, FileNotFound, MissingKey
 
 from filebrowser.models import Directory
@@ -29,21 +30,75 @@ PLTP_MANDATORY_KEY = ['title', '__pl', 'introduction']
 MUST_BE_STRING = ['text', 'texth', 'introductionh', 'introduction', 'form', 'evaluator', 'before', 'author', 'title']
 
 
-def get_parsers():
+class ParserRegistry:
+    """ Process-wide registry of the parsers found in a parsers directory.
+    
+        The registry is built once and kept in memory, it is only rebuilt when the
+        parsers directory (or its module path) changes, when the modification time
+        of the directory changes (a parser was added or removed), or when reload()
+        is called.
+        
+        'builds' counts how many times the registry has been built in this process."""
+    
+    def __init__(self):
+        self.builds = 0
+        self._parsers = None
+        self._key = None
+        self._reload_modules = False
+        self._lock = threading.Lock()
+    
+    
+    def get(self, root, module):
+        """ Return the dict of parsers of the directory 'root' (importable as 'module'),
+            building the registry if needed."""
+        
+        try:
+            mtime = os.stat(root).st_mtime
+        except OSError:
+            mtime = None
+        key = (root, module, mtime)
+        
+        with self._lock:
+            if self._parsers is None or self._key != key:
+                self._parsers = build_parsers(root, module, self._reload_modules)
+                self._reload_modules = False
+                self._key = key
+                self.builds += 1
+                logger.info("Parser registry built from '" + str(root) + "' (build n°" + str(self.builds) + ")")
+            return self._parsers
+    
+    
+    def reload(self):
+        """ Force the registry to be rebuilt on next access, re-importing every parser module."""
+        
+        with self._lock:
+            self._parsers = None
+            self._key = None
+            self._reload_modules = True
+
+
+
+PARSER_REGISTRY = ParserRegistry()
+
+
+
+def build_parsers(root, module_path, reload_modules=False):
     """ Return a dict containing extension:(type, parser) key:value pair for every parser.
     
-        Try importing every .py file in 'parsers' as module directory
-        and run module.get_parser() to get the file extensions it parses,
+        Try importing (or re-importing if reload_modules is True) every .py file in 'root'
+        as module of 'module_path' and run module.get_parser() to get the file extensions it parses,
         the parser, and the type of file parsed ('pl' or 'pltp').
         
         Add error to the logger if the importation of a .py failed or
         two parsers parse the same extension."""
     
     parsers = dict()
-    for f in os.listdir(PARSERS_ROOT):
+    for f in os.listdir(root):
         if f.endswith(".py") and "__" not in f:
             try:
-                module = importlib.import_module(PARSERS_MODULE+"."+splitext(f)[0])
+                module = importlib.import_module(module_path+"."+splitext(f)[0])
+                if reload_modules:
+                    module = importlib.reload(module)
                 parser = module.get_parser()
                 if type(parser) != dict or set(parser.keys()) != {'ext', 'type', 'parser'} or parser['type'] not in ['pl', 'pltp']:
                     raise ValueError
@@ -67,20 +122,46 @@ def get_parsers():
 
 
 
+def get_parsers():
+    """ Return a dict containing extension:(type, parser) key:value pair for every parser
+        of PARSERS_ROOT.
+        
+        The dict is shared by the whole process and only rebuilt when PARSERS_ROOT changes,
+        see ParserRegistry."""
+    
+    return PARSER_REGISTRY.get(PARSERS_ROOT, PARSERS_MODULE)
+
+
+
+def reload_parsers():
+    """ Force the parsers of PARSERS_ROOT to be looked up again on next access."""
+    
+    PARSER_REGISTRY.reload()
+
+
+
+def get_parser_by_ext(ext):
+    """ Return the dict {'type': type, 'parser': parser} corresponding to the extension ext
+        (e.g. '.pl'), None if no parser handle this extension."""
+    
+    return get_parsers().get(ext)
+
+
+
 def get_type(directory, path):
     """Return whether the given file is a 'pltp' of a 'pl'."""
     
-    parsers = get_parsers()
     ext = splitext(basename(path))[1]
     
     ext = '.pl' if not ext else ext
     
-    if ext in parsers:
-        if parsers[ext]['type'] in ['pl', 'pltp']:
-            return parsers[ext]['type']
+    parser = get_parser_by_ext(ext)
+    if parser:
+        if parser['type'] in ['pl', 'pltp']:
+            return parser['type']
         else:
-            logger.warning("Unknown type : '"+ parsers[ext]['type'] + "' of parser '" + str(parsers[ext]['parser']) + "'")
-            raise UnknownType(parsers[ext]['type'], parsers[ext]['parser'])
+            logger.warning("Unknown type : '"+ parser['type'] + "' of parser '" + str(parser['parser']) + "'")
+            raise UnknownType(parser['type'], parser['parser'])
     
     raise UnknownExtension(path, join(directory.name, path))
 
@@ -101,7 +182,9 @@ def process_extends(dic):
             directory = Directory.objects.get(name=item['directory_name'])
             ext_dic, warnings_ext = parse_file(directory, item['path'], extending=True)
             warnings += warnings_ext
+            dependencies = dic.get('__dependencies', []) + ext_dic.get('__dependencies', [])
             dic = extends_dict(dic, ext_dic)
+            dic['__dependencies'] = dependencies
         except ObjectDoesNotExist:
             raise DirectoryNotFound(dic['__rel_path'], item['line'], item['path'], item['lineno'])
         except UnknownExtension as e:
@@ -122,27 +205,35 @@ def parse_file(directory, path, extending=False):
            - dic is a dictionnary containing every key of the parse file.
            - warning is a list (may be empty) containing every warning
         
+       The result is read from loader.cache.PARSE_CACHE if neither the file nor
+       any of the files it depends on changed since it was last parsed.
+       
        Raise UnknownExtension if the extension is unknown.
        Propagate any exception raise by the called parser."""
     
     path = path if path[0] != '/' else path[1:]
     
-    parsers = get_parsers()
     ext = splitext(basename(path))[1]
     
     if not ext:
         ext = '.pl'
         path += '.pl'
     
-    if ext in parsers:
-        dic, warnings = parsers[ext]['parser'](directory, path).parse()
-        dic, ext_warnings = process_extends(dic)
-        warnings += ext_warnings
+    parser = get_parser_by_ext(ext)
+    if parser:
+        cached = PARSE_CACHE.get(directory, path)
+        if cached:
+            dic, warnings = cached
+        else:
+            dic, warnings = parser['parser'](directory, path).parse()
+            dic, ext_warnings = process_extends(dic)
+            warnings += ext_warnings
+            PARSE_CACHE.set(directory, path, dic, warnings)
         
         if not extending:
             #~ for key in dic:
                 #~ print(key+": "+ str(dic[key]))
-            if parsers[ext]['type'] == 'pltp':
+            if parser['type'] == 'pltp':
                 for key in PLTP_MANDATORY_KEY:
                     if key not in dic:
                         raise MissingKey(join(directory.root, path), key)
@@ -10,7 +10,7 @@ import re, json, hashlib
 from os.path import join
 from django.core.exceptions import ObjectDoesNotExist
 from loader.exceptions import SemanticError, SyntaxErrorPL, DirectoryNotFound, FileNotFound
-from loader.utils import get_location
+from loader.utils import get_location, content_sha1, LineLexer
 from serverpl.settings import FILEBROWSER_ROOT
 
 
@@ -30,6 +30,16 @@ class Parser:
     END_MULTI_LINE = re.compile(r'\s*==\s*')
     COMMENT_LINE = re.compile(r'\s*' + COMMENT + r'$')
     EMPTY_LINE = re.compile(r'\s*$')
+    
+    LEXER = LineLexer([
+        ('extends', EXTENDS_LINE.pattern),
+        ('from_file', FROM_FILE_LINE.pattern),
+        ('one_line', ONE_LINE.pattern),
+        ('pl_file', PL_FILE_LINE.pattern),
+        ('multi_line', MULTI_LINE.pattern),
+        ('comment', COMMENT_LINE.pattern),
+        ('empty', EMPTY_LINE.pattern),
+    ])
 
     
     def __init__(self, directory, rel_path):
@@ -54,6 +64,16 @@ class Parser:
         self.warning.append(self.path_parsed_file + ' -- ' + message)
     
     
+    def add_dependency(self, directory, path, content):
+        """Append the file path of directory and the sha1 of its content to self.dic['__dependencies']."""
+        
+        self.dic['__dependencies'].append({
+            'directory_name': directory.name,
+            'path': path,
+            'sha1': content_sha1(content),
+        })
+    
+    
     def fill_meta(self):
         """Append meta informations to self.dic. Meta informations should starts with two underscores"""
         
@@ -62,22 +82,24 @@ class Parser:
         self.dic['__comment'] = ''
         self.dic['__pl'] = list()
         self.dic['__extends'] = list()
+        self.dic['__dependencies'] = list()
+        self.add_dependency(self.directory, self.path, ''.join(self.lines))
         
         sha1 = hashlib.sha1()
         sha1.update((self.directory.name+':'+self.path).encode('utf-8'))
         self.dic['__sha1'] = sha1.hexdigest()
     
     
-    def extends_line_match(self, match, line):
+    def extends_line_match(self, groups, line):
         """ Appends file, line and lineno to self.dic['__extends'] so that it can be later processed
             by loader.parser.
             
             Raise loader.exceptions.SyntaxErrorPL if no group 'file' was found."""
         
-        if not match.group('file'):
+        if not groups['file']:
             raise SyntaxErrorPL(self.path_parsed_file, line, self.lineno)
         
-        directory, path = get_location(self.directory, match.group('file'), current=self.path_parsed_file)
+        directory, path = get_location(self.directory, groups['file'], current=self.path_parsed_file)
         
         self.dic['__extends'].append({
             'path': path.replace(directory.name+'/', ''),
@@ -87,7 +109,7 @@ class Parser:
         })
     
     
-    def from_file_line_match(self, match, line):
+    def from_file_line_match(self, groups, line):
         """ Map (or append) the content if the file corresponding to file)
             to the key key)
             
@@ -97,35 +119,38 @@ class Parser:
                 - DirectoryNotFound if trying to load from a nonexistent directory
                 - FileNotFound if the given file do not exists."""
         
-        if not match.group('file') or not match.group('key') or not match.group('operator'):
+        if not groups['file'] or not groups['key'] or not groups['operator']:
             raise SyntaxErrorPL(self.path_parsed_file, line, self.lineno)
         
-        key = match.group('key')
-        op = match.group('operator')
+        key = groups['key']
+        op = groups['operator']
         
         # Add warning when overwritting a key
         if key in self.dic and '+' not in op:
             self.add_warning("Key '" + key + "' overwritten at line " + str(self.lineno))
         
         try:
-            directory, path = get_location(self.directory, match.group('file'), current=self.path_parsed_file)
-            path = join(directory.root, path.replace(directory.name+'/', ''))
+            directory, path = get_location(self.directory, groups['file'], current=self.path_parsed_file)
+            rel_path = path.replace(directory.name+'/', '')
+            path = join(directory.root, rel_path)
             with open(path, 'r') as f:
+                content = f.read()
                 if '+' in op:
                     if not key in self.dic.keys():
                         raise SemanticError(self.path_parsed_file, line, self.lineno, "Trying to append to non-existent key '"+key+"'.")
-                    self.dic[key] += f.read()
+                    self.dic[key] += content
                 else:
-                    self.dic[key] = f.read()
+                    self.dic[key] = content
+            self.add_dependency(directory, rel_path, content)
         except ObjectDoesNotExist:
-            raise DirectoryNotFound(self.path_parsed_file, line, match.group('file'), self.lineno)
+            raise DirectoryNotFound(self.path_parsed_file, line, groups['file'], self.lineno)
         except FileNotFoundError:
             raise FileNotFound(self.path_parsed_file, line, path, lineno=self.lineno)
         except ValueError:
-            raise FileNotFound(self.path_parsed_file, line, match.group('file'), lineno=self.lineno, message="Path from another directory must be absolute")
+            raise FileNotFound(self.path_parsed_file, line, groups['file'], lineno=self.lineno, message="Path from another directory must be absolute")
     
     
-    def one_line_match(self, match, line):
+    def one_line_match(self, groups, line):
         """ Map value to key if operator is '=',
             Map json.loads(value) if operator is '%'
             
@@ -133,37 +158,37 @@ class Parser:
                 - SyntaxErrorPL if no group 'value', 'key' or 'operator' was found
                               if operator is '%' and value isn't a well formated json"""
         
-        if not (match.group('key') and match.group('value') and match.group('operator')):
+        if not (groups['key'] and groups['value'] and groups['operator']):
             raise SyntaxErrorPL(self.path_parsed_file, line, self.lineno)
         
-        key = match.group('key')
+        key = groups['key']
         
         # Add warning when overwritting a key
         if key in self.dic:
             self.add_warning("Key '" + key + "' overwritten at line " + str(self.lineno))
             
-        if match.group('operator') == '=':
-            self.dic[key] = match.group('value')
+        if groups['operator'] == '=':
+            self.dic[key] = groups['value']
         else:
             try:
-                self.dic[key] = json.loads(match.group('value'))
+                self.dic[key] = json.loads(groups['value'])
             except:
                 SyntaxErrorPL(join(self.directory.root, self.path), line, self.lineno, message="Invalid JSON syntax ")
         
     
     
-    def multi_line_match(self, match, line):
+    def multi_line_match(self, groups, line):
         """ Set self._multiline_key and self._multiline_opened_lineno.
             Also set self._multiline_json if operator is '=%'
             
             Raise from loader.exceptions:
                 - SyntaxErrorPL if no group 'key' or 'operator' was found"""
         
-        if not match.group('key') or not match.group('operator'):
+        if not groups['key'] or not groups['operator']:
             raise SyntaxErrorPL(self.path_parsed_file, line, self.lineno)
         
-        key = match.group('key')
-        op = match.group('operator')
+        key = groups['key']
+        op = groups['operator']
         
         # Add warning when overwritting a key
         if op != '+=' and key in self.dic:
@@ -198,16 +223,16 @@ class Parser:
             self.dic[self._multiline_key] += '\n'+line
     
     
-    def pl_file_line_match(self, match, line):
+    def pl_file_line_match(self, groups, line):
         """ Appends file, line and lineno to self.dic['__pl'] so that it can be later processed
             by loader.loader.
             
             Raise loader.exceptions.SyntaxErrorPL if no group 'file' was found."""
         
-        if not match.group('file'):
+        if not groups['file']:
             raise SyntaxErrorPL(self.path_parsed_file, line, self.lineno)
         
-        directory, path = get_location(self.directory, match.group('file'), current=self.path_parsed_file)
+        directory, path = get_location(self.directory, groups['file'], current=self.path_parsed_file)
         
         self.dic['__pl'].append({
             'path': path.replace(directory.name+'/', ''),
@@ -218,33 +243,37 @@ class Parser:
     
     
     def parse_line(self, line):
-        """ Parse the given line by calling the appropriate function according to regex match.
+        """ Parse the given line by calling the appropriate function according to the kind
+            of line returned by self.LEXER.
         
-            Raise loader.exceptions.SyntaxErrorPL if the line wasn't match by any regex."""
+            Raise loader.exceptions.SyntaxErrorPL if the line wasn't match by any rule."""
         
         if self._multiline_key:
             self.while_multi_line(line)
+            return
+        
+        kind, groups = self.LEXER.lex(line)
         
-        elif self.EXTENDS_LINE.match(line):
-            self.extends_line_match(self.EXTENDS_LINE.match(line), line)
+        if kind == 'extends':
+            self.extends_line_match(groups, line)
         
-        elif self.FROM_FILE_LINE.match(line):
-            self.from_file_line_match(self.FROM_FILE_LINE.match(line), line)
+        elif kind == 'from_file':
+            self.from_file_line_match(groups, line)
             
-        elif self.ONE_LINE.match(line):
-            self.one_line_match(self.ONE_LINE.match(line), line)
+        elif kind == 'one_line':
+            self.one_line_match(groups, line)
         
-        elif self.PL_FILE_LINE.match(line):
-            self.pl_file_line_match(self.PL_FILE_LINE.match(line), line)
+        elif kind == 'pl_file':
+            self.pl_file_line_match(groups, line)
         
-        elif self.MULTI_LINE.match(line):
-            self.multi_line_match(self.MULTI_LINE.match(line), line)
+        elif kind == 'multi_line':
+            self.multi_line_match(groups, line)
         
-        elif self.COMMENT_LINE.match(line):
-            self.dic['__comment'] += '\n' + self.COMMENT_LINE.match(line).group('comment')
+        elif kind == 'comment':
+            self.dic['__comment'] += '\n' + groups['comment']
         
-        elif not self.EMPTY_LINE.match(line):
-            raise SyntaxErrorPL(self.path_parsed_file, line, self.lineno)    
+        elif kind != 'empty':
+            raise SyntaxErrorPL(self.path_parsed_file, line, self.lineno)
     
     
     def parse(self):
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  test_blob.py
+#
+#  Copyright 2018 Coumes Quentin <qcoumes@etud.u-pem.fr>
+#
+
+import os
+
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+
+from loader.models import PL, Blob, BLOB_CACHE
+from loader.utils import split_blobs, join_blobs, blob_references
+
+
+GRADER = "print('grader')\n" * 100
+
+
+
+@override_settings(PL_BLOB_MIN_SIZE=100)
+class BlobTestCase(TestCase):
+    """ Test the storage of the PL as skeleton + Blob """
+    
+    def test_split_join(self):
+        dic = {'title': 'Title', 'grader': GRADER, '__file': {'a.py': GRADER, 'b.py': 'short'}, 'l': [GRADER, 1]}
+        skeleton, blobs = split_blobs(dic, 100)
+        self.assertEqual(len(blobs), 1)
+        self.assertEqual(skeleton['title'], 'Title')
+        self.assertEqual(skeleton['__file']['b.py'], 'short')
+        self.assertEqual(blob_references(skeleton), set(blobs))
+        self.assertEqual(join_blobs(skeleton, blobs), dic)
+    
+    
+    def test_shared_blob(self):
+        PL(name='a', rel_path='a.pl', json={'title': 'A', 'grader': GRADER}).save()
+        PL(name='b', rel_path='b.pl', json={'title': 'B', 'grader': GRADER}).save()
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertNotIn(GRADER, str(PL.objects.get(name='a').skeleton))
+        
+        BLOB_CACHE.clear()
+        self.assertEqual(PL.objects.get(name='b').json, {'title': 'B', 'grader': GRADER})
+        self.assertEqual(PL.objects.get(name='a').json['grader'], GRADER)
+    
+    
+    def test_concurrent_store(self):
+        Blob.objects.create(sha1='a', content='A')
+        # Another transaction inserted 'a' after it was looked up
+        with patch.object(Blob.objects, 'filter', return_value=Blob.objects.none()):
+            Blob.store({'a': 'A', 'b': 'B'})
+        self.assertEqual(list(Blob.objects.order_by('sha1').values_list('sha1', flat=True)), ['a', 'b'])
+    
+    
+    def test_prune(self):
+        PL(name='a', rel_path='a.pl', json={'title': 'A', 'grader': GRADER}).save()
+        Blob.objects.create(sha1='unused', content='Unused')
+        call_command('blobreport', prune=True, stdout=open(os.devnull, 'w'))
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertEqual(PL.objects.get(name='a').json['grader'], GRADER)
+    
+    
+    def test_summary_columns(self):
+        PL(name='a', rel_path='a.pl', json={'title': 'A', 'author': 'Me', 'type': 'python', 'grader': GRADER}).save()
+        PL(name='b', rel_path='b.pl', json={'title': 'B'}).save()
+        self.assertEqual(
+            list(PL.objects.order_by('name').values_list('title', 'author', 'type', 'has_grader')),
+            [('A', 'Me', 'python', True), ('B', '', '', False)]
+        )
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  test_cache.py
+#
+#  Copyright 2018 Coumes Quentin <qcoumes@etud.u-pem.fr>
+#
+
+import os, tempfile, shutil
+
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+
+from filebrowser.models import Directory
+
+from loader.parser import parse_file
+from loader.cache import PARSE_CACHE
+
+
+TEMPLATE = """
+title=Template title
+form=Template form
+grader=@ grader.py
+"""
+
+EXERCISE = """
+template=/template.pl
+title=Exercise title
+text==
+Some text
+==
+"""
+
+
+
+class ParseCacheTestCase(TestCase):
+    """ Test the parse cache used by loader.parser.parse_file(). """
+    
+    @classmethod
+    def setUpTestData(self):
+        self.user = User.objects.create_user(username='user', password='12345')
+    
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+        self.dir = Directory.objects.create(name='dir1', owner=self.user, root=self.root)
+        self.write('template.pl', TEMPLATE)
+        self.write('grader.py', "print('grader v1')")
+        self.write('exercise.pl', EXERCISE)
+    
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.cache)
+    
+    
+    def write(self, name, content):
+        with open(os.path.join(self.root, name), 'w') as f:
+            f.write(content)
+    
+    
+    def test_hit_and_invalidation(self):
+        with override_settings(PARSE_CACHE_ROOT=self.cache):
+            hits, misses = PARSE_CACHE.hits, PARSE_CACHE.misses
+            
+            dic, warnings = parse_file(self.dir, 'exercise.pl')
+            self.assertEqual(PARSE_CACHE.hits, hits)
+            self.assertEqual(dic['title'], 'Exercise title')
+            self.assertEqual(dic['form'], 'Template form')
+            self.assertEqual(
+                {dep['path'] for dep in dic['__dependencies']},
+                {'exercise.pl', 'template.pl', 'grader.py'}
+            )
+            
+            cached, cached_warnings = parse_file(self.dir, 'exercise.pl')
+            self.assertEqual(PARSE_CACHE.hits, hits + 1)
+            self.assertEqual(cached, dic)
+            self.assertEqual(cached_warnings, warnings)
+            
+            # Modifying a file the exercise depends on invalidates the entry
+            self.write('grader.py', "print('grader v2 - modified')")
+            dic, warnings = parse_file(self.dir, 'exercise.pl')
+            self.assertEqual(dic['grader'], "print('grader v2 - modified')")
+            self.assertEqual(PARSE_CACHE.misses, misses + 4)
+    
+    
+    def test_disabled(self):
+        with override_settings(PARSE_CACHE_ROOT=None):
+            hits, misses = PARSE_CACHE.hits, PARSE_CACHE.misses
+            parse_file(self.dir, 'exercise.pl')
+            parse_file(self.dir, 'exercise.pl')
+            self.assertEqual((PARSE_CACHE.hits, PARSE_CACHE.misses), (hits, misses))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  test_loadbank.py
+#
+#  Copyright 2018 Coumes Quentin <qcoumes@etud.u-pem.fr>
+#
+
+import os, io, tempfile, shutil
+
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+from filebrowser.models import Directory
+from serverpl.settings import FILEBROWSER_ROOT
+
+from loader.models import PL, PLTP
+
+
+PL_CONTENT = """
+title=Exercise
+form=Some form
+text==
+Some text
+==
+"""
+
+PLTP_CONTENT = """
+title=Some PLTP
+introduction==
+Some introduction
+==
+"""
+
+
+
+@override_settings(PARSE_CACHE_ROOT=None)
+class LoadBankTestCase(TestCase):
+    """ Test the 'loadbank' command """
+    
+    @classmethod
+    def setUpTestData(self):
+        self.user = User.objects.create_user(username='user', password='12345')
+    
+    
+    def setUp(self):
+        os.makedirs(FILEBROWSER_ROOT, exist_ok=True)
+        self.root = tempfile.mkdtemp(dir=FILEBROWSER_ROOT)
+        self.dir = Directory.objects.create(name=os.path.basename(self.root), owner=self.user, root=self.root)
+        os.makedirs(os.path.join(self.root, 'sub'))
+        self.write('exo1.pl', PL_CONTENT)
+        self.write('exo2.pl', PL_CONTENT)
+        self.write('broken.pl', "title=No form\n")
+        self.write('tp1.pltp', PLTP_CONTENT + "@ exo1.pl\n@ exo2.pl\n")
+        self.write('sub/tp2.pltp', PLTP_CONTENT + "@ /exo1.pl\n")
+        self.write('tp3.pltp', PLTP_CONTENT + "@ exo1.pl\n@ broken.pl\n")
+    
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    
+    def write(self, name, content):
+        with open(os.path.join(self.root, name), 'w') as f:
+            f.write(content)
+    
+    
+    def loadbank(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('loadbank', self.dir.name, '--workers', '1', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+    
+    
+    def test_loadbank(self):
+        out, err = self.loadbank()
+        self.assertEqual(
+            set(PLTP.objects.values_list('rel_path', flat=True)),
+            {'/tp1.pltp', '/sub/tp2.pltp'}
+        )
+        self.assertEqual(PL.objects.count(), 3)
+        self.assertIn('tp3.pltp', err)
+        self.assertIn('broken.pl', err)
+        
+        out, err = self.loadbank()
+        self.assertEqual(PLTP.objects.count(), 2)
+        self.assertEqual(PL.objects.count(), 3)
+    
+    
+    def test_loadbank_force(self):
+        self.loadbank()
+        self.write('exo1.pl', PL_CONTENT.replace('title=Exercise', 'title=Modified'))
+        self.loadbank('--force')
+        self.assertEqual(PLTP.objects.count(), 2)
+        self.assertEqual(PL.objects.count(), 3)
+        self.assertEqual(len([pl for pl in PL.objects.all() if pl.json['title'] == 'Modified']), 2)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  test_loader.py
+#
+#  Copyright 2018 Coumes Quentin <qcoumes@etud.u-pem.fr>
+#
+
+import os, tempfile, shutil
+
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+
+from filebrowser.models import Directory
+from serverpl.settings import FILEBROWSER_ROOT
+
+from loader.loader import load_file, update_PLTP, reload_changed
+from loader.models import PL, PLTP, Dependency
+from loader.utils import QueryCounter
+
+
+PL_CONTENT = """
+title=Exercise {}
+form=Some form
+text==
+Some text
+==
+"""
+
+PLTP_CONTENT = """
+title=Some PLTP
+introduction==
+Some introduction
+==
+"""
+
+
+
+@override_settings(PARSE_CACHE_ROOT=None)
+class LoaderTestCase(TestCase):
+    """ Test loader.loader.load_PLTP() """
+    
+    @classmethod
+    def setUpTestData(self):
+        self.user = User.objects.create_user(username='user', password='12345')
+    
+    
+    def setUp(self):
+        os.makedirs(FILEBROWSER_ROOT, exist_ok=True)
+        self.root = tempfile.mkdtemp(dir=FILEBROWSER_ROOT)
+        self.dir = Directory.objects.create(name=os.path.basename(self.root), owner=self.user, root=self.root)
+        for i in range(10):
+            self.write('exo' + str(i) + '.pl', PL_CONTENT.format(i))
+        self.write('tp.pltp', PLTP_CONTENT + ''.join('@ exo' + str(i) + '.pl\n' for i in range(10)))
+    
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    
+    def write(self, name, content):
+        with open(os.path.join(self.root, name), 'w') as f:
+            f.write(content)
+    
+    
+    def test_load_pltp(self):
+        pltp, warnings = load_file(self.dir, 'tp.pltp')
+        self.assertEqual(pltp.pl.count(), 10)
+        self.assertEqual(
+            sorted(pl.json['title'] for pl in pltp.pl.all()),
+            sorted('Exercise ' + str(i) for i in range(10))
+        )
+        self.assertEqual(load_file(self.dir, 'tp.pltp'), (None, None))
+    
+    
+    def test_load_pltp_force(self):
+        load_file(self.dir, 'tp.pltp')
+        pltp, warnings = load_file(self.dir, 'tp.pltp', force=True)
+        self.assertEqual(PLTP.objects.count(), 1)
+        self.assertEqual(pltp.pl.count(), 10)
+    
+    
+    def test_load_pltp_query_count(self):
+        with QueryCounter() as small:
+            load_file(self.dir, 'tp.pltp')
+        
+        # Delete the previous PLTP and its PL outside of the counted load
+        for pltp in PLTP.objects.filter(name='tp'):
+            pltp.delete()
+        self.assertFalse(PL.objects.exists())
+        
+        self.write('tp.pltp', PLTP_CONTENT + ''.join('@ exo' + str(i % 10) + '.pl\n' for i in range(50)))
+        with QueryCounter() as big:
+            load_file(self.dir, 'tp.pltp')
+        
+        self.assertEqual(PL.objects.filter(pltp__name='tp').count(), 50)
+        # At most one query per PL (none with bulk insert support), the other queries not depending
+        # on the number of PL
+        self.assertLessEqual(big.count - small.count, 40 + 5)
+    
+    
+    def test_update_pltp(self):
+        pltp, warnings = load_file(self.dir, 'tp.pltp')
+        ids = {pl.json['title']: pl.id for pl in pltp.pl.all()}
+        ids = [ids['Exercise ' + str(i)] for i in range(10)]
+        
+        self.write('exo0.pl', PL_CONTENT.format('modified'))
+        self.write('tp.pltp', PLTP_CONTENT + ''.join('@ exo' + str(i) + '.pl\n' for i in [0, 1, 2, 9]))
+        update_PLTP(pltp)
+        
+        self.assertEqual(PLTP.objects.count(), 1)
+        self.assertEqual(sorted(pl.id for pl in pltp.pl.all()), sorted([ids[0], ids[1], ids[2], ids[9]]))
+        self.assertEqual(PL.objects.get(id=ids[0]).json['title'], 'Exercise modified')
+        self.assertEqual(PL.objects.count(), 4)
+    
+    
+    def test_reload_changed(self):
+        pltp, warnings = load_file(self.dir, 'tp.pltp')
+        ids = {pl.json['title']: pl.id for pl in pltp.pl.all()}
+        ids = [ids['Exercise ' + str(i)] for i in range(10)]
+        
+        self.write('exo3.pl', PL_CONTENT.format('modified'))
+        pl_list, pltp_list, errors = reload_changed(self.dir, ['exo3.pl', 'unrelated.py'])
+        self.assertEqual(([pl.id for pl in pl_list], pltp_list, errors), ([ids[3]], [], []))
+        self.assertEqual(PL.objects.get(id=ids[3]).json['title'], 'Exercise modified')
+        
+        self.write('tp.pltp', PLTP_CONTENT + '@ exo3.pl\n')
+        pl_list, pltp_list, errors = reload_changed(self.dir, ['tp.pltp'])
+        self.assertEqual(([pltp.sha1 for pltp in pltp_list], errors), ([pltp.sha1], []))
+        self.assertEqual(list(PL.objects.values_list('id', flat=True)), [ids[3]])
+    
+    
+    def test_dependency_index(self):
+        self.write('template.pl', "form=Some form\n")
+        self.write('exo3.pl', "extends=/template.pl\ntitle=Exercise 3\n")
+        pltp, warnings = load_file(self.dir, 'tp.pltp')
+        
+        self.assertEqual(
+            [pl.json['title'] for pl in Dependency.pl_using(self.dir, ['template.pl'])],
+            ['Exercise 3']
+        )
+        self.assertEqual(list(Dependency.pltp_using(self.dir, ['tp.pltp'])), [pltp])
+        self.assertEqual(Dependency.pl_using(self.dir, ['exo0.pl', 'exo1.pl']).count(), 2)
+        self.assertFalse(Dependency.pltp_using(self.dir, ['exo0.pl']).exists())
@@ -30,6 +30,10 @@ class ParsersTestCase(TestCase):
         self.dir = Directory.objects.create(name='dir1', owner=user)
     
     
+    def setUp(self):
+        parser.reload_parsers()
+    
+    
     def test_get_parsers(self, mock_logger):
         parsers = parser.get_parsers()
         
@@ -60,4 +64,23 @@ class ParsersTestCase(TestCase):
         self.assertEqual(parser.get_type(self.dir, path4), "pl")
         with self.assertRaises(UnknownExtension):
             parser.get_type(self.dir, path5)
-
+    
+    
+    def test_registry_built_once(self, mock_logger):
+        builds = parser.PARSER_REGISTRY.builds
+        
+        parsers = parser.get_parsers()
+        for i in range(10):
+            self.assertIs(parser.get_parsers(), parsers)
+            parser.get_type(self.dir, "to/pl.pl")
+        self.assertEqual(parser.PARSER_REGISTRY.builds, builds + 1)
+        
+        parser.reload_parsers()
+        parser.get_parsers()
+        self.assertEqual(parser.PARSER_REGISTRY.builds, builds + 2)
+    
+    
+    def test_get_parser_by_ext(self, mock_logger):
+        self.assertEqual(parser.get_parser_by_ext('.pl')['type'], 'pl')
+        self.assertEqual(parser.get_parser_by_ext('.pltp')['type'], 'pltp')
+        self.assertIsNone(parser.get_parser_by_ext('.unknown'))
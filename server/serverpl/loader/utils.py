@@ -6,7 +6,12 @@
 #  Copyright 2018 Coumes Quentin
 #  
 
+import re, hashlib, threading
+
+from collections import OrderedDict
+
 from os.path import join, dirname, normpath, isfile
+from django.db import connection
 from filebrowser.models import Directory
 from serverpl.settings import FILEBROWSER_ROOT
 
@@ -53,3 +58,210 @@ def extends_dict(target, source):
             target[key] = value
     
     return target
+
+
+
+def content_sha1(content):
+    """ Return the hexadecimal sha1 of the string content. """
+    
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+
+def file_sha1(path):
+    """ Return the hexadecimal sha1 of the file pointed by path, read the same way the parsers read it. """
+    
+    with open(path, 'r') as f:
+        return content_sha1(f.read())
+
+
+
+class LineLexer:
+    """ Classify a line against an ordered list of (kind, pattern) rules with a single regex match.
+        
+        Every pattern is put in a branch of one alternation, its named groups being prefixed by
+        its kind so that they do not collide. The first rule (in the given order) matching the
+        line wins, as if each pattern was tried one after the other."""
+    
+    def __init__(self, rules):
+        branches = list()
+        renamed = dict()
+        for kind, pattern in rules:
+            renamed[kind] = list()
+            for name in re.compile(pattern).groupindex:
+                renamed[kind].append((name, kind + '__' + name))
+                pattern = pattern.replace('(?P<' + name + '>', '(?P<' + kind + '__' + name + '>')
+            branches.append('(?P<' + kind + '>' + pattern + ')')
+        self.regex = re.compile('|'.join(branches))
+        
+        # Index of the groups of each kind, so that their values are read in a single call
+        self.groups = {
+            kind: (tuple(name for name, group in names), tuple(self.regex.groupindex[group] for name, group in names))
+            for kind, names in renamed.items()
+        }
+    
+    
+    def lex(self, line):
+        """ Return a tuple (kind, groups) where kind is the kind of the first rule matching line
+            and groups a dict mapping the named groups of its pattern to their value,
+            (None, None) if no rule match line."""
+        
+        match = self.regex.match(line)
+        if not match:
+            return None, None
+        
+        kind = match.lastgroup
+        names, indexes = self.groups[kind]
+        if len(indexes) == 1:
+            return kind, {names[0]: match.group(indexes[0])}
+        return kind, dict(zip(names, match.group(*indexes))) if indexes else {}
+
+
+
+class QueryCounter:
+    """ Context manager counting the queries executed on the database while it is active:
+        
+            with QueryCounter() as queries:
+                ...
+            print(queries.count)"""
+    
+    def __init__(self):
+        self.count = 0
+        self._wrapper = None
+    
+    
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+    
+    
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+    
+    
+    def __exit__(self, *args):
+        return self._wrapper.__exit__(*args)
+
+
+
+class LRUCache:
+    """ Thread-safe Least Recently Used cache.
+        
+        Entries are evicted, oldest first, once the sum of size(value) of the cached values
+        exceeds max_size (the number of entries by default). 'hits' and 'misses' are counted
+        by get()."""
+    
+    def __init__(self, max_size, size=lambda value: 1):
+        self.max_size = max_size
+        self.size = size
+        self.current_size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    
+    def __contains__(self, key):
+        return key in self._entries
+    
+    
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+    
+    
+    def set(self, key, value):
+        size = self.size(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_size -= self.size(self._entries.pop(key))
+            if size > self.max_size:
+                return
+            self._entries[key] = value
+            self.current_size += size
+            while self.current_size > self.max_size:
+                self.current_size -= self.size(self._entries.popitem(last=False)[1])
+    
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_size = 0
+    
+    
+    def stats(self):
+        """ Return a dictionnary containing the number of entries, their size, the hits, misses
+            and hit rate of the cache."""
+        
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'size': self.current_size,
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+
+BLOB_KEY = '__blob__'
+
+
+
+def split_blobs(obj, min_size):
+    """ Return a tuple (skeleton, blobs) where skeleton is a copy of obj in which every string
+        of at least min_size characters is replaced by {'__blob__': <sha1 of the string>}, and
+        blobs is a dictionnary mapping these sha1 to the strings."""
+    
+    blobs = dict()
+    
+    def split(obj):
+        if isinstance(obj, dict):
+            return {key: split(value) for key, value in obj.items()}
+        if isinstance(obj, list):
+            return [split(value) for value in obj]
+        if isinstance(obj, str) and len(obj) >= min_size:
+            sha1 = content_sha1(obj)
+            blobs[sha1] = obj
+            return {BLOB_KEY: sha1}
+        return obj
+    
+    return split(obj), blobs
+
+
+
+def blob_references(skeleton):
+    """ Return the set of the sha1 of the blobs referenced by skeleton."""
+    
+    if isinstance(skeleton, dict):
+        if len(skeleton) == 1 and BLOB_KEY in skeleton:
+            return {skeleton[BLOB_KEY]}
+        return set().union(*[blob_references(value) for value in skeleton.values()])
+    if isinstance(skeleton, list):
+        return set().union(*[blob_references(value) for value in skeleton])
+    return set()
+
+
+
+def join_blobs(skeleton, blobs):
+    """ Rebuild the object split by split_blobs(), blobs mapping the sha1 to their content."""
+    
+    if isinstance(skeleton, dict):
+        if len(skeleton) == 1 and BLOB_KEY in skeleton:
+            return blobs[skeleton[BLOB_KEY]]
+        return {key: join_blobs(value, blobs) for key, value in skeleton.items()}
+    if isinstance(skeleton, list):
+        return [join_blobs(value, blobs) for value in skeleton]
+    return skeleton
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from playexo.models import Activity, Answer
+from playexo.models import Activity, Answer, PLProgress
 
 @admin.register(Activity)
 class ActivityAdmin(admin.ModelAdmin):
@@ -9,3 +9,7 @@ class ActivityAdmin(admin.ModelAdmin):
 @admin.register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
     list_display=('user', 'pl', 'grade', 'seed', 'date')
+
+@admin.register(PLProgress)
+class PLProgressAdmin(admin.ModelAdmin):
+    list_display=('user', 'pl', 'best_grade', 'last_grade', 'attempts')
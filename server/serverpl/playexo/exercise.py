@@ -5,17 +5,22 @@
 #  Author: Coumes Quentin
 
 
-import json, timeout_decorator, time, traceback, htmlprint
+import json, timeout_decorator, time, traceback, hashlib, htmlprint
 
+from django.conf import settings
 from django.template import Template, RequestContext, Context
 
 from user_profile.enums import Role
 
 from loader.models import PLTP
+from loader.utils import LRUCache
 
-from playexo.models import Answer
+from playexo.models import Answer, PLProgress
+from playexo.enums import State
 from playexo.request import SandboxSession
 
+from sandbox.limits import LIMIT_GRADES
+
 
 lang = ['abap', 'abc', 'actionscript', 'ada', 'apache_conf', 'applescript', 'asciidoc', 'assembly_x86', 'autohotkey', 'batchfile', 'bro', 'c9search', 'c_cpp', 'cirru', 'clojure', 'cobol', 'coffee', 'coldfusion', 'csharp', 'csound_document', 'csound_orchestra', 'csound_score', 'css', 'curly', 'd', 'dart', 'diff', 'django', 'dockerfile', 'dot', 'drools', 'eiffel', 'ejs', 'elixir', 'elm', 'erlang', 'forth', 'fortran', 'ftl', 'gcode', 'gherkin', 'gitignore', 'glsl', 'gobstones', 'golang', 'graphqlschema', 'groovy', 'haml', 'handlebars', 'haskell', 'haskell_cabal', 'haxe', 'hjson', 'html', 'html_elixir', 'html_ruby', 'ini', 'io', 'jack', 'jade', 'java', 'javascript', 'json', 'jsoniq', 'jsp', 'jssm', 'jsx', 'julia', 'kotlin', 'latex', 'lean', 'less', 'liquid', 'lisp', 'live_script', 'livescript', 'logiql', 'lsl', 'lua', 'luapage', 'lucene', 'makefile', 'markdown', 'mask', 'matlab', 'maze', 'mel', 'mips_assembler', 'mipsassembler', 'mushcode', 'mysql', 'nix', 'nsis', 'objectivec', 'ocaml', 'pascal', 'perl', 'pgsql', 'php', 'pig', 'plain_text', 'powershell', 'praat', 'prolog', 'properties', 'protobuf', 'python', 'r', 'razor', 'rdoc', 'red', 'rhtml', 'rst', 'ruby', 'rust', 'sass', 'scad', 'scala', 'scheme', 'scss', 'sh', 'sjs', 'smarty', 'snippets', 'soy_template', 'space', 'sparql', 'sql', 'sqlserver', 'stylus', 'svg', 'swift', 'swig', 'tcl', 'tex', 'text', 'textile', 'toml', 'tsx', 'turtle', 'twig', 'typescript', 'vala', 'vbscript', 'velocity', 'verilog', 'vhdl', 'wollok', 'xml', 'xquery', 'yaml']
 default_load = '{% load static %}{% load markdown_deux_tags %}{% load input_fields_ajax %}{% load json_filter %}'
@@ -26,6 +31,21 @@ pls_known = [
     ('header_script', 'header_script'), ('buttons', 'buttons'),
 ]
 
+# Compiled templates of the exercises, by sha1 of their source
+TEMPLATE_CACHE = LRUCache(getattr(settings, 'EXERCISE_TEMPLATE_CACHE_SIZE', 512))
+
+
+
+def compile_template(source):
+    """ Return the Template compiled from source, it is only compiled again once evicted from
+        TEMPLATE_CACHE. Templates are not modified by Template.render(), and can thus be shared
+        by the requests of every thread."""
+    key = hashlib.sha1(source.encode()).hexdigest()
+    template = TEMPLATE_CACHE.get(key)
+    if template is None:
+        template = Template(source)
+        TEMPLATE_CACHE.set(key, template)
+    return template
 
 
 
@@ -40,11 +60,13 @@ class ActivityInstance:
             'pltp_sha1__'    : activity.pltp.sha1,
         }
         
+        self.new_seed = False
         if pl:
             seed = Answer.last_seed(pl, request.user)
             if 'oneshot' in pl.json or not seed:
                 seed = time.time()
-
+                self.new_seed = True
+            
             self.dic.update({
                 'pl_id__'   : pl.id,
                 'pl_name__' : pl.name,
@@ -56,21 +78,34 @@ class ActivityInstance:
     
     
     def evaluate(self, response):
+        """ Return the tuple (success, feedback) of the evaluation of response. The resources
+            used by the grader, if the answer was graded by a sandbox, are stored in self.metrics."""
+        self.metrics = None
         dic = self.intern_build()
         dic['response'] = response
         if 'evaluator' not in self.dic:
             try:
-                if 'timeout' in locals():
-                    sandbox_session = SandboxSession(self.dic, response['answer'], timeout=timeout)
-                else:
-                    sandbox_session = SandboxSession(self.dic, response['answer'])
-                    
+                # Limits of the execution, capped by the sandbox
+                limits = {key: self.dic[key] for key in ('timeout', 'memory') if key in self.dic}
+                sandbox_session = SandboxSession(self.dic, response['answer'], **limits)
+                
                 response = json.loads(sandbox_session.call())
+                self.metrics = response.get('metrics')
                 state = response['grade']
                 feedback = response['feedback']
-                if 'error' in response:
+                if response.get('error'):
                     feedback += '\n\n'+htmlprint.code(response['error'])
-                return (None, feedback) if state == "info" else (True, feedback) if state else (False, feedback)
+                if state == "info":
+                    return None, feedback
+                if not isinstance(state, (int, float)): # Grade of an incorrect grader
+                    return None, (feedback + "<br><br>/!\ ATTENTION: La note renvoyée par la fonction "
+                                  + "d'évaluation de cet exercice est invalide (" + repr(state)
+                                  + "), merci de prévenir votre professeur.")
+                if state in LIMIT_GRADES: # The answer breached a limit of the sandbox
+                    return False, feedback
+                if state < 0: # Error of the grader or of the sandbox
+                    return None, feedback
+                return (True, feedback) if state else (False, feedback)
             except KeyError as e:
                 return (
                     None,
@@ -116,8 +151,9 @@ class ActivityInstance:
     
     def get_context(self, request):
         pltp = PLTP.objects.get(sha1=self.dic['pltp_sha1__'])
+        states = PLProgress.states(request.user, pltp.pl.all())
         pl_list = list()
-        for item in pltp.pl.all():
+        for item in pltp.pl.only('id', 'title'):
             dic = self.intern_build()
             if 'pl_id__' in dic and item.id == dic['pl_id__']:
                 answer = Answer.last_answer(item, request.user)
@@ -126,13 +162,13 @@ class ActivityInstance:
             
             for key in ['text', 'texth', 'introduction', 'introductionh', "form", "title"]:
                 if key in dic:
-                    dic[key] = Template(dic[key]).render(Context(dic))
-                
-            state = Answer.pl_state(item, request.user)
+                    dic[key] = compile_template(dic[key]).render(Context(dic))
+            
+            state = states.get(item.id, State.NOT_STARTED)
             pl_list.append({
                 'id'   : item.id,
                 'state': state,
-                'title': item.json['title'],
+                'title': item.title,
             })
         
         context = RequestContext(request)
@@ -149,7 +185,7 @@ class ActivityInstance:
             for key, block_name in pls_known:
                 if key in self.dic:
                     raw += "{% block "+block_name+" %}{{ "+key+" }}{% endblock %}"
-            
+        
         return raw
     
     
@@ -157,10 +193,10 @@ class ActivityInstance:
         """ Return the rendered template for this PL """
         context = self.get_context(request)
         template = self.get_template()
-        return Template(template).render(context)
+        return compile_template(template).render(context)
+
+
 
-    
-    
 class PLInstance(ActivityInstance):
     """Used to run/evaluate a PL alone, uses evaluate() and intern_build() of ActivityInstance."""
     def __init__(self, pl_dic):
@@ -183,14 +219,14 @@ class PLInstance(ActivityInstance):
         
         for key in ['text', 'texth', 'introduction', 'introductionh', "form", "title"]:
             if key in dic:
-                dic[key] = Template(dic[key]).render(Context(dic))
+                dic[key] = compile_template(dic[key]).render(Context(dic))
         
         context.update(dic)
         return context
-        
-        
+    
+    
     def render(self, request):  
         """ Return the rendered template for this PL """
         context = self.get_context(request)
         template = self.get_template()
-        return Template(template).render(context)
+        return compile_template(template).render(context)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  grading.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import logging, threading, traceback, htmlprint
+
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction, connection
+from django.utils import timezone
+
+from playexo.models import Answer, GradingJob
+from playexo.exercise import PLInstance
+
+
+logger = logging.getLogger(__name__)
+
+
+
+def error_feedback():
+    """ Return the feedback sent to the user when the current exception prevented the grading."""
+    return ("Erreur lors de l'évaluation de votre réponse, si l'erreur persiste, "
+            + "merci de contacter votre professeur:<br>" + htmlprint.code(traceback.format_exc()))
+
+
+
+def grade(job_id):
+    """ Evaluate the GradingJob of id job_id and write the corresponding Answer.
+        
+        The job is only graded if it can be moved from PENDING to RUNNING, so that a job is never
+        graded twice even if it was submitted to several pools. If the Answer cannot be written,
+        the job is moved to DONE without answer and with an error as feedback, so that it is not
+        left RUNNING."""
+    
+    claimed = GradingJob.objects.filter(id=job_id, status=GradingJob.PENDING).update(
+        status=GradingJob.RUNNING, started=timezone.now()
+    )
+    if not claimed:
+        return
+    
+    try:
+        job = GradingJob.objects.get(id=job_id)
+        instance = PLInstance(job.exercise)
+        try:
+            success, feedback = instance.evaluate(job.inputs)
+        except Exception:
+            logger.exception("Grading job '" + str(job.id) + "' failed")
+            success, feedback = None, error_feedback()
+        
+        if success == None:
+            feedback_type, value = "info", -1
+        elif success:
+            feedback_type, value = "success", 100
+        else:
+            feedback_type, value = "fail", 0
+        
+        with transaction.atomic():
+            answer = Answer.objects.create(
+                value=job.inputs.get('answer', ""),
+                user_id=job.user_id,
+                pl_id=job.pl_id,
+                seed=job.exercise.get('seed'),
+                grade=value,
+                **Answer.metrics_fields(getattr(instance, 'metrics', None))
+            )
+            job.answer = answer
+            job.feedback_type = feedback_type
+            job.feedback = feedback
+            job.status = GradingJob.DONE
+            job.finished = timezone.now()
+            job.save()
+    except Exception:
+        logger.exception("Grading job '" + str(job_id) + "' could not be completed")
+        GradingJob.objects.filter(id=job_id, status=GradingJob.RUNNING).update(
+            status=GradingJob.DONE, feedback_type="info", feedback=error_feedback(), finished=timezone.now()
+        )
+        return
+    
+    logger.info("Grading job '" + str(job.id) + "' done in " + str((job.finished - job.started).total_seconds()) + "s")
+
+
+
+class GradingPool:
+    """ Pool of threads grading the GradingJob submitted by this process.
+        
+        The number of threads is set by settings.GRADING_WORKERS, if it is 0, jobs are graded
+        synchronously by submit(). When the pool starts, jobs left PENDING, or RUNNING for more
+        than settings.GRADING_JOB_TIMEOUT seconds (e.g. because the process grading them was
+        stopped), are submitted again. Afterwards, such a job is submitted again by resume() when
+        its status is polled."""
+    
+    def __init__(self):
+        self._executor = None
+        self._events = dict()
+        self._lock = threading.Lock()
+    
+    
+    @property
+    def workers(self):
+        return getattr(settings, 'GRADING_WORKERS', 4)
+    
+    
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                return self._executor, False
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='grading')
+        
+        timeout = getattr(settings, 'GRADING_JOB_TIMEOUT', 300)
+        GradingJob.objects.filter(
+            status=GradingJob.RUNNING, started__lt=timezone.now() - timedelta(seconds=timeout)
+        ).update(status=GradingJob.PENDING)
+        return self._executor, True
+    
+    
+    def _run(self, job_id):
+        try:
+            grade(job_id)
+        except Exception:
+            logger.exception("Grading job '" + str(job_id) + "' could not be completed")
+        finally:
+            connection.close() # Each thread has its own connection
+            with self._lock:
+                event = self._events.pop(str(job_id), None)
+            if event:
+                event.set()
+    
+    
+    def _enqueue(self, executor, job_id):
+        with self._lock:
+            self._events[str(job_id)] = threading.Event()
+        executor.submit(self._run, job_id)
+    
+    
+    def submit(self, job):
+        """ Queue the (saved) GradingJob job."""
+        
+        if not self.workers:
+            grade(job.id)
+            return
+        
+        executor, started = self._get_executor()
+        if started:
+            for job_id in GradingJob.objects.filter(status=GradingJob.PENDING).exclude(id=job.id) \
+                                            .values_list('id', flat=True):
+                self._enqueue(executor, job_id)
+        self._enqueue(executor, job.id)
+    
+    
+    def resume(self, job):
+        """ Submit job again if it is not handled by this pool and seems lost: PENDING for more than
+            settings.GRADING_PENDING_TIMEOUT seconds, or RUNNING for more than
+            settings.GRADING_JOB_TIMEOUT seconds. Return True if the job was submitted.
+            
+            Submitting a job handled by another process is harmless, as it is only graded once."""
+        
+        with self._lock:
+            if str(job.id) in self._events:
+                return False
+        
+        now = timezone.now()
+        if job.status == GradingJob.PENDING:
+            timeout = getattr(settings, 'GRADING_PENDING_TIMEOUT', 30)
+            if job.created >= now - timedelta(seconds=timeout):
+                return False
+        elif job.status == GradingJob.RUNNING:
+            timeout = getattr(settings, 'GRADING_JOB_TIMEOUT', 300)
+            if job.started >= now - timedelta(seconds=timeout):
+                return False
+            reset = GradingJob.objects.filter(id=job.id, status=GradingJob.RUNNING, started=job.started) \
+                                      .update(status=GradingJob.PENDING)
+            if not reset:
+                return False
+        else:
+            return False
+        
+        logger.warning("Grading job '" + str(job.id) + "' seems lost, submitting it again")
+        self.submit(job)
+        return True
+    
+    
+    def wait(self, job_id, timeout):
+        """ Wait at most timeout seconds for the job of id job_id to be graded by this pool.
+            Return False immediately if the job is not handled by this pool."""
+        
+        with self._lock:
+            event = self._events.get(str(job_id))
+        if event is None:
+            return False
+        event.wait(timeout)
+        return True
+
+
+
+GRADING_POOL = GradingPool()
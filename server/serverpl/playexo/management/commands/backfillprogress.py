@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  backfillprogress.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from playexo.models import Answer, PLProgress
+
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the progress of every user in every PL (PLProgress) from their answers, if answers "
+            + "were written without Answer.save(). The date a PL was started and the progress of the PL "
+            + "only displayed are kept.")
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=1000, help="Number of rows read and written at once")
+    
+    
+    def replace(self, rows):
+        """ Replace the existing progress of the same user and PL than rows by rows."""
+        keys = {(row.user_id, row.pl_id) for row in rows}
+        existing = PLProgress.objects.filter(
+            user_id__in={user for user, _ in keys}, pl_id__in={pl for _, pl in keys}
+        ).values_list('id', 'user_id', 'pl_id', 'started')
+        started = {(user, pl): (id, date) for id, user, pl, date in existing if (user, pl) in keys}
+        
+        for row in rows:
+            id, date = started.get((row.user_id, row.pl_id), (None, None))
+            if date is not None and date < row.started:
+                row.started = date
+        PLProgress.objects.filter(id__in=[id for id, _ in started.values()]).delete()
+        PLProgress.objects.bulk_create(rows)
+    
+    
+    def handle(self, *args, **options):
+        batch = options['batch']
+        rows = list()
+        current = None
+        rebuilt = 0
+        answers = Answer.objects.defer('metrics').order_by('user_id', 'pl_id', 'date', 'id')
+        
+        with transaction.atomic():
+            for answer in answers.iterator(chunk_size=batch):
+                if current is None or (current.user_id, current.pl_id) != (answer.user_id, answer.pl_id):
+                    current = PLProgress(user_id=answer.user_id, pl_id=answer.pl_id)
+                    rebuilt += 1
+                    rows.append(current)
+                    if len(rows) > batch:
+                        self.replace(rows[:-1])
+                        rows = rows[-1:]
+                current.add(answer)
+            self.replace(rows)
+            
+            self.stdout.write(str(rebuilt) + " progress rebuilt from " + str(answers.count()) + " answers")
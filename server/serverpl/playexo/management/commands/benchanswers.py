@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  benchanswers.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import os, time, random
+
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import transaction, connection
+from django.utils import timezone
+
+from loader.models import PL
+from playexo.models import Answer, PLProgress
+
+
+
+def materialized(answers, field):
+    """ Former pattern of the helpers of Answer: evaluates the whole queryset."""
+    return None if not answers else getattr(answers[0], field)
+
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the lookups of the last answer of a user for a PL, by the (user, pl, -date) index, "
+            + "and of the highest grade, from PLProgress, on a table seeded with ANSWERS answers. Data "
+            + "are created in a transaction which is rolled back.")
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--answers', type=int, default=1000000, help="Number of answers seeded")
+        parser.add_argument('--users', type=int, default=2000, help="Number of users answering")
+        parser.add_argument('--pl', type=int, default=50, help="Number of PL answered")
+        parser.add_argument('--lookups', type=int, default=1000, help="Number of (user, PL) looked up per measure")
+        parser.add_argument('--batch', type=int, default=10000, help="Number of answers inserted at once")
+    
+    
+    def populate(self, answers, users, pls, batch):
+        User.objects.bulk_create([
+            User(username='__benchanswers__' + str(i), password='!') for i in range(users)
+        ])
+        user_ids = list(User.objects.filter(username__startswith='__benchanswers__').values_list('id', flat=True))
+        pl_ids = list()
+        for i in range(pls):
+            pl = PL(name='__benchanswers__', rel_path='pl' + str(i) + '.pl', json={'title': 'Exercise ' + str(i)})
+            pl.save()
+            pl_ids.append(pl.id)
+        
+        start = timezone.now() - timedelta(days=365)
+        rows = list()
+        for i in range(answers):
+            rows.append(Answer(
+                user_id=random.choice(user_ids), pl_id=random.choice(pl_ids),
+                value='' if not i % 5 else "def f(x):\n    return x\n",
+                seed=str(random.random()), grade=random.choice([-1, 0, 0, 50, 100]),
+                date=start + timedelta(seconds=i),
+            ))
+            if len(rows) >= batch:
+                Answer.objects.bulk_create(rows)
+                rows = list()
+        Answer.objects.bulk_create(rows)
+        
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE playexo_answer")
+        return user_ids, pl_ids
+    
+    
+    def measure(self, lookup, pairs):
+        latencies = list()
+        for user_id, pl_id in pairs:
+            start = time.perf_counter()
+            lookup(user_id, pl_id)
+            latencies.append(time.perf_counter() - start)
+        return sum(latencies) / len(latencies), percentile(latencies, 99)
+    
+    
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            start = time.perf_counter()
+            user_ids, pl_ids = self.populate(options['answers'], options['users'], options['pl'], options['batch'])
+            self.stdout.write(str(options['answers']) + " answers seeded in %.1f s" % (time.perf_counter() - start))
+            
+            start = time.perf_counter()
+            call_command('backfillprogress', stdout=open(os.devnull, 'w'))
+            self.stdout.write("PLProgress rebuilt in %.1f s" % (time.perf_counter() - start))
+            
+            pairs = [(random.choice(user_ids), random.choice(pl_ids)) for _ in range(options['lookups'])]
+            answers = lambda u, p: Answer.objects.filter(user_id=u, pl_id=p)
+            progress = lambda u, p: PLProgress.objects.filter(user_id=u, pl_id=p)
+            results = [
+                ("queryset, answers[0] (-date)", lambda u, p:
+                    materialized(answers(u, p).order_by('-date'), 'seed')),
+                ("values_list().first() (-date)", lambda u, p:
+                    answers(u, p).order_by('-date').values_list('seed', flat=True).first()),
+                ("PLProgress", lambda u, p: progress(u, p).values_list('best_grade', flat=True).first()),
+            ]
+            
+            self.stdout.write("%-32s %10s %10s" % ("lookup", "mean (ms)", "p99 (ms)"))
+            for name, lookup in results:
+                mean, p99 = self.measure(lookup, pairs)
+                self.stdout.write("%-32s %10.3f %10.3f" % (name, mean * 1000, p99 * 1000))
+            
+            transaction.set_rollback(True)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  benchsandbox.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import time, json, hashlib, requests
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from requests.adapters import HTTPAdapter
+
+from playexo.request import make_tar
+
+
+GRADER = """import json
+print(json.dumps({'success': True, 'feedback': 'ok'}))
+"""
+
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+
+class Command(BaseCommand):
+    help = ("Measure the latency of requests sent to a sandbox with a new connection per request "
+            + "and with the connections kept alive by a requests.Session. The environment is "
+            + "identified by its 'env_hash', and only sent when the sandbox answers 412.")
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default="http://127.0.0.1:8000/sandbox/?action=execute",
+                            help="URL of the sandbox (default: the local sandbox)")
+        parser.add_argument('--requests', type=int, default=200, help="Number of requests per mode")
+        parser.add_argument('--concurrency', type=int, default=1, help="Number of requests in flight")
+    
+    
+    def run(self, post, url, count, concurrency):
+        tar = make_tar({'grader.py': GRADER, 'pl.json': '{}'})
+        data = {'execution_timeout': 5, 'env_hash': hashlib.sha1(tar).hexdigest()}
+        
+        def one(i):
+            start = time.perf_counter()
+            response = post(url, data=data, timeout=10)
+            if response.status_code == 412: # Environment not in the cache of the sandbox
+                response = post(url, data=data, files={'environment.tgz': tar}, timeout=10)
+            response.raise_for_status()
+            json.loads(response.text)
+            return time.perf_counter() - start
+        
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(one, range(count)))
+        return latencies, time.perf_counter() - start
+    
+    
+    def handle(self, *args, **options):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(options['concurrency'],
+                                                                   getattr(settings, 'SANDBOX_HTTP_POOL_SIZE', 10)))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        
+        self.stdout.write(str(options['requests']) + " requests to '" + options['url'] + "', "
+                          + str(options['concurrency']) + " in flight")
+        for name, post in [("new connection", requests.post), ("keep-alive", session.post)]:
+            latencies, total = self.run(post, options['url'], options['requests'], options['concurrency'])
+            self.stdout.write("%-15s p50 %7.1f ms   p99 %7.1f ms   %7.1f requests/s" % (
+                name, percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000, len(latencies) / total
+            ))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  gradingcost.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum, Avg, Max
+from django.utils import timezone
+
+from loader.models import PL
+
+from playexo.models import Answer
+
+
+
+class Command(BaseCommand):
+    help = ("List the PL whose graders used the most CPU time, according to the metrics returned "
+            + "by the sandboxes and stored with the answers.")
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help="Only count the answers of the last DAYS days")
+        parser.add_argument('--top', type=int, default=20, help="Number of PL listed")
+        parser.add_argument('--order', choices=['total', 'mean', 'max'], default='total',
+                            help="Sort by total, mean or maximum CPU time per answer")
+    
+    
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        rows = list(
+            Answer.objects.filter(cpu_time__isnull=False, date__gte=since)
+                          .values('pl')
+                          .annotate(answers=Count('id'), total=Sum('cpu_time'), mean=Avg('cpu_time'),
+                                    max=Max('cpu_time'))
+                          .order_by('-' + options['order'])[:options['top']]
+        )
+        pls = PL.objects.only('id', 'title', 'rel_path').in_bulk([row['pl'] for row in rows])
+        
+        self.stdout.write("%8s %10s %10s %10s  %s" % ("answers", "total (s)", "mean (s)", "max (s)", "PL"))
+        for row in rows:
+            pl = pls.get(row['pl'])
+            name = (pl.title or pl.rel_path) + " (" + str(pl.id) + ")" if pl else str(row['pl'])
+            self.stdout.write("%8d %10.2f %10.3f %10.3f  %s" % (
+                row['answers'], row['total'], row['mean'], row['max'], name
+            ))
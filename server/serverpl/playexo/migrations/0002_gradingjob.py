@@ -0,0 +1,37 @@
+# Generated by Django 2.0.4 on 2018-06-20 14:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import jsonfield.fields
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('loader', '0004_pl_summary'),
+        ('playexo', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradingJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('exercise', jsonfield.fields.JSONField()),
+                ('inputs', jsonfield.fields.JSONField()),
+                ('status', models.CharField(choices=[('PE', 'En attente'), ('RU', 'En cours'), ('DO', 'Terminé')], db_index=True, default='PE', max_length=2)),
+                ('feedback_type', models.CharField(blank=True, default='', max_length=20)),
+                ('feedback', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started', models.DateTimeField(null=True)),
+                ('finished', models.DateTimeField(null=True)),
+                ('answer', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='playexo.Answer')),
+                ('pl', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='loader.PL')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
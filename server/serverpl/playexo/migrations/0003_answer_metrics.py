@@ -0,0 +1,24 @@
+# Generated by Django 2.0.4 on 2018-06-22 10:12
+
+from django.db import migrations, models
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playexo', '0002_gradingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='cpu_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='metrics',
+            field=jsonfield.fields.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.0.4 on 2018-06-25 09:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('loader', '0004_pl_summary'),
+        ('playexo', '0003_answer_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PLProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('best_grade', models.IntegerField(null=True)),
+                ('last_grade', models.IntegerField(null=True)),
+                ('last_seed', models.CharField(max_length=50, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_answer', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='playexo.Answer')),
+                ('pl', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='loader.PL')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='plprogress',
+            unique_together={('user', 'pl')},
+        ),
+    ]
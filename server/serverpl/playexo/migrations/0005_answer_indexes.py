@@ -0,0 +1,17 @@
+# Generated by Django 2.0.4 on 2018-06-25 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playexo', '0004_plprogress'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['user', 'pl', '-date'], name='playexo_ans_user_id_871de6_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 2.0.4 on 2018-06-26 11:02
+
+from django.db import migrations, models
+
+
+def compact_visits(apps, schema_editor):
+    """ Rebuild PLProgress from every answer, visits included so that their date and seed are kept,
+        then delete the visits.
+        
+        Visits are the empty answers of grade -1 without metrics that no GradingJob references.
+        An answer left empty whose grader failed before the sandbox returned metrics matches too:
+        it holds neither a value nor a grade, its date and seed are kept in PLProgress like those
+        of the visits. Every answer left is then a submission, handled the same way by
+        backfillprogress."""
+    Answer = apps.get_model('playexo', 'Answer')
+    GradingJob = apps.get_model('playexo', 'GradingJob')
+    PLProgress = apps.get_model('playexo', 'PLProgress')
+    
+    graded = set(GradingJob.objects.filter(answer__value='', answer__grade=-1).values_list('answer_id', flat=True))
+    is_visit = lambda answer: (answer.value == '' and answer.grade == -1 and answer.metrics is None
+                               and answer.id not in graded)
+    
+    PLProgress.objects.all().delete()
+    rows = list()
+    current = None
+    answers = Answer.objects.only('id', 'user_id', 'pl_id', 'value', 'seed', 'date', 'grade', 'metrics')
+    for answer in answers.order_by('user_id', 'pl_id', 'date', 'id').iterator(chunk_size=1000):
+        if current is None or (current.user_id, current.pl_id) != (answer.user_id, answer.pl_id):
+            current = PLProgress(user_id=answer.user_id, pl_id=answer.pl_id, started=answer.date)
+            rows.append(current)
+            if len(rows) > 1000:
+                PLProgress.objects.bulk_create(rows[:-1])
+                rows = rows[-1:]
+        current.last_seed = answer.seed
+        if is_visit(answer):
+            continue
+        if current.best_grade is None or answer.grade > current.best_grade:
+            current.best_grade = answer.grade
+        current.last_grade = answer.grade
+        if answer.value:
+            current.last_answer_id = answer.id
+            current.attempts += 1
+    PLProgress.objects.bulk_create(rows)
+    
+    Answer.objects.filter(value='', grade=-1, metrics__isnull=True).exclude(id__in=graded).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playexo', '0005_answer_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plprogress',
+            name='started',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(compact_visits, migrations.RunPython.noop),
+    ]
@@ -6,11 +6,16 @@
 #  Copyright 2018 Coumes Quentin <qcoumes@etud.u-pem.fr>
 #  
 
+import uuid
+
 from datetime import datetime
 
 from enumfields import EnumIntegerField
+from jsonfield import JSONField
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -45,13 +50,19 @@ class ActivityTest(models.Model):
                 activity.delete()
             else:
                 break
-                
-        
+    
+    
     def __str__(self):
         return self.name
 
 
 class Answer(models.Model):
+    """ An answer of a user to a PL, answers are only appended. Saving a new answer also updates
+        the PLProgress of its user and PL in the same transaction (QuerySet.bulk_create() does not,
+        see the backfillprogress command).
+        
+        Displaying a PL does not write an answer, it is recorded by PLProgress.visit()."""
+    
     STARTED = 'ST'
     FAILED = 'FA'
     SUCCEEDED = 'SU'
@@ -68,36 +79,60 @@ class Answer(models.Model):
     seed = models.CharField(max_length=50, null=True)
     date = models.DateTimeField(null=False, default=timezone.now)
     grade = models.IntegerField(null=False)
+    # Resources used by the grader, as given in the 'metrics' of the response of the sandbox
+    metrics = JSONField(null=True, blank=True)
+    cpu_time = models.FloatField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Answers of a user for a PL by date (strategy.py, backfillprogress)
+            models.Index(fields=['user', 'pl', '-date']),
+        ]
+    
+    
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super(Answer, self).save(*args, **kwargs)
+            if adding:
+                PLProgress.record(self)
+    
+    
+    @staticmethod
+    def metrics_fields(metrics):
+        """ Return the fields of an Answer corresponding to the 'metrics' returned by the sandbox
+            (None if the answer was not graded by a sandbox)."""
+        if not metrics:
+            return {}
+        return {
+            'metrics': metrics,
+            'cpu_time': metrics.get('user_time', 0) + metrics.get('sys_time', 0),
+        }
     
     
     @staticmethod
     def last_seed(pl, user):
-        answers = Answer.objects.filter(pl=pl, user=user).order_by("-date")
-        return None if not answers else answers[0].seed
+        return PLProgress.objects.filter(pl=pl, user=user).values_list('last_seed', flat=True).first()
     
     
     @staticmethod
     def last_answer(pl, user):
-        answers = Answer.objects.filter(pl=pl, user=user).order_by("-date")
-        if not answers:
-            return None
-        for answer in [i.value for i in answers]:
-            if answer:
-                return answer
-        return None
+        """Return the value of the last non-empty answer, None if there is none."""
+        return PLProgress.objects.filter(pl=pl, user=user).values_list('last_answer__value', flat=True).first()
     
     
     @staticmethod
     def pl_state(pl, user):
-        """Return the state of the answer with the highest grade."""
-        answers = Answer.objects.filter(user=user, pl=pl).order_by("-grade")
-        return State.by_grade(None if not answers else answers[0].grade)
+        """Return the state of the answer with the highest grade, STARTED if the PL was only displayed."""
+        progress = PLProgress.objects.filter(pl=pl, user=user).values_list('best_grade', 'started').first()
+        return State.NOT_STARTED if progress is None else PLProgress.state(*progress)
     
     
     @staticmethod
     def pltp_state(pltp, user):
         """Return a list of tuples (pl_id, state) where state follow pl_state() rules."""
-        return [(pl.id, Answer.pl_state(pl, user)) for pl in pltp.pl.all()] 
+        states = PLProgress.states(user, pltp.pl.all())
+        return [(pl.id, states.get(pl.id, State.NOT_STARTED)) for pl in pltp.pl.only('id')] 
     
     
     @staticmethod
@@ -121,11 +156,9 @@ class Answer(models.Model):
             State.NOT_STARTED: [0.0, 0],
         }
         
-        for pl in pltp.pl.all():
-            state[
-                State.STARTED if Answer.pl_state(pl, user) in [State.TEACHER_EXC, State.SANDBOX_EXC] else Answer.pl_state(pl, user)
-                ][1] += 1
-            
+        for _, pl_state in Answer.pltp_state(pltp, user):
+            state[State.STARTED if pl_state in [State.TEACHER_EXC, State.SANDBOX_EXC] else pl_state][1] += 1
+        
         nb_pl = sum([state[k][1] for k in state]) 
         nb_pl = 1 if not nb_pl else nb_pl
         
@@ -171,7 +204,7 @@ class Answer(models.Model):
                 'not_started': [ % not started, nbr not started],
             }
         """
-    
+        
         state = {
             State.SUCCEEDED:   [0.0, 0],
             State.PART_SUCC:   [0.0, 0],
@@ -192,3 +225,129 @@ class Answer(models.Model):
             state[k] = [str(state[k][1]*100/nb_pl), str(state[k][1])]
         
         return state
+
+
+
+class PLProgress(models.Model):
+    """ Progress of a user in a PL, denormalized from its answers so that reading it does not
+        scan the answers: highest and last grade, last seed, last non-empty answer and number of
+        non-empty answers (attempts). started is the date the PL was first displayed or answered.
+        
+        Rows are updated by Answer.save() and visit(), and rebuilt from the answers by the
+        backfillprogress command."""
+    
+    user = models.ForeignKey(User, null=False, on_delete=models.CASCADE)
+    pl = models.ForeignKey(PL, null=False, on_delete=models.CASCADE)
+    best_grade = models.IntegerField(null=True)
+    last_grade = models.IntegerField(null=True)
+    last_seed = models.CharField(max_length=50, null=True)
+    last_answer = models.ForeignKey(Answer, null=True, on_delete=models.SET_NULL, related_name='+')
+    attempts = models.IntegerField(null=False, default=0)
+    started = models.DateTimeField(null=True)
+    
+    
+    class Meta:
+        unique_together = ('user', 'pl')
+    
+    
+    def __str__(self):
+        return str(self.user) + " - " + str(self.pl_id) + ": " + str(self.best_grade)
+    
+    
+    def add(self, answer):
+        """ Update this progress with answer, which must be more recent than the answers already
+            added."""
+        if self.best_grade is None or answer.grade > self.best_grade:
+            self.best_grade = answer.grade
+        self.last_grade = answer.grade
+        self.last_seed = answer.seed
+        if self.started is None or answer.date < self.started:
+            self.started = answer.date
+        if answer.value:
+            self.last_answer_id = answer.id
+            self.attempts += 1
+    
+    
+    @staticmethod
+    def record(answer):
+        """ Add the newly saved answer to the progress of its user and PL. The row is locked until
+            the end of the current transaction so that concurrent answers are all counted."""
+        progress, _ = PLProgress.objects.select_for_update().get_or_create(
+            user_id=answer.user_id, pl_id=answer.pl_id
+        )
+        progress.add(answer)
+        progress.save()
+        return progress
+    
+    
+    @staticmethod
+    def visit(user, pl, seed):
+        """ Record that user displayed pl with seed, which is then given back by
+            Answer.last_seed(). A single UPDATE once the row exists."""
+        now = timezone.now()
+        updated = PLProgress.objects.filter(user=user, pl=pl).update(
+            last_seed=seed, started=Coalesce('started', Value(now, output_field=models.DateTimeField()))
+        )
+        if not updated:
+            PLProgress.objects.get_or_create(user=user, pl=pl, defaults={'last_seed': seed, 'started': now})
+    
+    
+    @staticmethod
+    def state(best_grade, started):
+        """Return the State of a progress, a PL displayed but never answered being STARTED."""
+        if best_grade is None and started is not None:
+            return State.STARTED
+        return State.by_grade(best_grade)
+    
+    
+    @staticmethod
+    def states(user, pl):
+        """ Return a dict {pl_id: State} of user for the PL pl (a queryset or a list of id), PL
+            never displayed being absent."""
+        rows = PLProgress.objects.filter(user=user, pl__in=pl).values_list('pl_id', 'best_grade', 'started')
+        return {pl_id: PLProgress.state(grade, started) for pl_id, grade, started in rows}
+
+
+
+class GradingJob(models.Model):
+    """ An answer waiting to be graded by playexo.grading.
+        
+        'exercise' is the dictionnary of the exercise (as stored in the session) and 'inputs' the
+        inputs submitted by the user. Once graded, 'answer' points to the Answer written and
+        'feedback_type' / 'feedback' hold what is sent back to the user."""
+    
+    PENDING = 'PE'
+    RUNNING = 'RU'
+    DONE = 'DO'
+    STATUS = (
+        (PENDING, 'En attente'),
+        (RUNNING, 'En cours'),
+        (DONE, 'Terminé'),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, null=False, on_delete=models.CASCADE)
+    pl = models.ForeignKey(PL, null=False, on_delete=models.CASCADE)
+    exercise = JSONField()
+    inputs = JSONField()
+    status = models.CharField(max_length=2, choices=STATUS, default=PENDING, db_index=True)
+    feedback_type = models.CharField(max_length=20, blank=True, default='')
+    feedback = models.TextField(blank=True, default='')
+    answer = models.ForeignKey(Answer, null=True, on_delete=models.SET_NULL)
+    created = models.DateTimeField(null=False, default=timezone.now)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    
+    
+    def __str__(self):
+        return str(self.id) + " (" + self.get_status_display() + ")"
+    
+    
+    def to_dict(self):
+        """ Return the status of the job as sent to the client."""
+        return {
+            'job': str(self.id),
+            'status': self.status,
+            'feedback_type': self.feedback_type,
+            'feedback': self.feedback,
+        }
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  progress.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+from collections import OrderedDict
+
+from loader.models import PLTP
+
+from playexo.models import PLProgress
+from playexo.enums import State
+
+
+
+def summarize(states):
+    """ Return the completion of states (an iterable of State) in the format of
+        Answer.pltp_summary(): {State: [% of the states, number of states]}, as strings.
+        TEACHER_EXC and SANDBOX_EXC are counted as STARTED."""
+    
+    summary = OrderedDict((key, 0) for key in (
+        State.SUCCEEDED, State.PART_SUCC, State.FAILED, State.STARTED, State.NOT_STARTED
+    ))
+    for state in states:
+        summary[State.STARTED if state in [State.TEACHER_EXC, State.SANDBOX_EXC] else state] += 1
+    
+    total = sum(summary.values()) or 1
+    return OrderedDict((k, [str(v * 100 / total), str(v)]) for k, v in summary.items())
+
+
+
+class CourseProgress:
+    """ Progress of the users of a course in every PL of its activities.
+        
+        The highest grade of every (user, PL) is read from PLProgress for the whole course by a
+        single query, the PL of the activities being read with another one, so that the number of
+        queries does not depend on the number of students, activities or PL. Every method then
+        reads the matrix built in memory.
+        
+        users default to the students of the course and activities to its activities, restrict
+        them (e.g. to [request.user]) when only some of them are displayed."""
+    
+    def __init__(self, course, users=None, activities=None):
+        if activities is None:
+            activities = course.activity.all().select_related('pltp').order_by('id')
+        self.activities = list(activities)
+        self.users = list(course.student.all() if users is None else users)
+        
+        # PL of every activity, in the order they were added to its PLTP
+        self.pl = OrderedDict((activity.pltp_id, list()) for activity in self.activities)
+        rows = (PLTP.pl.through.objects.filter(pltp__in=list(self.pl))
+                                       .values_list('pltp_id', 'pl_id', 'pl__title')
+                                       .order_by('id'))
+        for pltp_id, pl_id, title in rows:
+            self.pl[pltp_id].append((pl_id, title))
+        
+        pl_ids = {pl_id for pl in self.pl.values() for pl_id, _ in pl}
+        self.grades = dict()
+        self.states = dict()
+        if self.users and pl_ids:
+            rows = (PLProgress.objects.filter(user__in=[user.id for user in self.users], pl__in=pl_ids)
+                                      .values_list('user_id', 'pl_id', 'best_grade', 'started'))
+            for user, pl, grade, started in rows:
+                self.grades[(user, pl)] = grade
+                self.states[(user, pl)] = PLProgress.state(grade, started)
+    
+    
+    def grade(self, user, pl_id):
+        """ Return the highest grade of user for the PL of id pl_id, None if user never answered it."""
+        return self.grades.get((user.id, pl_id))
+    
+    
+    def state(self, user, pl_id):
+        """ Same as Answer.pl_state()."""
+        return self.states.get((user.id, pl_id), State.NOT_STARTED)
+    
+    
+    def activity_states(self, user, activity):
+        """ Return the list of (pl_id, title, state) of every PL of activity for user."""
+        return [(pl_id, title, self.state(user, pl_id)) for pl_id, title in self.pl[activity.pltp_id]]
+    
+    
+    def activity_summary(self, user, activity):
+        """ Same as Answer.pltp_summary()."""
+        return summarize(state for _, _, state in self.activity_states(user, activity))
+    
+    
+    def course_summary(self, user):
+        """ Same as Answer.user_course_summary()."""
+        return summarize(
+            state for activity in self.activities for _, _, state in self.activity_states(user, activity)
+        )
+    
+    
+    def matrix(self):
+        """ Return the list of (user, [Answer.pltp_summary() of every activity]) of every user."""
+        return [
+            (user, [self.activity_summary(user, activity) for activity in self.activities])
+            for user in self.users
+        ]
@@ -7,75 +7,328 @@
 # 
 
 
-import logging, tempfile, io, tarfile, json, os, hashlib, requests, traceback, htmlprint
+import logging, io, gzip, tarfile, json, os, hashlib, requests, traceback, htmlprint, threading, time
+
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+from django.db import connection
 
 from serverpl.settings import DEBUG
 from sandbox.models import Sandbox
+from sandbox.limits import Limits
 
 logger = logging.getLogger(__name__)
 
 
-def get_sandbox():
-    """ Return the first available sandbox.
-        Raise NotImplementedError if not sandbox could be found."""
+class SandboxNode:
+    """ State of a sandbox as seen by this process."""
+    
+    def __init__(self, sandbox):
+        self.url = sandbox.url
+        self.name = sandbox.name
+        self.priority = sandbox.priority
+        self.up = True
+        self.failures = 0        # Consecutive failures
+        self.down_until = 0.0    # Time before which the sandbox will not be tried again
+        self.busy_until = 0.0    # Time before which the sandbox said it could not accept requests
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.last_latency = None
+        self.last_error = None
+        self.last_check = None
+        
+        # Connections to the sandbox are kept alive and reused by every request of this process
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=getattr(settings, 'SANDBOX_HTTP_POOL_SIZE', 10))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    
+    def __str__(self):
+        return self.name + " - " + self.url + " - " + str(self.priority)
+    
     
-    sandboxes = Sandbox.objects.all().order_by("priority")
-    if not sandboxes:
-        raise NotImplementedError("No sandbox has been added to the database. Add one throught Administration -> Sandbox -> New")
+    def stats(self):
+        return {
+            'name': self.name,
+            'url': self.url,
+            'priority': self.priority,
+            'up': self.up,
+            'failures': self.failures,
+            'retry_in': max(0.0, self.down_until - time.time()) if not self.up else 0.0,
+            'busy_for': max(0.0, self.busy_until - time.time()),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'errors': self.errors,
+            'mean_latency': self.total_latency / self.requests if self.requests else None,
+            'last_latency': self.last_latency,
+            'last_error': self.last_error,
+            'last_check': self.last_check,
+        }
+
+
+
+class SandboxPool:
+    """ Keep track of the liveness and load of the sandboxes of the database.
+        
+        A background thread checks the sandboxes every settings.SANDBOX_CHECK_INTERVAL seconds
+        with a HEAD request. A sandbox failing a check or a request is marked as down and is not
+        tried again before an exponential back-off (SANDBOX_BACKOFF_BASE * 2^(failures-1), at most
+        SANDBOX_BACKOFF_MAX seconds) has elapsed.
+        
+        choose() returns the available sandbox with the highest priority, the one with the fewest
+        requests in flight amongst those sharing that priority. Sandboxes which answered 429 or
+        503 (saturated) are only chosen if every available one is, until their Retry-After elapsed.
+        The list of sandboxes is read again from the database every SANDBOX_REFRESH_INTERVAL
+        seconds."""
+    
+    def __init__(self):
+        self.nodes = dict()
+        self._lock = threading.Lock()
+        self._refreshed = 0.0
+        self._checker = None
+    
+    
+    def _setting(self, name, default):
+        return getattr(settings, name, default)
+    
+    
+    def refresh(self, force=False):
+        """ Synchronize the nodes with the Sandbox table, keeping the state of known sandboxes."""
+        
+        if not force and time.time() - self._refreshed < self._setting('SANDBOX_REFRESH_INTERVAL', 60):
+            return
+        sandboxes = list(Sandbox.objects.all())
+        with self._lock:
+            nodes = dict()
+            for sandbox in sandboxes:
+                node = self.nodes.get(sandbox.url) or SandboxNode(sandbox)
+                node.name, node.priority = sandbox.name, sandbox.priority
+                nodes[sandbox.url] = node
+            for url, node in self.nodes.items():
+                if url not in nodes:
+                    node.session.close()
+            self.nodes = nodes
+            self._refreshed = time.time()
     
-    tried = "Tried sandboxes:<br>"
-    for sandbox in sandboxes:
+    
+    def mark_up(self, node):
+        with self._lock:
+            if not node.up:
+                logger.info("Sandbox '" + str(node) + "' is up again")
+            node.up = True
+            node.failures = 0
+            node.down_until = 0.0
+    
+    
+    def mark_down(self, node, error):
+        with self._lock:
+            node.failures += 1
+            delay = min(self._setting('SANDBOX_BACKOFF_BASE', 1) * 2 ** (node.failures - 1),
+                        self._setting('SANDBOX_BACKOFF_MAX', 300))
+            node.down_until = time.time() + delay
+            node.last_error = error
+            if node.up:
+                logger.warning("Sandbox '" + str(node) + "' is down: " + error)
+            node.up = False
+    
+    
+    def busy(self, node, retry_after):
+        """ Mark node as saturated for retry_after seconds (value of the Retry-After header, 1 if
+            it is missing or is not a number of seconds). Return the delay used."""
+        
         try:
-            r = requests.head(sandbox.url, timeout=0.5)
+            delay = max(1, int(retry_after))
+        except (TypeError, ValueError):
+            delay = 1
+        with self._lock:
+            node.busy_until = time.time() + delay
+        logger.info("Sandbox '" + str(node) + "' is saturated for " + str(delay) + "s")
+        return delay
+    
+    
+    def probe(self, node):
+        """ Send a HEAD request to node and update its state. Return True if it is up."""
+        
+        start = time.time()
+        try:
+            r = node.session.head(node.url, timeout=self._setting('SANDBOX_CHECK_TIMEOUT', 0.5))
+            node.last_check = time.time()
+            node.last_latency = node.last_check - start
             if r.status_code == 200:
-                break
-            tried += "- "+str(sandbox)+"(code received: "+str(r.status_code)+")<br>"
+                self.mark_up(node)
+                return True
+            self.mark_down(node, "code received: " + str(r.status_code))
         except Exception as e:
-            if DEBUG:   
-                tried += "- "+str(sandbox)+"<br>"+"DEBUG:<br>"+str(e)
-            else:
-                tried += "- "+str(sandbox)+"<br>"
-            pass
-    else:
-        logger.warning("Couldn't join any sandbox of the database")
-        raise NotImplementedError("Couldn't join any sandbox of the database.<br><br>"+str(tried))
-    return sandbox
-
-
-
-def make_tar(files):
-    with tempfile.TemporaryDirectory() as tmp_dir, tempfile.TemporaryDirectory() as env_dir:
-        with tarfile.open(tmp_dir + "/environment.tgz", "w:gz") as tar:
-            for key in files:
-                with open(env_dir + "/" + key, "w") as f:
-                    print(files[key], file=f)
-                    
-                tar.add(env_dir, arcname=os.path.sep)
-            
-        with open(tmp_dir + "/environment.tgz", 'rb') as tar:
-                tar_stream = tar.read()
+            node.last_check = time.time()
+            self.mark_down(node, str(type(e).__name__) + ": " + str(e))
+        return False
+    
+    
+    def check(self):
+        """ Probe every node which is up, or which is down and whose back-off elapsed."""
+        
+        self.refresh()
+        now = time.time()
+        for node in list(self.nodes.values()):
+            if node.up or node.down_until <= now:
+                self.probe(node)
+    
+    
+    def _run_checker(self):
+        while True:
+            time.sleep(self._setting('SANDBOX_CHECK_INTERVAL', 10))
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Error while checking the sandboxes")
+            finally:
+                connection.close()
+    
+    
+    def start(self):
+        """ Start the background checker if it is not already running."""
+        
+        with self._lock:
+            if self._checker is None and self._setting('SANDBOX_CHECK_INTERVAL', 10):
+                self._checker = threading.Thread(target=self._run_checker, name='sandbox-checker', daemon=True)
+                self._checker.start()
+    
+    
+    def choose(self, exclude=()):
+        """ Return the SandboxNode which should receive the next request.
+            Raise NotImplementedError if no sandbox is available."""
+        
+        self.start()
+        self.refresh()
+        if not self.nodes:
+            raise NotImplementedError("No sandbox has been added to the database. Add one throught Administration -> Sandbox -> New")
+        
+        nodes = [node for node in self.nodes.values() if node.url not in exclude]
+        available = [node for node in nodes if node.up]
+        if not available:
+            # Every sandbox is down, try those whose back-off elapsed
+            now = time.time()
+            for node in sorted(nodes, key=lambda n: n.priority):
+                if node.down_until <= now and self.probe(node):
+                    available = [node]
+                    break
+        if not available:
+            tried = "".join("- " + str(node) + " (" + str(node.last_error) + ")<br>" for node in nodes)
+            logger.warning("Couldn't join any sandbox of the database")
+            raise NotImplementedError("Couldn't join any sandbox of the database.<br><br>Tried sandboxes:<br>" + tried)
+        
+        now = time.time()
+        available = [node for node in available if node.busy_until <= now] or available
+        with self._lock:
+            return min(available, key=lambda n: (n.priority, n.busy_until > now, n.in_flight))
+    
+    
+    def begin(self, node):
+        with self._lock:
+            node.in_flight += 1
+        return time.time()
+    
+    
+    def end(self, node, start, error=None, down=False):
+        """ Record the end of a request sent to node at start, error being None if it succeeded.
             
-    return tar_stream
+            node is only marked down if down is True, i.e. if it could not be reached. An HTTP
+            error or a read timeout may come from the PL being executed and is only counted."""
+        
+        with self._lock:
+            node.in_flight -= 1
+            node.requests += 1
+            node.last_latency = time.time() - start
+            node.total_latency += node.last_latency
+            if error:
+                node.errors += 1
+        if error and down:
+            self.mark_down(node, error)
+    
+    
+    def stats(self):
+        self.refresh()
+        return [node.stats() for node in sorted(self.nodes.values(), key=lambda n: n.priority)]
+
+
+
+SANDBOX_POOL = SandboxPool()
+
+
+
+def get_sandbox():
+    """ Return the SandboxNode of the first available sandbox according to SANDBOX_POOL.
+        Raise NotImplementedError if not sandbox could be found."""
     
+    return SANDBOX_POOL.choose()
+
+
+
+def make_tar(files, compresslevel=None):
+    """ Return the bytes of a gzipped tar containing a file for every key of files, named after
+        the key, whose content is the corresponding value followed by a newline.
+        
+        The archive is built in memory. Members and gzip header have a fixed date, so that the
+        same files always give the same bytes. compresslevel defaults to
+        settings.SANDBOX_TAR_COMPRESSLEVEL."""
+    
+    if compresslevel is None:
+        compresslevel = getattr(settings, 'SANDBOX_TAR_COMPRESSLEVEL', 1)
+    
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=compresslevel, mtime=0) as gz:
+        with tarfile.open(fileobj=gz, mode='w', format=tarfile.GNU_FORMAT) as tar:
+            for key in sorted(files):
+                content = (str(files[key]) + '\n').encode('utf-8')
+                info = tarfile.TarInfo(name=key)
+                info.size = len(content)
+                info.mode = 0o644
+                tar.addfile(info, io.BytesIO(content))
+    
+    return buffer.getvalue()
 
 
 
 class SandboxSession:
     
-    def __init__(self, dic, studentfile, timeout=3):
+    def __init__(self, dic, studentfile, timeout=3, memory=None):
         sandbox = get_sandbox()
         
         self.dic = dic
         self.studentfile = studentfile
+        self.sandbox = sandbox
         self.url = sandbox.url
         self.name = sandbox.name
         self.timeout = timeout
+        self.memory = memory
         
         logger.info("Executing on sandbox '"+sandbox.url+" ("+sandbox.name+")'.")
     
     
-    def call(self, timeout=10):
-        """ Call the sandbox """
+    def read_timeout(self):
+        """ Return the number of seconds to wait for the response of the sandbox: the timeout of
+            the execution, capped as the sandbox does, plus the time the request may wait for an
+            execution slot (SANDBOX_QUEUE_TIMEOUT) and SANDBOX_HTTP_MARGIN seconds for the transfer."""
+        
+        return (Limits(self.timeout).timeout + getattr(settings, 'SANDBOX_QUEUE_TIMEOUT', 10)
+                + getattr(settings, 'SANDBOX_HTTP_MARGIN', 5))
+    
+    
+    def call(self, timeout=None):
+        """ Call the sandbox, trying the next available one if the connection to the sandbox fails.
+            timeout is the read timeout of each request, self.read_timeout() by default.
+            
+            The environment (every file but the answer of the student) is identified by the sha1
+            of its tarball, sent as 'env_hash' along with the answer. The tarball itself is only
+            sent if the sandbox answers 412, meaning that it does not have this environment
+            in its cache."""
+        
+        if timeout is None:
+            timeout = self.read_timeout()
         
         payload = dict(self.dic['__file'])
         
@@ -84,31 +337,88 @@ class SandboxSession:
         payload['pl.json'] = json.dumps(tmp)
         if 'grader' in self.dic and 'grader.py' not in payload:
             payload['grader.py'] = self.dic['grader']
-        if self.studentfile:
-            payload['student'] = self.studentfile
-        
         
         self.tar = make_tar(payload)
         
         hsh = hashlib.sha1()
         hsh.update(self.tar)
-        tar_hash = hsh.hexdigest()
+        env_hash = hsh.hexdigest()
         
-        files = {'environment.tgz': self.tar}
+        files = dict()
+        if self.studentfile:
+            files['student'] = (self.studentfile + '\n').encode('utf-8')
+        data = {'execution_timeout': self.timeout, 'env_hash': env_hash}
+        if self.memory is not None:
+            data['execution_memory'] = self.memory
         
-        try: 
-            data={'execution_timeout': self.timeout, 'tar_hash': tar_hash}
-            response = requests.post(self.url, data=data, files=files, timeout=10)
-            response = response.text
-        except Exception as e:
-            response = {
-                'feedback': ("Erreur de la sandbox '"
-                            + self.name + "', si l'erreur persiste, "
-                            + "merci de contacter votre professeur<br><br>"),
-                'grade': "info",
-                'error': traceback.format_exc(),
-                'other': [],
-            }
-            response = json.dumps(response)
-            
-        return response
+        tried = set()
+        waited = False
+        while True:
+            start = SANDBOX_POOL.begin(self.sandbox)
+            try: 
+                response = self.sandbox.session.post(self.url, data=data, files=files, timeout=timeout)
+                if response.status_code == 412: # Environment not in the cache of the sandbox
+                    response = self.sandbox.session.post(self.url, data=data, timeout=timeout,
+                                                         files=dict(files, **{'environment.tgz': self.tar}))
+                if response.status_code in (429, 503): # Sandbox saturated, but not down
+                    SANDBOX_POOL.end(self.sandbox, start)
+                    delay = SANDBOX_POOL.busy(self.sandbox, response.headers.get('Retry-After'))
+                    tried.add(self.url)
+                    if not self.next_sandbox(tried):
+                        if waited:
+                            return self.busy_response()
+                        # Every sandbox is saturated, wait for one of them once
+                        waited = True
+                        time.sleep(min(delay, getattr(settings, 'SANDBOX_BUSY_MAX_WAIT', 5)))
+                        tried = set()
+                        self.next_sandbox(tried)
+                    continue
+                response.raise_for_status()
+                response = response.text
+                SANDBOX_POOL.end(self.sandbox, start)
+            except requests.exceptions.ConnectionError as e:
+                SANDBOX_POOL.end(self.sandbox, start, str(type(e).__name__) + ": " + str(e), down=True)
+                tried.add(self.url)
+                if self.next_sandbox(tried):
+                    continue
+                response = self.error_response()
+            except Exception as e:
+                SANDBOX_POOL.end(self.sandbox, start, str(type(e).__name__) + ": " + str(e))
+                response = self.error_response()
+            return response
+    
+    
+    def next_sandbox(self, exclude):
+        """ Use the sandbox chosen by SANDBOX_POOL amongst those whose url is not in exclude.
+            Return False if there is no such sandbox."""
+        
+        try:
+            self.sandbox = SANDBOX_POOL.choose(exclude=exclude)
+        except NotImplementedError:
+            return False
+        self.url, self.name = self.sandbox.url, self.sandbox.name
+        logger.info("Retrying on sandbox '"+self.url+" ("+self.name+")'.")
+        return True
+    
+    
+    def busy_response(self):
+        response = {
+            'feedback': ("Les sandboxes sont surchargées, merci de soumettre votre réponse "
+                        + "à nouveau dans quelques instants."),
+            'grade': "info",
+            'error': "",
+            'other': [],
+        }
+        return json.dumps(response)
+    
+    
+    def error_response(self):
+        response = {
+            'feedback': ("Erreur de la sandbox '"
+                        + self.name + "', si l'erreur persiste, "
+                        + "merci de contacter votre professeur<br><br>"),
+            'grade': "info",
+            'error': traceback.format_exc(),
+            'other': [],
+        }
+        return json.dumps(response)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  test_exercise.py
+#
+#  Copyright 2018 Coumes Quentin <qcoumes@etud.u-pem.fr>
+#
+
+from django.test import SimpleTestCase
+from django.template import Context
+
+from playexo.exercise import TEMPLATE_CACHE, compile_template
+
+
+
+class TemplateCacheTestCase(SimpleTestCase):
+    
+    def setUp(self):
+        TEMPLATE_CACHE.clear()
+        TEMPLATE_CACHE.hits = TEMPLATE_CACHE.misses = 0
+    
+    
+    def test_compile_template(self):
+        template = compile_template("Compute {{ a }} + {{ b }}")
+        self.assertIs(template, compile_template("Compute {{ a }} + {{ b }}"))
+        self.assertEqual((TEMPLATE_CACHE.hits, TEMPLATE_CACHE.misses), (1, 1))
+        
+        # The same compiled template renders every context
+        self.assertEqual(template.render(Context({'a': 1, 'b': 2})), "Compute 1 + 2")
+        self.assertEqual(template.render(Context({'a': 3, 'b': 4})), "Compute 3 + 4")
+        
+        self.assertIsNot(template, compile_template("Compute {{ a }} - {{ b }}"))
+        self.assertEqual(len(TEMPLATE_CACHE), 2)
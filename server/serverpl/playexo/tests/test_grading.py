@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  test_grading.py
+#
+#  Copyright 2018 Coumes Quentin <qcoumes@etud.u-pem.fr>
+#
+
+import json
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from loader.models import PL
+from playexo.models import Answer, GradingJob
+from playexo.grading import grade
+
+from serverpl.settings import AUTHENTICATION_BACKENDS
+
+
+EVALUATOR = """
+grade = (response['answer'] == '42', 'Expected 42' if response['answer'] != '42' else 'Good')
+"""
+
+
+
+@override_settings(GRADING_WORKERS=0)
+class GradingTestCase(TestCase):
+    
+    @classmethod
+    def setUpTestData(self):
+        self.user = User.objects.create_user(username='user', password='12345')
+        self.pl = PL(name='answer', rel_path='answer.pl', json={'title': 'Answer', 'form': '', 'evaluator': EVALUATOR})
+        self.pl.save()
+        self.exercise = dict(self.pl.json, pl_id__=self.pl.id, seed=1.0)
+    
+    
+    def test_grade(self):
+        job = GradingJob.objects.create(user=self.user, pl=self.pl, exercise=self.exercise, inputs={'answer': '42'})
+        grade(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, GradingJob.DONE)
+        self.assertEqual(job.feedback_type, 'success')
+        self.assertEqual(job.answer.grade, 100)
+        self.assertEqual(job.answer.value, '42')
+        
+        # A job is only graded once
+        grade(job.id)
+        self.assertEqual(Answer.objects.count(), 1)
+    
+    
+    @patch('playexo.exercise.SandboxSession')
+    def test_metrics(self, mock_session):
+        metrics = {'user_time': 0.25, 'sys_time': 0.05, 'max_rss': 12000, 'wall_time': 0.4,
+                   'stdout_bytes': 20, 'stderr_bytes': 0}
+        mock_session.return_value.call.return_value = json.dumps({'grade': 100, 'feedback': 'ok', 'metrics': metrics})
+        exercise = dict(self.exercise, grader="print('ok')")
+        del exercise['evaluator']
+        
+        job = GradingJob.objects.create(user=self.user, pl=self.pl, exercise=exercise, inputs={'answer': '42'})
+        grade(job.id)
+        answer = Answer.objects.get()
+        self.assertEqual(answer.metrics, metrics)
+        self.assertAlmostEqual(answer.cpu_time, 0.3)
+    
+    
+    @patch('playexo.exercise.SandboxSession')
+    def test_invalid_grade(self, mock_session):
+        exercise = dict(self.exercise, grader="print('ok')")
+        del exercise['evaluator']
+        for value in [None, "50", [100]]:
+            mock_session.return_value.call.return_value = json.dumps({'grade': value, 'feedback': 'ok'})
+            job = GradingJob.objects.create(user=self.user, pl=self.pl, exercise=exercise, inputs={'answer': '42'})
+            grade(job.id)
+            job.refresh_from_db()
+            self.assertEqual((job.feedback_type, job.answer.grade), ('info', -1))
+            self.assertIn(repr(value), job.feedback)
+    
+    
+    def test_write_error(self):
+        job = GradingJob.objects.create(user=self.user, pl=self.pl, exercise=self.exercise, inputs={'answer': '42'})
+        with patch.object(Answer.objects, 'create', side_effect=ValueError("Cannot write")):
+            grade(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.feedback_type, job.answer), (GradingJob.DONE, 'info', None))
+        self.assertIn("Cannot write", job.feedback)
+        self.assertFalse(Answer.objects.exists())
+    
+    
+    @override_settings(GRADING_PENDING_TIMEOUT=30, GRADING_JOB_TIMEOUT=300)
+    def test_resume(self):
+        c = Client()
+        c.force_login(self.user, backend=AUTHENTICATION_BACKENDS[0])
+        
+        # Left PENDING or RUNNING by a process which was stopped
+        old = timezone.now() - timedelta(hours=1)
+        pending = GradingJob.objects.create(user=self.user, pl=self.pl, exercise=self.exercise,
+                                            inputs={'answer': '42'}, created=old)
+        running = GradingJob.objects.create(user=self.user, pl=self.pl, exercise=self.exercise,
+                                            inputs={'answer': '42'}, status=GradingJob.RUNNING, started=old)
+        recent = GradingJob.objects.create(user=self.user, pl=self.pl, exercise=self.exercise,
+                                           inputs={'answer': '42'}, status=GradingJob.RUNNING,
+                                           started=timezone.now())
+        for job in [pending, running]:
+            status = json.loads(c.get('/playexo/activity/job/' + str(job.id) + '/').content.decode())
+            self.assertEqual((status['status'], status['feedback_type']), (GradingJob.DONE, 'success'))
+        
+        status = json.loads(c.get('/playexo/activity/job/' + str(recent.id) + '/').content.decode())
+        self.assertEqual(status['status'], GradingJob.RUNNING)
+        self.assertEqual(Answer.objects.count(), 2)
+    
+    
+    def test_submit_and_poll(self):
+        c = Client()
+        c.force_login(self.user, backend=AUTHENTICATION_BACKENDS[0])
+        session = c.session
+        session['exercise'] = self.exercise
+        session['current_activity'] = 1
+        session.save()
+        
+        response = c.post('/playexo/activity/',
+                          json.dumps({'requested_action': 'submit', 'inputs': {'answer': '0'}}),
+                          content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        job = json.loads(response.content.decode())
+        
+        response = c.get('/playexo/activity/job/' + job['job'] + '/', {'wait': 1})
+        self.assertEqual(response.status_code, 200)
+        status = json.loads(response.content.decode())
+        self.assertEqual(status['status'], GradingJob.DONE)
+        self.assertEqual(status['feedback_type'], 'fail')
+        self.assertEqual(Answer.objects.get().grade, 0)
+        
+        other = User.objects.create_user(username='other', password='12345')
+        c.force_login(other, backend=AUTHENTICATION_BACKENDS[0])
+        self.assertEqual(c.get('/playexo/activity/job/' + job['job'] + '/').status_code, 404)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  test_progress.py
+#
+#  Copyright 2018 Coumes Quentin <qcoumes@etud.u-pem.fr>
+#
+
+import os
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+from loader.models import PL, PLTP
+from playexo.models import Answer, Activity, PLProgress
+from playexo.enums import State
+from playexo.progress import CourseProgress
+from classmanagement.models import Course
+
+
+
+class CourseProgressTestCase(TestCase):
+    
+    @classmethod
+    def setUpTestData(self):
+        self.users = [User.objects.create_user(username='user' + str(i), password='12345') for i in range(3)]
+        self.course = Course.objects.create(id='course', name='Course', label='course')
+        self.course.student.add(*self.users)
+        self.pl = list()
+        for i in range(2):
+            pltp = PLTP.objects.create(sha1='sha1' + str(i), name='tp' + str(i), rel_path='tp.pltp',
+                                       json={'title': 'TP ' + str(i)})
+            for j in range(3):
+                pl = PL(name='pl', rel_path='pl.pl', json={'title': 'PL ' + str(i) + '.' + str(j)})
+                pl.save()
+                pltp.pl.add(pl)
+                self.pl.append(pl)
+            self.course.activity.add(Activity.objects.create(id=i + 1, name='activity' + str(i), pltp=pltp))
+        
+        Answer.objects.create(user=self.users[0], pl=self.pl[0], value='', grade=-1)
+        Answer.objects.create(user=self.users[0], pl=self.pl[0], value='42', grade=100)
+        Answer.objects.create(user=self.users[0], pl=self.pl[1], value='41', grade=50)
+        Answer.objects.create(user=self.users[1], pl=self.pl[4], value='0', grade=0)
+    
+    
+    def test_queries(self):
+        with self.assertNumQueries(4): # Activities, students, PL and grades
+            progress = CourseProgress(self.course)
+            progress.matrix()
+    
+    
+    def test_state(self):
+        progress = CourseProgress(self.course)
+        self.assertEqual(progress.state(self.users[0], self.pl[0].id), State.SUCCEEDED)
+        self.assertEqual(progress.state(self.users[0], self.pl[1].id), State.PART_SUCC)
+        self.assertEqual(progress.state(self.users[1], self.pl[4].id), State.FAILED)
+        self.assertEqual(progress.state(self.users[2], self.pl[0].id), State.NOT_STARTED)
+        self.assertEqual(
+            [title for _, title, _ in progress.activity_states(self.users[0], progress.activities[1])],
+            ['PL 1.0', 'PL 1.1', 'PL 1.2']
+        )
+    
+    
+    def test_same_as_answer(self):
+        progress = CourseProgress(self.course)
+        for user, summaries in progress.matrix():
+            for activity, summary in zip(progress.activities, summaries):
+                self.assertEqual(summary, Answer.pltp_summary(activity.pltp, user))
+            self.assertEqual(progress.course_summary(user), Answer.user_course_summary(self.course, user))
+    
+    
+    def test_pl_progress(self):
+        progress = PLProgress.objects.get(user=self.users[0], pl=self.pl[0])
+        self.assertEqual(progress.best_grade, 100)
+        self.assertEqual(progress.last_grade, 100)
+        self.assertEqual(progress.attempts, 1)
+        self.assertEqual(Answer.last_answer(self.pl[0], self.users[0]), '42')
+        self.assertEqual(Answer.pl_state(self.pl[0], self.users[0]), State.SUCCEEDED)
+        
+        Answer.objects.create(user=self.users[0], pl=self.pl[0], value='', seed='7', grade=-1)
+        progress.refresh_from_db()
+        self.assertEqual((progress.best_grade, progress.last_grade, progress.attempts), (100, -1, 1))
+        self.assertEqual(Answer.last_seed(self.pl[0], self.users[0]), '7')
+        self.assertEqual(Answer.last_answer(self.pl[0], self.users[0]), '42')
+        
+        self.assertIsNone(Answer.last_answer(self.pl[2], self.users[0]))
+        self.assertEqual(Answer.pl_state(self.pl[2], self.users[0]), State.NOT_STARTED)
+    
+    
+    def test_backfill(self):
+        expected = list(PLProgress.objects.order_by('user_id', 'pl_id').values_list(
+            'user_id', 'pl_id', 'best_grade', 'last_grade', 'last_seed', 'last_answer_id', 'attempts', 'started'
+        ))
+        PLProgress.objects.all().delete()
+        call_command('backfillprogress', batch=1, stdout=open(os.devnull, 'w'))
+        self.assertEqual(expected, list(PLProgress.objects.order_by('user_id', 'pl_id').values_list(
+            'user_id', 'pl_id', 'best_grade', 'last_grade', 'last_seed', 'last_answer_id', 'attempts', 'started'
+        )))
+    
+    
+    def test_visit(self):
+        PLProgress.visit(self.users[2], self.pl[3], 0.5)
+        started = PLProgress.objects.get(user=self.users[2], pl=self.pl[3]).started
+        self.assertIsNotNone(started)
+        self.assertEqual(Answer.pl_state(self.pl[3], self.users[2]), State.STARTED)
+        self.assertEqual(CourseProgress(self.course).state(self.users[2], self.pl[3].id), State.STARTED)
+        self.assertEqual(Answer.last_seed(self.pl[3], self.users[2]), '0.5')
+        
+        PLProgress.visit(self.users[2], self.pl[3], 0.25)
+        progress = PLProgress.objects.get(user=self.users[2], pl=self.pl[3])
+        self.assertEqual((progress.last_seed, progress.started), ('0.25', started))
+        self.assertFalse(Answer.objects.filter(user=self.users[2]).exists())
+        
+        # The first answer keeps the date the PL was started
+        Answer.objects.create(user=self.users[2], pl=self.pl[3], value='42', seed='0.25', grade=100)
+        progress.refresh_from_db()
+        self.assertEqual((progress.started, progress.best_grade, progress.attempts), (started, 100, 1))
+    
+    
+    def test_restricted(self):
+        activity = Activity.objects.get(id=2)
+        progress = CourseProgress(self.course, users=[self.users[1]], activities=[activity])
+        self.assertEqual(progress.users, [self.users[1]])
+        self.assertEqual(
+            [state for _, _, state in progress.activity_states(self.users[1], activity)],
+            [State.NOT_STARTED, State.FAILED, State.NOT_STARTED]
+        )
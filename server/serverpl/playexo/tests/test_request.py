@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  test_request.py
+#
+#  Copyright 2018 Coumes Quentin <qcoumes@etud.u-pem.fr>
+#
+
+import time, io, tarfile
+
+from unittest.mock import patch, Mock
+
+from django.test import TestCase, override_settings
+
+from sandbox.models import Sandbox
+from playexo.request import SandboxPool, SandboxSession, make_tar
+
+
+def head(url, timeout):
+    if 'dead' in url:
+        raise ConnectionError("Connection refused")
+    return Mock(status_code=200)
+
+
+
+@override_settings(SANDBOX_CHECK_INTERVAL=0, SANDBOX_BACKOFF_BASE=10)
+class SandboxPoolTestCase(TestCase):
+    
+    @classmethod
+    def setUpTestData(self):
+        Sandbox.objects.create(url="http://dead/", name="dead", priority=0)
+        Sandbox.objects.create(url="http://first/", name="first", priority=1)
+        Sandbox.objects.create(url="http://second/", name="second", priority=1)
+        Sandbox.objects.create(url="http://low/", name="low", priority=2)
+    
+    
+    @patch('playexo.request.requests.Session.head', side_effect=head)
+    def test_choose(self, mock_head):
+        pool = SandboxPool()
+        pool.check()
+        self.assertFalse(pool.nodes['http://dead/'].up)
+        
+        # Highest priority, then fewest requests in flight
+        first = pool.choose()
+        self.assertEqual(first.priority, 1)
+        start = pool.begin(first)
+        second = pool.choose()
+        self.assertEqual(second.priority, 1)
+        self.assertNotEqual(first.url, second.url)
+        pool.end(first, start)
+        
+        # Dead sandboxes are not probed again before their back-off elapsed
+        calls = mock_head.call_count
+        pool.check()
+        self.assertEqual(mock_head.call_count, calls + 3)
+    
+    
+    @patch('playexo.request.requests.Session.head', side_effect=head)
+    def test_backoff(self, mock_head):
+        pool = SandboxPool()
+        pool.check()
+        node = pool.nodes['http://first/']
+        pool.mark_down(node, "error")
+        pool.mark_down(node, "error")
+        self.assertAlmostEqual(node.down_until - time.time(), 20, delta=1) # 10 * 2^(2-1)
+        self.assertEqual(node.failures, 2)
+        self.assertEqual(pool.choose().url, 'http://second/')
+        
+        # An HTTP error or a read timeout does not change the liveness of the sandbox
+        start = pool.begin(node)
+        pool.end(node, start, "HTTPError: 500 Server Error")
+        self.assertEqual(node.stats()['errors'], 1)
+        self.assertEqual(node.failures, 2)
+        
+        start = pool.begin(node)
+        pool.end(node, start, "ConnectionError: Connection refused", down=True)
+        self.assertEqual(node.stats()['errors'], 2)
+        self.assertEqual(node.failures, 3)
+        
+        pool.mark_up(node)
+        self.assertTrue(node.up)
+        self.assertEqual(node.failures, 0)
+    
+    
+    @patch('playexo.request.requests.Session.head', side_effect=head)
+    def test_busy(self, mock_head):
+        pool = SandboxPool()
+        pool.check()
+        first, second = pool.nodes['http://first/'], pool.nodes['http://second/']
+        
+        # Saturated sandboxes are avoided but not marked as down
+        self.assertEqual(pool.busy(first, '30'), 30)
+        self.assertEqual(pool.choose().url, 'http://second/')
+        self.assertTrue(first.up)
+        self.assertEqual(pool.busy(second, 'Wed, 21 Oct 2015 07:28:00 GMT'), 1)
+        self.assertEqual(pool.choose().url, 'http://low/')
+        
+        # They are still chosen if every sandbox is saturated
+        pool.busy(pool.nodes['http://low/'], '30')
+        self.assertEqual(pool.choose().priority, 1)
+
+
+
+@override_settings(SANDBOX_DEFAULT_TIMEOUT=3, SANDBOX_MAX_TIMEOUT=60, SANDBOX_QUEUE_TIMEOUT=10, SANDBOX_HTTP_MARGIN=5)
+class SandboxSessionTestCase(TestCase):
+    
+    @patch('playexo.request.SANDBOX_POOL')
+    @patch('playexo.request.get_sandbox')
+    def test_read_timeout(self, mock_get_sandbox, mock_pool):
+        node = mock_get_sandbox.return_value
+        node.url, node.name = "http://first/", "first"
+        node.session.post.return_value = Mock(status_code=200, text='{"grade": 100}')
+        dic = {'__file': {}, 'grader': "print('ok')"}
+        
+        # A grader allowed 30 seconds may also wait for an execution slot
+        self.assertEqual(SandboxSession(dic, '42', timeout=30).call(), '{"grade": 100}')
+        self.assertEqual(node.session.post.call_args[1]['timeout'], 30 + 10 + 5)
+        
+        self.assertEqual(SandboxSession(dic, '42', timeout='600').read_timeout(), 60 + 10 + 5)
+        self.assertEqual(SandboxSession(dic, '42', timeout='abc').read_timeout(), 3 + 10 + 5)
+
+
+
+class MakeTarTestCase(TestCase):
+    
+    def test_make_tar(self):
+        files = {'grader.py': "print('grader')", 'pl.json': '{"title": "é"}', 'student': 'def f(): pass'}
+        tar = make_tar(files)
+        self.assertEqual(tar, make_tar(files))
+        with tarfile.open(fileobj=io.BytesIO(tar), mode='r:gz') as archive:
+            self.assertEqual(sorted(archive.getnames()), sorted(files))
+            for name, content in files.items():
+                self.assertEqual(archive.extractfile(name).read().decode('utf-8'), content + '\n')
@@ -9,6 +9,8 @@ urlpatterns = [
     url(r'^activity/lti/(\w+)/(\w+)/$', views.lti_receiver),
     url(r'^activity/test/(\w+)/(\w+)/$', views.test_receiver),
     url(r'^activity/$', views.activity_receiver),
+    url(r'^activity/job/([0-9a-f-]+)/$', views.grading_job),
+    url(r'^sandboxes/$', views.sandbox_stats),
 ]
 
 
@@ -18,11 +18,14 @@ from django.core.exceptions import PermissionDenied
 from django.contrib.auth import logout
 from django.urls import reverse
 from django.contrib import messages
+from django.conf import settings
 
 from loader.models import PLTP, PL
 
 from playexo.exercise import PLInstance, ActivityInstance
-from playexo.models import Activity, ActivityTest, Answer
+from playexo.models import Activity, ActivityTest, Answer, GradingJob, PLProgress
+from playexo.grading import GRADING_POOL
+from playexo.request import SANDBOX_POOL
 
 from classmanagement.models import Course
 
@@ -52,26 +55,46 @@ def activity_ajax(request):
         ).save()
         return HttpResponse(json.dumps({'feedback_type': feedback_type, 'feedback': feedback}), content_type='application/json')
     
-    elif status['requested_action'] == 'submit': # Validate
-        success, feedback = exercise.evaluate(status['inputs']) 
-        if 'answer' in status['inputs']:
-            value = status['inputs']['answer']
-        else:
-            value = ""
-        if success == None:
-            feedback_type = "info"
-            Answer(value=value, user=request.user, pl=PL.objects.get(id=exercise.dic['pl_id__']), seed=exercise.dic['seed'], grade=-1).save()
-        elif success:
-            feedback_type = "success"
-            Answer(value=value, user=request.user, pl=PL.objects.get(id=exercise.dic['pl_id__']), seed=exercise.dic['seed'], grade=100).save()
-        else:
-            feedback_type = "fail"
-            Answer(value=value, user=request.user, pl=PL.objects.get(id=exercise.dic['pl_id__']), seed=exercise.dic['seed'], grade=0).save()
-        return HttpResponse(json.dumps({'feedback_type': feedback_type, 'feedback': feedback}), content_type='application/json')
+    elif status['requested_action'] == 'submit': # Validate, the answer is graded by playexo.grading
+        job = GradingJob.objects.create(
+            user=request.user,
+            pl=PL.objects.get(id=exercise.dic['pl_id__']),
+            exercise=exercise.dic,
+            inputs=status['inputs'],
+        )
+        GRADING_POOL.submit(job)
+        job.refresh_from_db()
+        return HttpResponse(json.dumps(job.to_dict()), content_type='application/json')
     return HttpResponseBadRequest("Missing action in status")
 
 
 
+@login_required
+def grading_job(request, job_id):
+    """ Return the status of the GradingJob job_id of the user as JSON.
+        
+        If the GET parameter 'wait' is given, wait at most this many seconds (capped by
+        settings.GRADING_LONG_POLL) for the job to be done before answering. A job which seems
+        lost is submitted again (see GradingPool.resume())."""
+    
+    job = get_object_or_404(GradingJob, id=job_id, user=request.user)
+    if GRADING_POOL.resume(job):
+        job.refresh_from_db()
+    try:
+        wait = min(float(request.GET.get('wait', 0)), getattr(settings, 'GRADING_LONG_POLL', 10))
+    except ValueError:
+        return HttpResponseBadRequest("'wait' must be a number of seconds")
+    
+    deadline = time.time() + wait
+    while job.status != GradingJob.DONE and time.time() < deadline:
+        if not GRADING_POOL.wait(job.id, deadline - time.time()):
+            time.sleep(min(0.5, max(0, deadline - time.time()))) # Job graded by another process
+        job.refresh_from_db()
+    
+    return HttpResponse(json.dumps(job.to_dict()), content_type='application/json')
+
+
+
 @csrf_exempt
 @login_required
 def activity_receiver(request):
@@ -114,8 +137,8 @@ def activity_receiver(request):
         return redirect(reverse(activity_receiver))
     
     request.session['exercise'] = exercise.dic
-    if current_pl:
-        Answer(value='', user=request.user, pl=PL.objects.get(id=current_pl.id), seed=exercise.dic['seed'], grade=-1).save()
+    if current_pl and exercise.new_seed: # Keeps the seed for the next visits
+        PLProgress.visit(request.user, current_pl, exercise.dic['seed'])
     return HttpResponse(exercise.render(request))
 
 
@@ -163,3 +186,13 @@ def test_receiver(request, activity_name, pltp_sha1):
 def not_authenticated(request):
     logout(request)
     return render(request, 'playexo/not_authenticated.html', {})
+
+
+
+@login_required
+def sandbox_stats(request):
+    """ Return the state, latency and error counters of every sandbox as seen by this process."""
+    
+    if not request.user.profile.is_admin():
+        raise PermissionDenied("Vous n'avez pas les droits nécessaires pour accéder à cette page.")
+    return HttpResponse(json.dumps(SANDBOX_POOL.stats()), content_type='application/json')
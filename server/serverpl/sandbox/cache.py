@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  cache.py
+#
+#  Author: Coumes Quentin <qcoumes@etud.u-pem.fr>
+
+
+import os, io, shutil, tarfile, hashlib, threading, uuid, logging
+
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+
+class EnvironmentCache:
+    """ LRU cache of extracted environments (grader, pl.json, files of the PL...) identified by the
+        sha1 of their tarball, so that only the answer of the student has to be sent when the
+        same exercise is graded again.
+        
+        Environments are extracted in settings.SANDBOX_ENV_CACHE_ROOT/<sha1>, the least recently
+        used ones being deleted once their total size exceeds settings.SANDBOX_ENV_CACHE_SIZE
+        bytes. The index is kept in memory and rebuilt from the directory at first use, so that
+        environments extracted by other processes or before a restart are reused."""
+    
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = None # sha1 -> size
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    
+    @property
+    def root(self):
+        return getattr(settings, 'SANDBOX_ENV_CACHE_ROOT', os.path.join(settings.MEDIA_ROOT, 'env_cache'))
+    
+    
+    @property
+    def max_size(self):
+        return getattr(settings, 'SANDBOX_ENV_CACHE_SIZE', 256 * 1024 * 1024)
+    
+    
+    def _dir_size(self, path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, dirs, files in os.walk(path) for f in files)
+    
+    
+    def _load(self):
+        """ Build the index from the environments already extracted, must hold self._lock."""
+        
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        os.makedirs(self.root, exist_ok=True)
+        entries = list()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if len(name) == 40 and os.path.isdir(path):
+                entries.append((os.path.getmtime(path), name, self._dir_size(path)))
+        for mtime, name, size in sorted(entries):
+            self._entries[name] = size
+            self._size += size
+    
+    
+    def _evict(self):
+        """ Remove the least recently used environments until the cache fits in its size, must
+            hold self._lock."""
+        
+        while self._size > self.max_size and len(self._entries) > 1:
+            sha1, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            path = os.path.join(self.root, sha1)
+            trash = path + '.' + uuid.uuid4().hex + '.evicted'
+            try:
+                os.rename(path, trash)
+                shutil.rmtree(trash, ignore_errors=True)
+            except OSError:
+                pass
+    
+    
+    def add(self, sha1, tgz):
+        """ Extract the gzipped tarball tgz (bytes) as the environment sha1.
+            
+            Raise ValueError if sha1 is not the hash of tgz."""
+        
+        if hashlib.sha1(tgz).hexdigest() != sha1:
+            raise ValueError("env_hash does not match the sha1 of environment.tgz")
+        
+        path = os.path.join(self.root, sha1)
+        tmp = path + '.' + uuid.uuid4().hex + '.tmp'
+        os.makedirs(tmp)
+        with tarfile.open(fileobj=io.BytesIO(tgz), mode='r:gz') as tar:
+            tar.extractall(tmp)
+        size = self._dir_size(tmp)
+        
+        with self._lock:
+            self._load()
+            try:
+                os.rename(tmp, path)
+            except OSError: # Already extracted by another process
+                shutil.rmtree(tmp, ignore_errors=True)
+            if sha1 not in self._entries:
+                self._entries[sha1] = size
+                self._size += size
+            self._entries.move_to_end(sha1)
+            self._evict()
+    
+    
+    def copy_to(self, sha1, dest):
+        """ Copy the content of the environment sha1 into the directory dest.
+            
+            Return True if the environment was in the cache, False otherwise."""
+        
+        path = os.path.join(self.root, sha1)
+        with self._lock:
+            self._load()
+            if sha1 not in self._entries:
+                if not os.path.isdir(path): # Not extracted by another process either
+                    self.misses += 1
+                    return False
+                self._entries[sha1] = self._dir_size(path)
+                self._size += self._entries[sha1]
+            self._entries.move_to_end(sha1)
+        
+        try:
+            os.utime(path)
+            for name in os.listdir(path):
+                src = os.path.join(path, name)
+                if os.path.isdir(src):
+                    shutil.copytree(src, os.path.join(dest, name))
+                else:
+                    shutil.copy2(src, dest)
+        except OSError: # Evicted while being copied
+            logger.warning("Environment '" + sha1 + "' was evicted while being copied")
+            with self._lock:
+                self.misses += 1
+            return False
+        
+        with self._lock:
+            self.hits += 1
+        return True
+    
+    
+    def stats(self):
+        with self._lock:
+            self._load()
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'size': self._size,
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+
+ENV_CACHE = EnvironmentCache()
@@ -15,4 +15,39 @@ class GraderError(Exception):
         self.s = s
     
     def __str__(self):
-        return s
+        return self.s
+
+
+class UnknownEnvironment(Exception):
+    """Raised when a request only gives the hash of an environment which is not in the cache."""
+    
+    def __init__(self, env_hash):
+        self.env_hash = env_hash
+    
+    def __str__(self):
+        return "Unknown environment '" + self.env_hash + "', environment.tgz must be sent."
+
+
+class Saturated(Exception):
+    """Raised when the sandbox cannot accept more executions, retry_after being the number of
+    seconds after which the client should try again."""
+    
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+    
+    def __str__(self):
+        return "Sandbox saturated, retry in " + str(self.retry_after) + " second(s)."
+
+
+class OutputLimitExceeded(Exception):
+    """Raised when an execution wrote more than limit bytes on its standard output or error, output
+    and stderr being truncated to limit bytes."""
+    
+    def __init__(self, limit, output, stderr, rusage):
+        self.limit = limit
+        self.output = output
+        self.stderr = stderr
+        self.rusage = rusage
+    
+    def __str__(self):
+        return "Output exceeded " + str(self.limit) + " bytes."
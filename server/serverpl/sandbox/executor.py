@@ -7,22 +7,20 @@
 #  Last Modified: 2017-09-30
 
 
-import json, os, tarfile, uuid, timeout_decorator, time, subprocess
+import json, os, tarfile, time, subprocess, traceback
 
 from django.conf import settings
 
-from sandbox.exceptions import MissingGradeError
+from sandbox.exceptions import (MissingGradeError, GraderError, UnknownEnvironment, Saturated,
+                                OutputLimitExceeded)
+from sandbox.cache import ENV_CACHE
+from sandbox.workers import WORKER_POOL
+from sandbox.jobs import JOB_DIRS
+from sandbox import process, limits
 
 
-
-TIMEOUT_FEEDBACK = """
-L'exécution de votre programme prends trop de temps (maximum {X} secondes).
-<br><br>Cette erreur peut être dû:
-<ul>
-    <li>À une boucle infinie. Pensez à vérifier les conditions d'arrêts de vos boucles <strong>while</strong> ainsi que de vos fonctions récursives.</li>
-    <li>À un algorithme trop gourmand. Certains algorithmes sont meilleurs que d'autres pour effectuer certaines actions.</li>
-</ul>
-"""
+# Bytes of a truncated output returned in the 'error' of the response
+TRUNCATED_EXCERPT = 4096
 
 
 
@@ -30,45 +28,95 @@ class Executor:
     
     def __init__(self, request):
         self.files = request.FILES
-        self.dirname = os.path.join(settings.MEDIA_ROOT, str(uuid.uuid4()))
-        self.timeout = float(request.POST["execution_timeout"])
-
+        self.dirname = None
+        self.limits = limits.Limits.from_request(request)
+        self.timeout = self.limits.timeout
+        self.env_hash = request.POST.get("env_hash", None)
+        self.metrics = None
+    
+    
     def _create_dir(self):
-        """ Create the directory where the code will be executed"""
+        """ Create the directory where the code will be executed, given by
+            sandbox.jobs.JOB_DIRS and released by execute().
+            
+            If an env_hash was given, the environment is copied from sandbox.cache.ENV_CACHE,
+            environment.tgz being added to the cache if it is not already in it. Every other
+            file of the request (e.g. the answer of the student) is then written in the directory.
+            
+            Raise UnknownEnvironment if env_hash is not in the cache and environment.tgz
+            was not sent, and Saturated if the quota of the job directories is exceeded."""
         
-        if not 'environment.tgz' in self.files:
+        if not self.env_hash and not 'environment.tgz' in self.files:
             raise KeyError('environment.tgz not found in request.files')
-        os.mkdir(self.dirname)
+        
+        self.dirname = JOB_DIRS.create()
+        if self.env_hash:
+            if not ENV_CACHE.copy_to(self.env_hash, self.dirname):
+                if not 'environment.tgz' in self.files:
+                    raise UnknownEnvironment(self.env_hash)
+                ENV_CACHE.add(self.env_hash, self.files['environment.tgz'].read())
+                ENV_CACHE.copy_to(self.env_hash, self.dirname)
+        else:
+            with tarfile.open(fileobj=self.files['environment.tgz'], mode='r:gz') as tar:
+                tar.extractall(self.dirname)
+        
         for filename in self.files:
-            with open(self.dirname+"/"+filename, 'wb') as f:
-                f.write(self.files[filename].read())
+            if filename != 'environment.tgz':
+                with open(os.path.join(self.dirname, os.path.basename(filename)), 'wb') as f:
+                    f.write(self.files[filename].read())
     
     
-    @timeout_decorator.timeout(use_signals=False, use_class_attribute=True)
-    def __evaluate(self):
-        """ Untar environment.tar.gz and execute grader.py, returning the result. """
-        try:
-            cwd = os.getcwd()
-            os.chdir(self.dirname)
-            
-            with tarfile.open(self.dirname+"/environment.tgz", 'r:gz') as tar:
-                tar.extractall(self.dirname)
-            
-            p = subprocess.Popen('python3 grader.py',stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-            out, err = p.communicate()
+    def _evaluate(self):
+        """ Execute grader.py in a warm worker of sandbox.workers.WORKER_POOL if it is enabled,
+            in a new interpreter otherwise, returning the tuple (exit code, output).
             
-            return p.returncode, out if not p.returncode else err 
-        finally:
-            os.chdir(cwd)
+            The working directory of the process is never changed, several executions may run
+            concurrently in different threads. Raise subprocess.TimeoutExpired if grader.py did
+            not terminate in self.timeout seconds, and OutputLimitExceeded if it wrote more than
+            self.limits.capture bytes on its standard output or error. The resources used by
+            grader.py are stored in self.metrics in every case. """
+        start = time.time()
+        try:
+            if WORKER_POOL.enabled():
+                returncode, out, err, rusage = WORKER_POOL.run(self.dirname, self.timeout,
+                                                               self.limits.rlimits(), self.limits.capture)
+            else:
+                returncode, out, err, rusage = process.run(['python3', 'grader.py'], self.dirname,
+                                                           self.timeout, self.limits.rlimits(),
+                                                           self.limits.capture)
+        except (subprocess.TimeoutExpired, OutputLimitExceeded) as e:
+            self._set_metrics(start, e.rusage, e.output, e.stderr)
+            self.metrics['truncated'] = isinstance(e, OutputLimitExceeded)
+            raise
+        
+        self._set_metrics(start, rusage, out, err)
+        return returncode, out if not returncode else err
+    
+    
+    def _set_metrics(self, start, rusage, out, err):
+        self.metrics = dict(rusage)
+        self.metrics.update({
+            'wall_time': time.time() - start,
+            'stdout_bytes': len(out or b''),
+            'stderr_bytes': len(err or b''),
+        })
     
     
     def execute(self):
         try:
             self._create_dir()
-            cwd = os.getcwd()
-            exit_code, output = self.__evaluate()
+            exit_code, output = self._evaluate()
+            breach = self.limits.breach(exit_code, self.metrics, output) if exit_code else None
             output = output.decode("UTF-8")
-            if exit_code:
+            if breach:
+                response = {
+                    'feedback': self.limits.feedback(breach),
+                    'error': "",
+                    'grade': breach,
+                    'other': [],
+                }
+            
+            elif exit_code:
                 if exit_code > 1000 or exit_code < 0:
                     raise GraderError("Grader exit code should be "
                             + "[0, 999] (received '"
@@ -96,10 +144,25 @@ class Executor:
                     'grade': output['grade'],
                 }
         
-        except timeout_decorator.TimeoutError as e:
+        except (UnknownEnvironment, Saturated):
+            raise
+        
+        except OutputLimitExceeded as e:
+            output = e.stderr or e.output
+            response = {
+                'feedback': self.limits.feedback(limits.OUTPUT, e.limit),
+                'error': (output[:TRUNCATED_EXCERPT].decode("UTF-8", errors="replace")
+                          + "\n\n[... sortie tronquée, plus de " + str(e.limit) + " octets]"),
+                'grade': limits.OUTPUT,
+                'other': [],
+            }
+        
+        except subprocess.TimeoutExpired as e:
             response = {
-                'feedback': TIMEOUT_FEEDBACK.replace('{X}', str(self.timeout)),
-                'grade' : 0
+                'feedback': self.limits.feedback(limits.TIMEOUT),
+                'error': "",
+                'grade': limits.TIMEOUT,
+                'other': [],
             }
         
         except MissingGradeError as e:
@@ -119,7 +182,7 @@ class Executor:
                 'grade': -4,
                 'other': [],
             }
-
+        
         except Exception as e: #Unknown error
             response = {
                 'feedback': ("Erreur lors de l'évaluation de votre "
@@ -130,9 +193,13 @@ class Executor:
             }
         
         finally:
+            if self.dirname:
+                JOB_DIRS.release(self.dirname)
             try:
                 self.docker.kill()
             except:
                 pass
-            
+        
+        if self.metrics:
+            response['metrics'] = self.metrics
         return json.dumps(response)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  jobs.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import os, time, uuid, shutil, threading, logging
+
+from collections import deque
+
+from django.conf import settings
+
+from sandbox.exceptions import Saturated
+
+
+logger = logging.getLogger(__name__)
+
+
+
+def dir_size(path):
+    """ Return the number of bytes used by the files of path, 0 if it does not exist."""
+    
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.lstat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return total
+
+
+
+class JobDirectories:
+    """ Lifecycle of the directories in which the executions take place.
+        
+        Directories are created in settings.SANDBOX_JOBS_ROOT by create() and given back by
+        release() once the execution is over. The last SANDBOX_KEEP_JOBS released directories are
+        kept for debugging, the others are deleted by a background sweeper, so that the deletion
+        does not delay the response.
+        
+        Every SANDBOX_JOBS_SWEEP_INTERVAL seconds, the sweeper also deletes the entries of the root
+        older than SANDBOX_JOBS_MAX_AGE seconds which are not used by this process (left by a
+        stopped process), and the oldest kept directories while the root uses more than
+        SANDBOX_JOBS_QUOTA bytes. create() raises sandbox.exceptions.Saturated if the quota is
+        still exceeded. Several processes may share the same root, as long as SANDBOX_JOBS_MAX_AGE
+        is longer than any execution."""
+    
+    def __init__(self):
+        self.active = set()
+        self.kept = deque()
+        self.pending = deque()
+        self.used = 0
+        self.reclaimed = 0
+        self.reclaimed_bytes = 0
+        self.sweeps = 0
+        self.last_sweep = 0.0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._sweeper = None
+    
+    
+    @property
+    def root(self):
+        return getattr(settings, 'SANDBOX_JOBS_ROOT', os.path.join(settings.MEDIA_ROOT, 'jobs'))
+    
+    
+    @property
+    def keep(self):
+        return getattr(settings, 'SANDBOX_KEEP_JOBS', 0)
+    
+    
+    @property
+    def quota(self):
+        return getattr(settings, 'SANDBOX_JOBS_QUOTA', 1024 * 1024 * 1024)
+    
+    
+    @property
+    def interval(self):
+        return getattr(settings, 'SANDBOX_JOBS_SWEEP_INTERVAL', 60)
+    
+    
+    @property
+    def max_age(self):
+        return getattr(settings, 'SANDBOX_JOBS_MAX_AGE', 3600)
+    
+    
+    def start(self):
+        """ Start the sweeper if it is not already running."""
+        
+        with self._lock:
+            if self._sweeper is None and self.interval:
+                self._sweeper = threading.Thread(target=self._run_sweeper, name='sandbox-sweeper', daemon=True)
+                self._sweeper.start()
+    
+    
+    def _run_sweeper(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                if time.time() - self.last_sweep >= self.interval:
+                    self.sweep()
+                else:
+                    self.reclaim_pending()
+            except Exception:
+                logger.exception("Error while sweeping the job directories")
+    
+    
+    def create(self):
+        """ Create a new job directory and return its path.
+            
+            Raise Saturated if the job directories use more than the quota."""
+        
+        self.start()
+        if self.used > self.quota:
+            self.sweep()
+            if self.used > self.quota:
+                raise Saturated(1)
+        
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, str(uuid.uuid4()))
+        os.mkdir(path)
+        with self._lock:
+            self.active.add(path)
+        return path
+    
+    
+    def release(self, path):
+        """ Give back the job directory path, it is kept or deleted according to SANDBOX_KEEP_JOBS."""
+        
+        with self._lock:
+            self.active.discard(path)
+            self.kept.append(path)
+            while len(self.kept) > self.keep:
+                self.pending.append(self.kept.popleft())
+        
+        if self._sweeper is None:
+            self.reclaim_pending()
+        else:
+            self._wakeup.set()
+    
+    
+    def _delete(self, path):
+        """ Delete path (and the outputs left next to it), return the number of bytes reclaimed."""
+        
+        size = 0
+        for entry in (path, path + '.stdout', path + '.stderr'):
+            if os.path.isdir(entry):
+                size += dir_size(entry)
+                shutil.rmtree(entry, ignore_errors=True)
+            elif os.path.exists(entry):
+                try:
+                    size += os.lstat(entry).st_size
+                    os.remove(entry)
+                except OSError:
+                    pass
+        with self._lock:
+            self.reclaimed += 1
+            self.reclaimed_bytes += size
+            self.used = max(0, self.used - size)
+        return size
+    
+    
+    def reclaim_pending(self):
+        """ Delete every released directory which is not kept."""
+        
+        while True:
+            with self._lock:
+                if not self.pending:
+                    return
+                path = self.pending.popleft()
+            self._delete(path)
+    
+    
+    def sweep(self):
+        """ Delete the released, stale and, if the quota is exceeded, kept directories."""
+        
+        self.reclaim_pending()
+        
+        now = time.time()
+        used = 0
+        try:
+            entries = os.listdir(self.root)
+        except OSError:
+            entries = list()
+        for name in entries:
+            path = os.path.join(self.root, name)
+            base = os.path.splitext(path)[0] if name.endswith(('.stdout', '.stderr')) else path
+            with self._lock:
+                in_use = base in self.active or base in self.kept
+            try:
+                stat = os.lstat(path)
+            except OSError:
+                continue
+            if not in_use and now - stat.st_mtime > self.max_age:
+                self._delete(base)
+                continue
+            used += dir_size(path) if os.path.isdir(path) else stat.st_size
+        
+        with self._lock:
+            self.used = used
+        while self.used > self.quota:
+            with self._lock:
+                if not self.kept:
+                    break
+                path = self.kept.popleft()
+            self._delete(path)
+        
+        with self._lock:
+            self.sweeps += 1
+            self.last_sweep = time.time()
+        if self.used > self.quota:
+            logger.warning("Job directories use " + str(self.used) + " bytes, more than the quota ("
+                           + str(self.quota) + " bytes)")
+    
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'active': len(self.active),
+                'kept': len(self.kept),
+                'pending': len(self.pending),
+                'used': self.used,
+                'quota': self.quota,
+                'reclaimed': self.reclaimed,
+                'reclaimed_bytes': self.reclaimed_bytes,
+                'sweeps': self.sweeps,
+            }
+
+
+
+JOB_DIRS = JobDirectories()
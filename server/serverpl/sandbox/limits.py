@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  limits.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import math, signal, resource
+
+from django.conf import settings
+
+
+# Grades returned when an execution breaches one of its limits
+TIMEOUT = -6
+CPU = -7
+MEMORY = -8
+PROCESSES = -9
+OUTPUT = -10
+
+LIMIT_GRADES = (TIMEOUT, CPU, MEMORY, PROCESSES, OUTPUT)
+
+
+TIMEOUT_FEEDBACK = """
+L'exécution de votre programme prends trop de temps (maximum {X} secondes).
+<br><br>Cette erreur peut être dû:
+<ul>
+    <li>À une boucle infinie. Pensez à vérifier les conditions d'arrêts de vos boucles <strong>while</strong> ainsi que de vos fonctions récursives.</li>
+    <li>À un algorithme trop gourmand. Certains algorithmes sont meilleurs que d'autres pour effectuer certaines actions.</li>
+</ul>
+"""
+
+FEEDBACK = {
+    TIMEOUT: TIMEOUT_FEEDBACK,
+    CPU: TIMEOUT_FEEDBACK.replace("prends trop de temps", "utilise trop de temps processeur"),
+    MEMORY: ("Votre programme utilise trop de mémoire (maximum {X} Mo).<br><br>Vérifiez qu'il ne "
+             + "construit pas de liste ou de chaîne de caractères démesurée, par exemple dans une "
+             + "boucle infinie ou une récursion sans fin."),
+    PROCESSES: ("Votre programme crée trop de processus (maximum {X}).<br><br>Vérifiez qu'il "
+                + "n'appelle pas <strong>fork()</strong> ou <strong>subprocess</strong> dans une boucle."),
+    OUTPUT: ("Votre programme affiche trop de texte (maximum {X} octets).<br><br>Vérifiez qu'il "
+             + "n'affiche pas dans une boucle infinie."),
+}
+
+
+
+def _number(value, default, cast):
+    try:
+        value = cast(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+
+class Limits:
+    """ Resource limits of an execution, applied with setrlimit() in the child before the grader runs.
+        
+        timeout (seconds) and memory (megabytes) are given by the request, from the keys of the
+        same name of the PL, and are capped by settings.SANDBOX_MAX_TIMEOUT and
+        SANDBOX_MAX_MEMORY. processes and output (bytes) are set by SANDBOX_MAX_PROCESSES and
+        SANDBOX_MAX_OUTPUT, 0 disabling a limit. processes limits the number of processes of the
+        user running the sandbox, it must thus be large enough for the sandbox itself.
+        
+        capture is the maximum number of bytes read from the standard output and error of the
+        grader (SANDBOX_MAX_CAPTURE), the grader being killed if it writes more."""
+    
+    def __init__(self, timeout=None, memory=None):
+        max_timeout = getattr(settings, 'SANDBOX_MAX_TIMEOUT', 60)
+        max_memory = getattr(settings, 'SANDBOX_MAX_MEMORY', 1024)
+        self.timeout = min(_number(timeout, getattr(settings, 'SANDBOX_DEFAULT_TIMEOUT', 3), float), max_timeout)
+        self.memory = min(_number(memory, getattr(settings, 'SANDBOX_DEFAULT_MEMORY', 256), int), max_memory)
+        self.processes = getattr(settings, 'SANDBOX_MAX_PROCESSES', 0)
+        self.output = getattr(settings, 'SANDBOX_MAX_OUTPUT', 0)
+        self.capture = getattr(settings, 'SANDBOX_MAX_CAPTURE', 1024 * 1024)
+    
+    
+    @classmethod
+    def from_request(cls, request):
+        return cls(request.POST.get('execution_timeout'), request.POST.get('execution_memory'))
+    
+    
+    @property
+    def cpu(self):
+        return max(1, math.ceil(self.timeout))
+    
+    
+    def rlimits(self):
+        """ Return the list of (resource, soft, hard) to give to resource.setrlimit()."""
+        
+        rlimits = [
+            # SIGXCPU is sent at the soft limit, SIGKILL at the hard one
+            (resource.RLIMIT_CPU, self.cpu, self.cpu + 1),
+            (resource.RLIMIT_AS, self.memory * 1024 * 1024, self.memory * 1024 * 1024),
+        ]
+        if self.processes:
+            rlimits.append((resource.RLIMIT_NPROC, self.processes, self.processes))
+        if self.output:
+            rlimits.append((resource.RLIMIT_FSIZE, self.output, self.output))
+        return rlimits
+    
+    
+    def breach(self, returncode, rusage, err):
+        """ Return the grade corresponding to the limit breached by an execution which exited with
+            returncode, having used rusage (see sandbox.process.rusage_dict()) and written err
+            on its standard error, None if no limit was breached."""
+        
+        err = err.rstrip().splitlines()[-1] if err.strip() else b''
+        if returncode == -signal.SIGXCPU or (returncode == -signal.SIGKILL
+                and rusage and rusage['user_time'] + rusage['sys_time'] >= self.cpu):
+            return CPU
+        if returncode == -signal.SIGXFSZ or err.startswith(b'OSError: [Errno 27]'):
+            return OUTPUT
+        if err.startswith(b'MemoryError'):
+            return MEMORY
+        if err.startswith(b'BlockingIOError: [Errno 11]'):
+            return PROCESSES
+        return None
+    
+    
+    def feedback(self, grade, value=None):
+        """ Return the feedback corresponding to the breach of the limit grade, value being the
+            value of this limit (default to the one of this instance)."""
+        
+        if value is not None:
+            return FEEDBACK[grade].replace('{X}', str(value))
+        value = {
+            TIMEOUT: self.timeout,
+            CPU: self.cpu,
+            MEMORY: self.memory,
+            PROCESSES: self.processes,
+            OUTPUT: self.output,
+        }[grade]
+        return FEEDBACK[grade].replace('{X}', str(value))
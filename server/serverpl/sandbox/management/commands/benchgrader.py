@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  benchgrader.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import os, time, shutil, tempfile, subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from sandbox.workers import WorkerPool
+
+
+# Exercise graded by doctests, as the ones using pldoctest
+GRADER = """import sys, json, doctest, inspect
+
+import student
+
+tests = '''
+>>> square(3)
+9
+>>> square(-2)
+4
+>>> [square(i) for i in range(5)]
+[0, 1, 4, 9, 16]
+'''
+
+runner = doctest.DocTestRunner(optionflags=doctest.NORMALIZE_WHITESPACE)
+test = doctest.DocTestParser().get_doctest(tests, vars(student), 'student', 'student.py', 0)
+runner.run(test, out=lambda s: None)
+failed, attempted = runner.summarize(verbose=False)
+print(json.dumps({'success': not failed, 'feedback': str(attempted - failed) + '/' + str(attempted) + ' tests'}))
+"""
+
+STUDENT = """def square(x):
+    return x * x
+"""
+
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+
+class Command(BaseCommand):
+    help = ("Measure the latency of a grader run by a new 'python3 grader.py' (cold) and by a warm "
+            + "worker of sandbox.workers (warm).")
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--env', default=None,
+                            help="Directory containing the grader.py (and the files it needs) to run, "
+                                 + "a doctest exercise is used by default")
+        parser.add_argument('--runs', type=int, default=50, help="Number of runs per mode")
+    
+    
+    def prepare(self, root, env):
+        dirname = os.path.join(root, 'env')
+        if env:
+            if not os.path.isfile(os.path.join(env, 'grader.py')):
+                raise CommandError("'" + env + "' does not contain a grader.py")
+            shutil.copytree(env, dirname)
+        else:
+            os.mkdir(dirname)
+            for name, content in [('grader.py', GRADER), ('student.py', STUDENT)]:
+                with open(os.path.join(dirname, name), 'w') as f:
+                    f.write(content)
+        return dirname
+    
+    
+    def cold(self, dirname):
+        p = subprocess.Popen('python3 grader.py', stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             shell=True, cwd=dirname)
+        out, err = p.communicate()
+        return p.returncode, out, err
+    
+    
+    def handle(self, *args, **options):
+        root = tempfile.mkdtemp()
+        try:
+            dirname = self.prepare(root, options['env'])
+            
+            with override_settings(SANDBOX_WARM_WORKERS=1):
+                pool = WorkerPool()
+                start = time.perf_counter()
+                pool.run(dirname, 10) # Starts the worker
+                self.stdout.write("Worker started in %.1f ms" % ((time.perf_counter() - start) * 1000))
+                
+                outputs = dict()
+                for name, run in [("cold", self.cold), ("warm", lambda d: pool.run(d, 10))]:
+                    latencies = list()
+                    for _ in range(options['runs']):
+                        start = time.perf_counter()
+                        outputs[name] = run(dirname)
+                        latencies.append(time.perf_counter() - start)
+                    self.stdout.write("%-5s p50 %7.1f ms   p99 %7.1f ms" % (
+                        name, percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000
+                    ))
+                pool.stop()
+            
+            if outputs['cold'][:2] != outputs['warm'][:2]:
+                self.stderr.write("Outputs differ:\ncold: " + str(outputs['cold']) + "\nwarm: " + str(outputs['warm']))
+        finally:
+            shutil.rmtree(root)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  process.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import os, sys, json, time, signal, selectors, subprocess
+
+from sandbox.exceptions import OutputLimitExceeded
+
+
+
+def rusage_dict(rusage):
+    """ Return the resources of the resource.struct_rusage rusage used by the metrics."""
+    
+    return {
+        'user_time': rusage.ru_utime,
+        'sys_time': rusage.ru_stime,
+        'max_rss': rusage.ru_maxrss, # Kilobytes
+    }
+
+
+
+# Applies the rlimits given as JSON in argv[1] and executes argv[2:]. Used instead of preexec_fn,
+# which may deadlock the child between fork() and exec() in a multi-threaded process.
+RLIMITS_WRAPPER = (
+    "import os, sys, json, resource\n"
+    "for res, soft, hard in json.loads(sys.argv[1]):\n"
+    "    resource.setrlimit(res, (soft, hard))\n"
+    "os.execvp(sys.argv[2], sys.argv[2:])\n"
+)
+
+
+
+def limited(args, rlimits):
+    """ Return the command executing args with every (resource, soft, hard) of rlimits applied."""
+    
+    if not rlimits:
+        return list(args)
+    return [sys.executable, '-c', RLIMITS_WRAPPER, json.dumps([list(r) for r in rlimits])] + list(args)
+
+
+
+def run(args, cwd, timeout, rlimits=(), max_output=None):
+    """ Run args in cwd, in a new session, and return the tuple (returncode, stdout, stderr, rusage).
+        
+        rlimits, a list of (resource, soft, hard), are applied by a wrapper (see limited()) which
+        then executes args, nothing being run in the child between fork() and exec().
+        
+        The child is reaped with os.wait4(), so that the resources it (and the processes it
+        waited for) used are known without being mixed with the ones of concurrent executions,
+        as resource.getrusage(RUSAGE_CHILDREN) would. rusage is given by rusage_dict().
+        
+        stdout and stderr are read by chunks as they are written. If one of them exceeds
+        max_output bytes (if not None), the whole process group of the child is killed and
+        sandbox.exceptions.OutputLimitExceeded is raised with the outputs truncated to max_output
+        bytes, so that a grader printing in a loop never fills the memory of the sandbox.
+        
+        The whole process group of the child is also killed if it did not terminate in timeout
+        seconds, even if it closed its outputs before, subprocess.TimeoutExpired being then raised
+        with the attributes 'output', 'stderr' and 'rusage' set."""
+    
+    p = subprocess.Popen(limited(args, rlimits), cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE, start_new_session=True)
+    outputs = {p.stdout: [], p.stderr: []}
+    sizes = {p.stdout: 0, p.stderr: 0}
+    deadline = time.time() + timeout
+    timed_out = exceeded = False
+    
+    with selectors.DefaultSelector() as selector:
+        for stream in outputs:
+            selector.register(stream, selectors.EVENT_READ)
+        while selector.get_map() and not exceeded:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fd, 65536)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                if max_output is not None and sizes[key.fileobj] + len(chunk) > max_output:
+                    chunk = chunk[:max_output - sizes[key.fileobj]]
+                    exceeded = True
+                outputs[key.fileobj].append(chunk)
+                sizes[key.fileobj] += len(chunk)
+                if exceeded:
+                    break
+    
+    # The child may close its outputs and keep running, it must still terminate before the deadline
+    pid, delay = 0, 0.001
+    while not (timed_out or exceeded):
+        pid, status, rusage = os.wait4(p.pid, os.WNOHANG)
+        if pid:
+            break
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            timed_out = True
+            break
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.05)
+    
+    if timed_out or exceeded:
+        try:
+            os.killpg(p.pid, signal.SIGKILL) # Also kills the processes started by the child
+        except OSError:
+            pass
+    
+    if not pid:
+        _, status, rusage = os.wait4(p.pid, 0)
+    p.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    p.stdout.close()
+    p.stderr.close()
+    
+    out, err = b''.join(outputs[p.stdout]), b''.join(outputs[p.stderr])
+    if exceeded:
+        raise OutputLimitExceeded(max_output, out, err, rusage_dict(rusage))
+    if timed_out:
+        e = subprocess.TimeoutExpired(args, timeout, output=out, stderr=err)
+        e.rusage = rusage_dict(rusage)
+        raise e
+    return p.returncode, out, err, rusage_dict(rusage)
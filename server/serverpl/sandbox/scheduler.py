@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  scheduler.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import os, math, time, threading
+
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from sandbox.exceptions import Saturated
+
+
+
+class ExecutionQueue:
+    """ Bound the number of executions run concurrently by this process.
+        
+        At most settings.SANDBOX_PARALLELISM_PER_CORE * <number of cores> executions run at the same
+        time, at most SANDBOX_QUEUE_SIZE others waiting for a slot. An execution arriving when the
+        queue is full, or waiting more than SANDBOX_QUEUE_TIMEOUT seconds, is rejected with
+        sandbox.exceptions.Saturated, whose retry_after is estimated from the mean duration of
+        the last executions."""
+    
+    def __init__(self):
+        self.running = 0
+        self.waiting = 0
+        self.executed = 0
+        self.rejected = 0
+        self.mean_duration = 0.0 # Exponential moving average, in seconds
+        self._cond = threading.Condition()
+    
+    
+    @property
+    def slots(self):
+        per_core = getattr(settings, 'SANDBOX_PARALLELISM_PER_CORE', 1)
+        return max(1, int(per_core * (os.cpu_count() or 1)))
+    
+    
+    @property
+    def max_waiting(self):
+        return getattr(settings, 'SANDBOX_QUEUE_SIZE', 32)
+    
+    
+    @property
+    def queue_timeout(self):
+        return getattr(settings, 'SANDBOX_QUEUE_TIMEOUT', 10)
+    
+    
+    def retry_after(self):
+        """ Estimated number of seconds before a slot is available, must hold self._cond."""
+        
+        return max(1, math.ceil(self.mean_duration * (self.waiting + 1) / self.slots))
+    
+    
+    def _reject(self):
+        self.rejected += 1
+        raise Saturated(self.retry_after())
+    
+    
+    @contextmanager
+    def slot(self):
+        """ Wait for an execution slot, raise Saturated if none can be given."""
+        
+        with self._cond:
+            if self.running >= self.slots:
+                if self.waiting >= self.max_waiting:
+                    self._reject()
+                self.waiting += 1
+                try:
+                    deadline = time.time() + self.queue_timeout
+                    while self.running >= self.slots:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            self._reject()
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.running += 1
+        
+        start = time.time()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.running -= 1
+                self.executed += 1
+                duration = time.time() - start
+                self.mean_duration = duration if self.executed == 1 else 0.9 * self.mean_duration + 0.1 * duration
+                self._cond.notify()
+    
+    
+    def stats(self):
+        with self._cond:
+            return {
+                'slots': self.slots,
+                'running': self.running,
+                'waiting': self.waiting,
+                'max_waiting': self.max_waiting,
+                'executed': self.executed,
+                'rejected': self.rejected,
+                'mean_duration': self.mean_duration,
+            }
+
+
+
+EXECUTION_QUEUE = ExecutionQueue()
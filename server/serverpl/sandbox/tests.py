@@ -1,3 +1,307 @@
-from django.test import TestCase
+import os, io, time, signal, resource, tarfile, hashlib, tempfile, shutil, subprocess
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from sandbox.cache import EnvironmentCache
+from sandbox.workers import WorkerPool
+from sandbox.scheduler import ExecutionQueue
+from sandbox.jobs import JobDirectories
+from sandbox import process, limits
+from sandbox.exceptions import Saturated, OutputLimitExceeded
+
+
+def make_tgz(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name=name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    tgz = buffer.getvalue()
+    return hashlib.sha1(tgz).hexdigest(), tgz
+
+
+
+class EnvironmentCacheTestCase(TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.dest = tempfile.mkdtemp()
+    
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.dest)
+    
+    
+    def test_hit_and_miss(self):
+        with override_settings(SANDBOX_ENV_CACHE_ROOT=self.root):
+            cache = EnvironmentCache()
+            sha1, tgz = make_tgz({'grader.py': b"print('grader')"})
+            self.assertFalse(cache.copy_to(sha1, self.dest))
+            
+            cache.add(sha1, tgz)
+            self.assertTrue(cache.copy_to(sha1, self.dest))
+            with open(os.path.join(self.dest, 'grader.py'), 'rb') as f:
+                self.assertEqual(f.read(), b"print('grader')")
+            
+            stats = cache.stats()
+            self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+            
+            # The index is rebuilt from the directory by a new process
+            self.assertTrue(EnvironmentCache().copy_to(sha1, tempfile.mkdtemp(dir=self.dest)))
+            
+            with self.assertRaises(ValueError):
+                cache.add('0' * 40, tgz)
+    
+    
+    def test_eviction(self):
+        with override_settings(SANDBOX_ENV_CACHE_ROOT=self.root, SANDBOX_ENV_CACHE_SIZE=2500):
+            cache = EnvironmentCache()
+            environments = [make_tgz({'grader.py': bytes([i]) * 1000}) for i in range(3)]
+            for sha1, tgz in environments:
+                cache.add(sha1, tgz)
+            
+            self.assertEqual(cache.stats()['evictions'], 1)
+            self.assertFalse(os.path.isdir(os.path.join(self.root, environments[0][0])))
+            self.assertTrue(cache.copy_to(environments[2][0], self.dest))
+
+
+
+@override_settings(SANDBOX_WARM_WORKERS=1)
+class WorkerPoolTestCase(TestCase):
+    
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.pool = WorkerPool()
+    
+    
+    def tearDown(self):
+        self.pool.stop()
+        shutil.rmtree(self.dirname)
+    
+    
+    def write(self, name, content):
+        with open(os.path.join(self.dirname, name), 'w') as f:
+            f.write(content)
+    
+    
+    def test_run(self):
+        self.write('grader.py', "import json, sys\nprint(json.dumps({'grade': 42}))\nsys.exit(2)")
+        returncode, out, err, rusage = self.pool.run(self.dirname, 5)
+        self.assertEqual((returncode, out, err), (2, b'{"grade": 42}\n', b''))
+        self.assertGreater(rusage['max_rss'], 0)
+        self.assertEqual(os.listdir(self.dirname), ['grader.py'])
+        
+        self.write('grader.py', "raise ValueError('error')")
+        returncode, out, err, rusage = self.pool.run(self.dirname, 5)
+        self.assertEqual(returncode, 1)
+        self.assertIn(b'ValueError: error', err)
+    
+    
+    def test_isolation(self):
+        # Modules of the environment shadow the preloaded ones, and modifications are not kept
+        self.write('json.py', "def dumps(o):\n    return 'local'\n")
+        self.write('grader.py', "import json, doctest\ndoctest.marker = 1\nprint(json.dumps(0))")
+        self.assertEqual(self.pool.run(self.dirname, 5)[1], b'local\n')
+        
+        os.remove(os.path.join(self.dirname, 'json.py'))
+        self.write('grader.py', "import json, doctest\nprint(json.dumps(hasattr(doctest, 'marker')))")
+        self.assertEqual(self.pool.run(self.dirname, 5)[1], b'false\n')
+    
+    
+    def test_timeout(self):
+        self.write('grader.py', "while True:\n    pass")
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.pool.run(self.dirname, 0.5)
+        
+        self.write('grader.py', "print('ok')")
+        self.assertEqual(self.pool.run(self.dirname, 5)[:3], (0, b'ok\n', b''))
+    
+    
+    def test_max_output(self):
+        self.write('grader.py', "while True:\n    print('x' * 1000)")
+        with self.assertRaises(OutputLimitExceeded) as cm:
+            self.pool.run(self.dirname, 5, max_output=10000)
+        self.assertEqual(len(cm.exception.output), 10000)
+        self.assertEqual(os.listdir(self.dirname), ['grader.py'])
+
+
+
+@override_settings(SANDBOX_PARALLELISM_PER_CORE=0)
+class ExecutionQueueTestCase(TestCase):
+    
+    def test_saturated(self):
+        queue = ExecutionQueue()
+        self.assertEqual(queue.slots, 1)
+        
+        with override_settings(SANDBOX_QUEUE_SIZE=0):
+            with queue.slot():
+                with self.assertRaises(Saturated) as cm:
+                    with queue.slot():
+                        pass
+                self.assertGreaterEqual(cm.exception.retry_after, 1)
+        
+        with override_settings(SANDBOX_QUEUE_SIZE=1, SANDBOX_QUEUE_TIMEOUT=0.1):
+            with queue.slot():
+                with self.assertRaises(Saturated):
+                    with queue.slot():
+                        pass
+            with queue.slot():
+                pass
+        
+        stats = queue.stats()
+        self.assertEqual((stats['running'], stats['waiting']), (0, 0))
+        self.assertEqual((stats['executed'], stats['rejected']), (3, 2))
+
+
+
+class JobDirectoriesTestCase(TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+    
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    
+    def create(self, jobs, size=0):
+        path = jobs.create()
+        with open(os.path.join(path, 'file'), 'wb') as f:
+            f.write(b'0' * size)
+        return path
+    
+    
+    def test_release(self):
+        with override_settings(SANDBOX_JOBS_ROOT=self.root, SANDBOX_JOBS_SWEEP_INTERVAL=0, SANDBOX_KEEP_JOBS=1):
+            jobs = JobDirectories()
+            first, second = self.create(jobs, 10), self.create(jobs, 10)
+            self.assertEqual(jobs.stats()['active'], 2)
+            
+            jobs.release(first)
+            self.assertTrue(os.path.isdir(first)) # Kept for debugging
+            jobs.release(second)
+            self.assertFalse(os.path.isdir(first))
+            self.assertTrue(os.path.isdir(second))
+            
+            stats = jobs.stats()
+            self.assertEqual((stats['active'], stats['kept'], stats['reclaimed'], stats['reclaimed_bytes']),
+                             (0, 1, 1, 10))
+    
+    
+    def test_sweep(self):
+        with override_settings(SANDBOX_JOBS_ROOT=self.root, SANDBOX_JOBS_SWEEP_INTERVAL=0,
+                               SANDBOX_KEEP_JOBS=10, SANDBOX_JOBS_QUOTA=150, SANDBOX_JOBS_MAX_AGE=60):
+            jobs = JobDirectories()
+            stale = os.path.join(self.root, 'stale')
+            os.mkdir(stale)
+            os.utime(stale, (time.time() - 120, time.time() - 120))
+            
+            kept = [self.create(jobs, 100) for _ in range(2)]
+            active = self.create(jobs, 100)
+            for path in kept:
+                jobs.release(path)
+            
+            # Stale and oldest kept directories are deleted until the quota is respected
+            jobs.sweep()
+            self.assertFalse(os.path.isdir(stale))
+            self.assertEqual([os.path.isdir(path) for path in kept], [False, False])
+            self.assertTrue(os.path.isdir(active))
+            self.assertEqual(jobs.stats()['used'], 100)
+
+
+
+class ProcessTestCase(TestCase):
+    
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+    
+    
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+    
+    
+    def test_run(self):
+        with open(os.path.join(self.dirname, 'grader.py'), 'w') as f:
+            f.write("import sys\nx = bytearray(50 * 1024 * 1024)\nprint('out')\nprint('err', file=sys.stderr)")
+        returncode, out, err, rusage = process.run(['python3', 'grader.py'], self.dirname, 5)
+        self.assertEqual((returncode, out, err), (0, b'out\n', b'err\n'))
+        self.assertGreater(rusage['max_rss'], 50 * 1024)
+        self.assertGreater(rusage['user_time'] + rusage['sys_time'], 0)
+    
+    
+    def test_timeout(self):
+        with open(os.path.join(self.dirname, 'grader.py'), 'w') as f:
+            f.write("print('start', flush=True)\nwhile True:\n    pass")
+        with self.assertRaises(subprocess.TimeoutExpired) as cm:
+            process.run(['python3', 'grader.py'], self.dirname, 0.5)
+        self.assertEqual(cm.exception.output, b'start\n')
+        self.assertGreater(cm.exception.rusage['user_time'], 0)
+    
+    
+    def test_timeout_closed_outputs(self):
+        with open(os.path.join(self.dirname, 'grader.py'), 'w') as f:
+            f.write("import os, time\nos.close(1)\nos.close(2)\ntime.sleep(8)")
+        start = time.time()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            process.run(['python3', 'grader.py'], self.dirname, 1)
+        self.assertLess(time.time() - start, 4)
+    
+    
+    def test_max_output(self):
+        with open(os.path.join(self.dirname, 'grader.py'), 'w') as f:
+            f.write("import sys\nprint('error', file=sys.stderr)\nwhile True:\n    print('x' * 1000)")
+        start = time.time()
+        with self.assertRaises(OutputLimitExceeded) as cm:
+            process.run(['python3', 'grader.py'], self.dirname, 5, max_output=100000)
+        self.assertLess(time.time() - start, 4)
+        self.assertEqual(len(cm.exception.output), 100000)
+        self.assertEqual(cm.exception.stderr, b'error\n')
+
+
+
+@override_settings(SANDBOX_MAX_TIMEOUT=10, SANDBOX_MAX_MEMORY=512, SANDBOX_DEFAULT_MEMORY=128,
+                   SANDBOX_MAX_PROCESSES=0, SANDBOX_MAX_OUTPUT=1000)
+class LimitsTestCase(TestCase):
+    
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+    
+    
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+    
+    
+    def run_grader(self, code, rlimits):
+        with open(os.path.join(self.dirname, 'grader.py'), 'w') as f:
+            f.write(code)
+        return process.run(['python3', 'grader.py'], self.dirname, 5, rlimits)
+    
+    
+    def test_values(self):
+        l = limits.Limits('30', 'invalid')
+        self.assertEqual((l.timeout, l.memory, l.cpu), (10, 128, 10))
+        l = limits.Limits('1.5', '64')
+        self.assertEqual((l.timeout, l.memory, l.cpu), (1.5, 64, 2))
+        self.assertIn((resource.RLIMIT_FSIZE, 1000, 1000), l.rlimits())
+        self.assertIn('64 Mo', l.feedback(limits.MEMORY))
+    
+    
+    def test_breach(self):
+        l = limits.Limits(1, 64)
+        returncode, out, err, rusage = self.run_grader("x = bytearray(256 * 1024 * 1024)", l.rlimits())
+        self.assertEqual(l.breach(returncode, rusage, err), limits.MEMORY)
+        
+        returncode, out, err, rusage = self.run_grader("while True:\n    pass",
+                                                       [(resource.RLIMIT_CPU, 1, 2)])
+        self.assertEqual(returncode, -signal.SIGXCPU)
+        self.assertEqual(l.breach(returncode, rusage, err), limits.CPU)
+        
+        returncode, out, err, rusage = self.run_grader("f = open('f', 'w')\nwhile True:\n    f.write('0' * 100)\n    f.flush()",
+                                                       l.rlimits())
+        self.assertEqual(l.breach(returncode, rusage, err), limits.OUTPUT)
+        
+        self.assertEqual(l.breach(1, None, b"...\nBlockingIOError: [Errno 11] Resource temporarily unavailable"),
+                         limits.PROCESSES)
+        self.assertIsNone(l.breach(1, None, b"Traceback...\nValueError: invalid"))
@@ -6,10 +6,16 @@
 #  Created: 2017-07-30
 #  Last Modified: 2017-09-30
 
+import json
+
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse, Http404
 
 from sandbox.executor import Executor
+from sandbox.exceptions import UnknownEnvironment, Saturated
+from sandbox.cache import ENV_CACHE
+from sandbox.scheduler import EXECUTION_QUEUE
+from sandbox.jobs import JOB_DIRS
 
 
 
@@ -21,7 +27,15 @@ def execute(request):
         mth=request.META["REQUEST_METHOD"]
         return HttpResponse('405 Method ' +mth+ ' Not Allowed', status=405)
     
-    return HttpResponse(Executor(request).execute())
+    try:
+        with EXECUTION_QUEUE.slot():
+            return HttpResponse(Executor(request).execute())
+    except UnknownEnvironment as e: # Client must send the environment again
+        return HttpResponse(str(e), status=412)
+    except Saturated as e: # Client should try another sandbox, or this one later
+        response = HttpResponse(str(e), status=503)
+        response['Retry-After'] = str(e.retry_after)
+        return response
 
 
 @csrf_exempt
@@ -36,6 +50,12 @@ def action(request):
         return HttpResponse('{"languages":["c","python"]}')
     if l == "version":
         return HttpResponse('{"version":"pysandbox-0.1"}')
+    if l == "stats":
+        return HttpResponse(json.dumps({
+            'environment_cache': ENV_CACHE.stats(),
+            'executions': EXECUTION_QUEUE.stats(),
+            'job_directories': JOB_DIRS.stats(),
+        }))
     if l != "execute":
         return Http404("Erreur - Action inconnue: "+ l)
     
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  workers.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+import os, json, time, queue, select, signal, subprocess, threading, logging
+
+from django.conf import settings
+
+from sandbox.exceptions import OutputLimitExceeded
+
+
+logger = logging.getLogger(__name__)
+
+
+ZYGOTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'zygote.py')
+
+# Interval, in seconds, at which the size of the outputs of a running grader is checked
+CAPTURE_POLL = 0.05
+
+DEFAULT_PRELOAD = [
+    'json', 're', 'io', 'inspect', 'traceback', 'linecache', 'difflib', 'argparse',
+    'doctest', 'unittest', 'pdb', 'py_compile', 'jinja2',
+]
+
+
+
+class WorkerError(Exception):
+    """ Raised when a worker died or did not follow the protocol of sandbox/zygote.py."""
+    pass
+
+
+
+class Worker:
+    """ A zygote process (see sandbox/zygote.py) in which the modules of
+        settings.SANDBOX_PRELOAD_MODULES are already imported, forking a child per grader."""
+    
+    def __init__(self):
+        self.process = subprocess.Popen(
+            ['python3', ZYGOTE] + list(getattr(settings, 'SANDBOX_PRELOAD_MODULES', DEFAULT_PRELOAD)),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0,
+        )
+    
+    
+    def alive(self):
+        return self.process.poll() is None
+    
+    
+    def _receive(self, timeout=None):
+        """ Read a message of the zygote, return None if none was received in timeout seconds."""
+        
+        if timeout is not None:
+            ready, _, _ = select.select([self.process.stdout], [], [], max(timeout, 0))
+            if not ready:
+                return None
+        line = self.process.stdout.readline()
+        if not line:
+            raise WorkerError("Worker " + str(self.process.pid) + " died")
+        return json.loads(line.decode('utf-8'))
+    
+    
+    def start(self):
+        """ Wait for the zygote to have imported every module."""
+        
+        self._receive()
+    
+    
+    def _output_size(self, dirname):
+        sizes = [0]
+        for ext in ('.stdout', '.stderr'):
+            try:
+                sizes.append(os.stat(dirname + ext).st_size)
+            except OSError:
+                pass
+        return max(sizes)
+    
+    
+    def run(self, dirname, timeout, rlimits=(), max_output=None):
+        """ Run dirname/grader.py in a fresh child of the zygote, killing it after timeout seconds.
+            rlimits, a list of (resource, soft, hard), are applied in the child.
+            
+            The child writes its outputs in files whose size is checked every CAPTURE_POLL seconds,
+            the child being killed as soon as one of them exceeds max_output bytes (if not None).
+            At most max_output bytes of each of them are read.
+            
+            Return the tuple (returncode, stdout, stderr, rusage), stdout and stderr being bytes,
+            and rusage given by sandbox.process.rusage_dict(). Raise subprocess.TimeoutExpired,
+            with the attributes 'output', 'stderr' and 'rusage' set, if the grader did not
+            terminate in time, and sandbox.exceptions.OutputLimitExceeded if it wrote too much."""
+        
+        try:
+            job = {'dir': dirname, 'rlimits': [list(rlimit) for rlimit in rlimits]}
+            self.process.stdin.write((json.dumps(job) + '\n').encode('utf-8'))
+        except OSError:
+            raise WorkerError("Worker " + str(self.process.pid) + " died")
+        pid = self._receive()['pid']
+        
+        deadline = time.time() + timeout
+        message = None
+        exceeded = False
+        while message is None and not exceeded:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            message = self._receive(min(remaining, CAPTURE_POLL) if max_output is not None else remaining)
+            exceeded = message is None and max_output is not None and self._output_size(dirname) > max_output
+        
+        timed_out = message is None and not exceeded
+        if message is None:
+            try:
+                os.killpg(pid, signal.SIGKILL) # Also kills the processes started by the grader
+            except OSError:
+                pass
+            message = self._receive()
+        
+        exceeded = max_output is not None and self._output_size(dirname) > max_output
+        outputs = list()
+        for ext in ('.stdout', '.stderr'):
+            try:
+                with open(dirname + ext, 'rb') as f:
+                    outputs.append(f.read(max_output) if max_output is not None else f.read())
+                os.remove(dirname + ext)
+            except OSError:
+                outputs.append(b'')
+        
+        if exceeded:
+            raise OutputLimitExceeded(max_output, outputs[0], outputs[1], message['rusage'])
+        if timed_out:
+            e = subprocess.TimeoutExpired('grader.py', timeout, output=outputs[0], stderr=outputs[1])
+            e.rusage = message['rusage']
+            raise e
+        return message['returncode'], outputs[0], outputs[1], message['rusage']
+    
+    
+    def stop(self):
+        try:
+            self.process.kill()
+            self.process.wait()
+        except OSError:
+            pass
+
+
+
+class WorkerPool:
+    """ Pool of settings.SANDBOX_WARM_WORKERS Worker, graders being run by a 'python3 grader.py'
+        subprocess if it is 0.
+        
+        Workers are started at first use. A Worker is used by one job at a time, a dead Worker
+        being replaced by a new one."""
+    
+    def __init__(self):
+        self._idle = None
+        self._lock = threading.Lock()
+    
+    
+    @property
+    def size(self):
+        return getattr(settings, 'SANDBOX_WARM_WORKERS', 0)
+    
+    
+    def enabled(self):
+        return self.size > 0
+    
+    
+    def _spawn(self):
+        worker = Worker()
+        worker.start()
+        logger.info("Sandbox worker " + str(worker.process.pid) + " started")
+        return worker
+    
+    
+    def _get_idle(self):
+        with self._lock:
+            if self._idle is None:
+                self._idle = queue.Queue()
+                for _ in range(self.size):
+                    self._idle.put(None) # Started when first needed
+            return self._idle
+    
+    
+    def run(self, dirname, timeout, rlimits=(), max_output=None):
+        """ Run dirname/grader.py in a Worker, see Worker.run()."""
+        
+        idle = self._get_idle()
+        worker = idle.get()
+        try:
+            if worker is None or not worker.alive():
+                worker = self._spawn()
+            return worker.run(dirname, timeout, rlimits, max_output)
+        except WorkerError:
+            logger.exception("Sandbox worker failed, replacing it")
+            if worker is not None:
+                worker.stop()
+            worker = None
+            raise
+        finally:
+            idle.put(worker)
+    
+    
+    def stop(self):
+        """ Stop every idle Worker."""
+        
+        idle = self._get_idle()
+        for _ in range(idle.qsize()):
+            worker = idle.get()
+            if worker is not None:
+                worker.stop()
+            idle.put(None)
+
+
+
+WORKER_POOL = WorkerPool()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  zygote.py
+#
+#  Copyright 2018 Coumes Quentin
+
+
+""" Warm Python process forking a fresh child for each grader it is asked to run.
+    
+    Usage: python3 zygote.py [module ...]
+    
+    Every given module is imported once when the zygote starts (modules which cannot be imported
+    are ignored), so that the graders importing them do not pay for it anymore. The zygote
+    then reads one job per line on its standard input, a JSON object whose 'dir' is the absolute
+    path of the directory containing grader.py and 'rlimits' a list of [resource, soft, hard],
+    and for each of them:
+        - forks a child which runs grader.py in that directory in a new session, with the given
+          resource limits, as
+          'python3 grader.py' would, its standard output and error being written in
+          <directory>.stdout and <directory>.stderr,
+        - writes {"pid": <pid of the child>} on its standard output as soon as the child started,
+        - writes {"returncode": <code>, "rusage": <resources>} once the child terminated, <code>
+          being negative if the child was killed by a signal, like subprocess.Popen.returncode,
+          and <resources> the CPU time and peak memory used by the child (given by os.wait4()).
+    
+    Since each grader runs in its own child, nothing done by a grader (modules imported or
+    modified, global state...) is seen by the following ones.
+    
+    This file must not import anything from the project, it is run by the interpreter used for
+    the graders."""
+
+
+import os, sys, json, signal, resource, importlib
+
+
+def load_modules(names):
+    """ Import every module of names, ignoring the ones that cannot be imported."""
+    
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+
+
+def run_grader(dirname):
+    """ Run dirname/grader.py as __main__ in the current (child) process and return its exit code."""
+    
+    import runpy, atexit, traceback
+    
+    # Modules of the environment must shadow the preloaded ones, as they would for a new interpreter
+    for entry in os.listdir(dirname):
+        name, ext = os.path.splitext(entry)
+        if ext in ('.py', '') and name in sys.modules:
+            del sys.modules[name]
+    if 'random' in sys.modules: # Would be seeded identically in every child
+        sys.modules['random'].seed()
+    
+    os.chdir(dirname)
+    sys.path[0] = dirname
+    sys.argv = ['grader.py']
+    
+    try:
+        runpy.run_path('grader.py', run_name='__main__')
+        code = 0
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        etype, value, tb = sys.exc_info()
+        while tb is not None and tb.tb_frame.f_code.co_filename != 'grader.py': # Hide the zygote
+            tb = tb.tb_next
+        traceback.print_exception(etype, value, tb)
+        code = 1
+    
+    try:
+        atexit._run_exitfuncs()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except Exception:
+        pass
+    return code & 0xFF
+
+
+
+def fork_grader(dirname, rlimits, protocol_in, protocol_out):
+    """ Fork a child running the grader of dirname with the resource limits rlimits, return the
+        pid of the child."""
+    
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid:
+        return pid
+    
+    code = 1
+    try:
+        os.setsid()
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+        os.close(protocol_in)
+        os.close(protocol_out)
+        for res, soft, hard in rlimits:
+            resource.setrlimit(res, (soft, hard))
+        
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        out = os.open(dirname + '.stdout', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        err = os.open(dirname + '.stderr', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        for fd, target in ((devnull, 0), (out, 1), (err, 2)):
+            os.dup2(fd, target)
+            os.close(fd)
+        
+        code = run_grader(dirname)
+    finally:
+        os._exit(code)
+
+
+
+def returncode(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+
+def main():
+    load_modules(sys.argv[1:])
+    
+    # The protocol uses its own descriptors, the standard ones being redirected in every child
+    protocol_in = os.dup(0)
+    protocol_out = os.dup(1)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+    signal.signal(signal.SIGPIPE, signal.SIG_IGN)
+    
+    def send(message):
+        os.write(protocol_out, (json.dumps(message) + '\n').encode('utf-8'))
+    
+    with os.fdopen(protocol_in, 'r', encoding='utf-8', closefd=False) as jobs:
+        send({'ready': os.getpid()})
+        for line in jobs:
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            pid = fork_grader(job['dir'], job.get('rlimits', []), protocol_in, protocol_out)
+            send({'pid': pid})
+            _, status, rusage = os.wait4(pid, 0)
+            send({
+                'returncode': returncode(status),
+                'rusage': {
+                    'user_time': rusage.ru_utime,
+                    'sys_time': rusage.ru_stime,
+                    'max_rss': rusage.ru_maxrss,
+                },
+            })
+
+
+
+if __name__ == '__main__':
+    main()
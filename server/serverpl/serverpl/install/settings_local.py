@@ -219,6 +219,10 @@ LOGGING = {
             'handlers': ['console', 'syslog', 'mail_admins'],
             'level': 'INFO',
         },
+        'loader':{
+            'handlers': ['console', 'syslog', 'mail_admins'],
+            'level': 'INFO',
+        },
         'playexo':{
             'handlers': ['console', 'syslog', 'mail_admins'],
             'level': 'INFO',
@@ -257,3 +261,88 @@ FILEBROWSER_ROOT = os.path.abspath(os.path.join(BASE_DIR, '../../repo/'))
 # Path to directory containing parsers
 PARSERS_ROOT = os.path.abspath(os.path.join(BASE_DIR,'loader/parsers/'))
 PARSERS_MODULE = 'loader.parsers'
+
+# Directory where the parsed PL / PLTP are cached, set to None to disable the cache
+PARSE_CACHE_ROOT = os.path.join(MEDIA_ROOT, 'parse_cache')
+
+# Strings of the PL of at least PL_BLOB_MIN_SIZE characters are stored once in the Blob table,
+# BLOB_CACHE_SIZE being the number of characters of these blobs kept in memory by each process
+PL_BLOB_MIN_SIZE = 512
+BLOB_CACHE_SIZE = 32 * 1024 * 1024
+
+# Number of threads grading the answers of each process (0 to grade them synchronously), number
+# of seconds a client may wait for a grading job to be done in one request, and number of seconds
+# after which a job still pending or running is considered lost and submitted again
+GRADING_WORKERS = 4
+GRADING_LONG_POLL = 10
+GRADING_PENDING_TIMEOUT = 30
+GRADING_JOB_TIMEOUT = 300
+
+# Number of compiled templates of the exercises (statements, forms and pages) kept in memory by
+# each process, identified by the sha1 of their source
+EXERCISE_TEMPLATE_CACHE_SIZE = 512
+
+# Sandboxes are checked every SANDBOX_CHECK_INTERVAL seconds (0 to disable the background checker)
+# with a HEAD request timing out after SANDBOX_CHECK_TIMEOUT seconds. A failing sandbox is not
+# tried again before SANDBOX_BACKOFF_BASE * 2^(failures-1) seconds (at most SANDBOX_BACKOFF_MAX).
+# The Sandbox table is read again every SANDBOX_REFRESH_INTERVAL seconds.
+SANDBOX_CHECK_INTERVAL = 10
+SANDBOX_CHECK_TIMEOUT = 0.5
+SANDBOX_BACKOFF_BASE = 1
+SANDBOX_BACKOFF_MAX = 300
+SANDBOX_REFRESH_INTERVAL = 60
+
+# Maximum number of connections kept alive to each sandbox by each process. Servers wait for the
+# response of a sandbox during the timeout of the execution, SANDBOX_QUEUE_TIMEOUT, and
+# SANDBOX_HTTP_MARGIN more seconds.
+SANDBOX_HTTP_POOL_SIZE = 10
+SANDBOX_HTTP_MARGIN = 5
+
+# gzip compression level (1-9) of the environment sent to the sandboxes
+SANDBOX_TAR_COMPRESSLEVEL = 1
+
+# Directory where the sandbox keeps the environments it received, identified by their sha1, and
+# maximum size in bytes of these environments (least recently used ones are deleted first)
+SANDBOX_ENV_CACHE_ROOT = os.path.join(MEDIA_ROOT, 'env_cache')
+SANDBOX_ENV_CACHE_SIZE = 256 * 1024 * 1024
+
+# Number of warm Python processes of the sandbox running the graders (0 to start a new
+# 'python3 grader.py' for each of them), and modules they import once at startup
+SANDBOX_WARM_WORKERS = 4
+SANDBOX_PRELOAD_MODULES = [
+    'json', 're', 'io', 'inspect', 'traceback', 'linecache', 'difflib', 'argparse',
+    'doctest', 'unittest', 'pdb', 'py_compile', 'jinja2',
+]
+
+# Executions run concurrently by each sandbox process (per core), executions waiting for a slot
+# and seconds they may wait; further requests are answered 503 with a Retry-After header.
+# Servers try another sandbox, then wait at most SANDBOX_BUSY_MAX_WAIT seconds, when all are saturated.
+SANDBOX_PARALLELISM_PER_CORE = 1
+SANDBOX_QUEUE_SIZE = 32
+SANDBOX_QUEUE_TIMEOUT = 10
+SANDBOX_BUSY_MAX_WAIT = 5
+
+# Directory where the sandbox executes the graders. Job directories are deleted once the execution
+# is over, except the last SANDBOX_KEEP_JOBS ones (for debugging). Every SANDBOX_JOBS_SWEEP_INTERVAL
+# seconds, directories older than SANDBOX_JOBS_MAX_AGE seconds are deleted, as are the kept ones
+# while the directory uses more than SANDBOX_JOBS_QUOTA bytes.
+SANDBOX_JOBS_ROOT = os.path.join(MEDIA_ROOT, 'jobs')
+SANDBOX_KEEP_JOBS = 0
+SANDBOX_JOBS_SWEEP_INTERVAL = 60
+SANDBOX_JOBS_MAX_AGE = 3600
+SANDBOX_JOBS_QUOTA = 1024 * 1024 * 1024
+
+# Limits of each execution in the sandbox. 'timeout' (seconds) and 'memory' (megabytes) can be set
+# by the PL, within SANDBOX_MAX_TIMEOUT and SANDBOX_MAX_MEMORY. SANDBOX_MAX_PROCESSES limits the
+# processes of the user running the sandbox (sandbox included), SANDBOX_MAX_OUTPUT the size of the
+# files written, in bytes. 0 disables these last two limits.
+SANDBOX_DEFAULT_TIMEOUT = 3
+SANDBOX_MAX_TIMEOUT = 60
+SANDBOX_DEFAULT_MEMORY = 256
+SANDBOX_MAX_MEMORY = 1024
+SANDBOX_MAX_PROCESSES = 0
+SANDBOX_MAX_OUTPUT = 16 * 1024 * 1024
+
+# Maximum number of bytes read from the standard output and error of a grader, the grader being
+# killed and its outputs truncated if it writes more
+SANDBOX_MAX_CAPTURE = 1024 * 1024